@@ -0,0 +1,210 @@
+# async_runner.py
+
+"""
+Pipelined execution for main.py --async.
+
+    reader  ──q──▶  compute  ──q──▶  writer(s)
+
+Reads, compute and writes overlap: while one chunk is being embedded and
+scored, the next scroll page is already in flight and the previous
+results are being bulk-indexed. The queues are bounded (async.queue_size
+chunks), so a slow stage back-pressures the ones before it and at most
+~2 * queue_size + 3 chunks are in memory at any time. Wall time tends to
+the time of the slowest stage instead of the sum of all of them.
+
+- reader:  AsyncElasticsearch scroll (ES input), or the synchronous
+           IOManager.iter_read() driven from a worker thread (file / log)
+- compute: clean -> embed -> features -> predict, one chunk at a time in a
+           single worker thread; the UEBA state, sketches and ADWIN are
+           order-dependent, so chunks are not processed concurrently
+- writer:  elasticsearch.helpers.async_bulk (ES output), or an appending
+           CSV writer (file output)
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+_DONE = object()
+
+
+class AsyncPipeline:
+
+    def __init__(self, io, process_chunk, metrics, queue_size=4, writers=2,
+                 bulk_chunk_size=500):
+        self.io = io
+        self.process_chunk = process_chunk
+        self.metrics = metrics
+        self.queue_size = queue_size
+        self.writers = writers
+        self.bulk_chunk_size = bulk_chunk_size
+
+        self.es = None
+        self.rows_in = 0
+        self.rows_out = 0
+        self._csv_columns = None
+
+    @classmethod
+    def from_config(cls, io, process_chunk, metrics):
+        cfg = io.config.get("async") or {}
+        return cls(
+            io, process_chunk, metrics,
+            queue_size=cfg.get("queue_size", 4),
+            writers=cfg.get("writers", 2),
+            bulk_chunk_size=cfg.get("bulk_chunk_size", 500),
+        )
+
+    # -----------------------------------------------------
+    # Reader
+    # -----------------------------------------------------
+    async def _read_es(self, out_q):
+        es_cfg = self.io.config["elasticsearch"]
+        index = es_cfg["input_index"]
+        scroll = es_cfg["scroll_timeout"]
+
+        # Shard host discovery uses the sync client: keep it off the loop
+        query = await asyncio.get_running_loop().run_in_executor(None, self.io.es_input_query)
+        print(f"[ASYNC] Reading from ES index: {index}")
+
+        t0 = time.perf_counter()
+        resp = await self.es.search(index=index, scroll=scroll, size=es_cfg["size"],
+                                    query=query)
+        scroll_id = resp["_scroll_id"]
+
+        try:
+            while True:
+                hits = resp["hits"]["hits"]
+                if not hits:
+                    break
+
+                page = []
+                for h in hits:
+                    src = h["_source"]
+                    src["_id"] = h["_id"]
+                    if not self.io._skip_if_processed(src):
+                        page.append(src)
+
+                self.metrics.record("read", time.perf_counter() - t0, len(hits))
+                if page:
+                    await out_q.put(page)
+
+                t0 = time.perf_counter()
+                resp = await self.es.scroll(scroll_id=scroll_id, scroll=scroll)
+                scroll_id = resp.get("_scroll_id", scroll_id)
+        finally:
+            await self.es.options(ignore_status=404).clear_scroll(scroll_id=scroll_id)
+
+    async def _read_sync(self, out_q, loop, executor, chunk_size):
+        # IOManager.iter_read() records its own "read" metric
+        chunks = self.io.iter_read(chunk_size)
+        while True:
+            chunk = await loop.run_in_executor(executor, next, chunks, _DONE)
+            if chunk is _DONE:
+                break
+            if chunk:
+                await out_q.put(chunk)
+
+    async def _reader(self, out_q, loop, io_executor, chunk_size):
+        try:
+            if self.io.config["input"]["type"] == "es":
+                await self._read_es(out_q)
+            else:
+                await self._read_sync(out_q, loop, io_executor, chunk_size)
+        finally:
+            await out_q.put(_DONE)
+
+    # -----------------------------------------------------
+    # Compute
+    # -----------------------------------------------------
+    async def _compute(self, in_q, out_q, loop, executor):
+        try:
+            while True:
+                chunk = await in_q.get()
+                if chunk is _DONE:
+                    break
+                self.rows_in += len(chunk)
+                records = await loop.run_in_executor(executor, self.process_chunk, chunk)
+                await out_q.put(records)
+        finally:
+            for _ in range(self.writers):
+                await out_q.put(_DONE)
+
+    # -----------------------------------------------------
+    # Writers
+    # -----------------------------------------------------
+    async def _write_es(self, records, loop, io_executor):
+        from elasticsearch.helpers import async_bulk
+
+        # es_actions() may create the output index (sync client): keep it off the loop
+        actions = await loop.run_in_executor(io_executor, self.io.es_actions, records)
+
+        t0 = time.perf_counter()
+        await async_bulk(self.es, actions, chunk_size=self.bulk_chunk_size)
+        self.metrics.record("write_es", time.perf_counter() - t0, len(actions))
+
+    def _write_csv(self, records):
+        path = self.io.config["output"]["file"]
+        with self.metrics.stage("write_csv", rows=len(records)):
+            df = pd.DataFrame(records)
+            first = self._csv_columns is None
+            if first:
+                self._csv_columns = list(df.columns)
+            df.reindex(columns=self._csv_columns).to_csv(
+                path, mode="w" if first else "a", header=first, index=False
+            )
+
+    async def _writer(self, in_q, loop, io_executor, csv_lock):
+        to_es = self.io.config["output"]["type"] == "es"
+        while True:
+            records = await in_q.get()
+            if records is _DONE:
+                break
+            if to_es:
+                await self._write_es(records, loop, io_executor)
+            else:
+                async with csv_lock:
+                    await loop.run_in_executor(io_executor, self._write_csv, records)
+            self.rows_out += len(records)
+
+    # -----------------------------------------------------
+    # Run
+    # -----------------------------------------------------
+    async def _run(self, chunk_size):
+        loop = asyncio.get_running_loop()
+
+        needs_es = "es" in (self.io.config["input"]["type"], self.io.config["output"]["type"])
+        if needs_es:
+            from elasticsearch import AsyncElasticsearch
+            self.es = AsyncElasticsearch(self.io.config["elasticsearch"]["host"])
+
+        read_q = asyncio.Queue(maxsize=self.queue_size)
+        write_q = asyncio.Queue(maxsize=self.queue_size)
+        csv_lock = asyncio.Lock()
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="compute") as compute_ex, \
+                ThreadPoolExecutor(max_workers=self.writers + 1, thread_name_prefix="io") as io_ex:
+            tasks = [
+                asyncio.create_task(self._reader(read_q, loop, io_ex, chunk_size)),
+                asyncio.create_task(self._compute(read_q, write_q, loop, compute_ex)),
+            ] + [
+                asyncio.create_task(self._writer(write_q, loop, io_ex, csv_lock))
+                for _ in range(self.writers)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                for t in tasks:
+                    t.cancel()
+                raise
+            finally:
+                if self.es is not None:
+                    await self.es.close()
+
+    def run(self, chunk_size=5000):
+        print(f"[ASYNC] Pipelined run: queue_size={self.queue_size}, writers={self.writers}")
+        t0 = time.perf_counter()
+        asyncio.run(self._run(chunk_size))
+        print(f"[ASYNC] {self.rows_in} logs in, {self.rows_out} written "
+              f"in {time.perf_counter() - t0:.2f}s")
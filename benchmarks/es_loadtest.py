@@ -0,0 +1,235 @@
+# benchmarks/es_loadtest.py
+
+"""
+Load test for the Elasticsearch read, ingest and write paths.
+
+Drives the real client code (ingest.send_to_es, IOManager.read_from_es /
+write_to_es) at several concurrency levels and reports docs/s and tail
+latency per path. By default it runs against the in-process ES stand-in,
+so latency and 429 rejections can be dialled in; pass --es-url to point it
+at a real cluster instead.
+
+    python -m benchmarks.es_loadtest --docs 5000 --concurrency 1,4,16 --latency-ms 2
+"""
+
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synth_authlog import AuthLogGenerator
+from utils.es_standin import ESStandIn
+from utils.io_manager import IOManager
+from utils.metrics import peak_rss_mb
+from utils.syslog_parser import SyslogParser
+
+import ingest
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    s = sorted(samples_ms)
+
+    def pct(p):
+        return round(s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))], 3)
+
+    return {"p50": pct(50), "p90": pct(90), "p95": pct(95), "p99": pct(99), "max": round(s[-1], 3)}
+
+
+class PathResult:
+    """Thread-safe latency / error collector for one (path, concurrency) run."""
+
+    def __init__(self, path, concurrency):
+        self.path = path
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.docs = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def add(self, ms, docs, ok=True):
+        with self.lock:
+            self.latencies.append(ms)
+            if ok:
+                self.docs += docs
+            else:
+                self.errors += 1
+
+    def to_dict(self):
+        return {
+            "path": self.path,
+            "concurrency": self.concurrency,
+            "requests": len(self.latencies),
+            "docs": self.docs,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 4),
+            "docs_per_sec": round(self.docs / self.seconds, 1) if self.seconds else None,
+            "latency_ms": percentiles(self.latencies),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    try:
+        fn()
+        ok = True
+    except Exception:
+        ok = False
+    return (time.perf_counter() - t0) * 1000.0, ok
+
+
+def _quiet():
+    # The client code prints a line per call; keep the report readable.
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def run_ingest(cfg, lines, concurrency, pipeline):
+    res = PathResult("ingest", concurrency)
+
+    def send(line):
+        t0 = time.perf_counter()
+        ok = ingest.send_to_es(line, cfg, pipeline)
+        res.add((time.perf_counter() - t0) * 1000.0, 1, ok)
+
+    t0 = time.perf_counter()
+    with _quiet(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, lines))
+    res.seconds = time.perf_counter() - t0
+    return res
+
+
+def run_read(config_path, cfg, concurrency):
+    """`concurrency` independent full scrolls of the input index."""
+    res = PathResult("read", concurrency)
+
+    def scroll_all(_):
+        io_mgr = IOManager(config_path)
+        io_mgr.config = copy.deepcopy(cfg)
+        pages = io_mgr.iter_from_es()
+        while True:
+            t0 = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                break
+            except Exception:
+                res.add((time.perf_counter() - t0) * 1000.0, 0, ok=False)
+                break
+            res.add((time.perf_counter() - t0) * 1000.0, len(page))
+
+    t0 = time.perf_counter()
+    with _quiet(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(scroll_all, range(concurrency)))
+    res.seconds = time.perf_counter() - t0
+    return res
+
+
+def run_write(config_path, cfg, records, concurrency, batch_size):
+    res = PathResult("write", concurrency)
+    io_mgr = IOManager(config_path)
+    io_mgr.config = copy.deepcopy(cfg)
+
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+    def write(batch):
+        ms, ok = _timed(lambda: io_mgr.write_to_es(batch))
+        res.add(ms, len(batch), ok)
+
+    t0 = time.perf_counter()
+    with _quiet(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(write, batches))
+    res.seconds = time.perf_counter() - t0
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ES read / ingest / write load test")
+    parser.add_argument("--config", dest="config_path", default="config.yml")
+    parser.add_argument("--es-url", default=None, help="use a real cluster instead of the stand-in")
+    parser.add_argument("--docs", type=int, default=5000)
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--batch-size", type=int, default=500, help="docs per write bulk request")
+    parser.add_argument("--pipeline", default="syslog_pipeline")
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    parser.add_argument("--jitter-ms", type=float, default=1.0)
+    parser.add_argument("--reject-rate", type=float, default=0.0)
+    parser.add_argument("--item-reject-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="bench_results_es.json")
+    args = parser.parse_args()
+
+    with open(args.config_path) as f:
+        import yaml
+        base_cfg = yaml.safe_load(f)
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    events = list(AuthLogGenerator(seed=args.seed).events(args.docs))
+    lines = [line for line, _ in events]
+
+    standin = None
+    if args.es_url:
+        url = args.es_url
+    else:
+        standin = ESStandIn(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                            reject_rate=args.reject_rate,
+                            item_reject_rate=args.item_reject_rate, seed=args.seed)
+        # Run the grok/kv/date work in the stand-in, as an ingest node would
+        standin.register_processor(args.pipeline, SyslogParser(pipeline_compat=True).pipeline_processor)
+        url = standin.start()
+
+    try:
+        from utils.add_pipeline import add_pipeline
+        with _quiet():
+            add_pipeline(os.path.join("es_patterns", f"{args.pipeline}.json"), args.pipeline, url)
+
+        results = []
+        for c in levels:
+            cfg = copy.deepcopy(base_cfg)
+            cfg["elasticsearch"]["host"] = url
+            cfg["elasticsearch"]["input_index"] = f"loadtest_raw_c{c}"
+            cfg["elasticsearch"]["output_index"] = f"loadtest_out_c{c}"
+
+            for res in (
+                run_ingest(cfg, lines, c, args.pipeline),
+                run_read(args.config_path, cfg, c),
+                run_write(args.config_path, cfg, [dict(r) for _, r in events], c, args.batch_size),
+            ):
+                d = res.to_dict()
+                results.append(d)
+                lat = d["latency_ms"]
+                print(f"[LOAD] {d['path']:<7} c={c:<3} {d['docs']:>7} docs  "
+                      f"{d['docs_per_sec'] or 0:>10} docs/s  p50 {lat.get('p50')} ms  "
+                      f"p99 {lat.get('p99')} ms  errors {d['errors']}")
+    finally:
+        if standin is not None:
+            standin.stop()
+
+    report = {
+        "meta": {
+            "target": "standin" if standin else url,
+            "docs": args.docs,
+            "batch_size": args.batch_size,
+            "latency_ms": args.latency_ms if standin else None,
+            "jitter_ms": args.jitter_ms if standin else None,
+            "reject_rate": args.reject_rate if standin else None,
+            "item_reject_rate": args.item_reject_rate if standin else None,
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[LOAD] Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
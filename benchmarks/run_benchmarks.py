@@ -0,0 +1,253 @@
+# benchmarks/run_benchmarks.py
+
+"""
+Reproducible per-stage benchmarks for the NLP / feature / ML hot paths.
+
+Generates a seeded synthetic auth.log workload, times each stage on its
+own and writes rows/s and memory per stage to a JSON file, so two runs
+(e.g. before/after a change) can be diffed directly.
+
+Memory per stage is the RSS growth across the stage (rss_delta_mb) and,
+with --trace-alloc, the Python allocation peak of one extra untimed run
+(alloc_peak_mb). The process-wide RSS high-water mark is reported once,
+in meta, since it cannot be attributed to a stage.
+
+    python -m benchmarks.run_benchmarks --rows 20000 --out bench_results.json
+    python -m benchmarks.run_benchmarks --rows 5000 --skip-embed --skip-ner
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from benchmarks.synth_authlog import AuthLogGenerator
+from utils.metrics import current_rss_mb, peak_rss_mb
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageTimer:
+    """Runs a stage `repeat` times and keeps the best wall time."""
+
+    def __init__(self, repeat=1, trace_alloc=False):
+        self.repeat = repeat
+        self.trace_alloc = trace_alloc
+        self.results = {}
+
+    def run(self, name, rows, fn):
+        best, out = None, None
+        rss_delta = None
+        for _ in range(self.repeat):
+            gc.collect()
+            rss0 = current_rss_mb()
+            t0 = time.perf_counter()
+            out = fn()
+            dt = time.perf_counter() - t0
+            rss1 = current_rss_mb()
+            best = dt if best is None else min(best, dt)
+            if rss0 is not None and rss1 is not None and rss_delta is None:
+                rss_delta = round(rss1 - rss0, 1)
+
+        self.results[name] = {
+            "rows": rows,
+            "seconds": round(best, 6),
+            "rows_per_sec": round(rows / best, 1) if best > 0 else None,
+            # First run only: later repeats reuse memory the first one grew
+            "rss_delta_mb": rss_delta,
+        }
+
+        if self.trace_alloc:
+            # Separate run: tracemalloc slows allocation-heavy code down
+            gc.collect()
+            tracemalloc.start()
+            try:
+                fn()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.results[name]["alloc_peak_mb"] = round(peak / 1024 / 1024, 1)
+
+        print(f"[BENCH] {name:<18} {rows:>8} rows  {best:8.3f}s  "
+              f"{self.results[name]['rows_per_sec']} rows/s")
+        return out
+
+    def skip(self, name, reason):
+        self.results[name] = {"skipped": reason}
+        print(f"[BENCH] {name:<18} skipped ({reason})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage pipeline benchmarks")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--anomaly-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--config", dest="config_path", default="config.yml")
+    parser.add_argument("--embed-rows", type=int, default=2000,
+                        help="rows to encode (the embedder dominates runtime)")
+    parser.add_argument("--skip-embed", action="store_true")
+    parser.add_argument("--skip-ner", action="store_true")
+    parser.add_argument("--workers", default="0",
+                        help="comma-separated StageRunner pool sizes to time (0 = in-process)")
+    parser.add_argument("--trace-alloc", action="store_true",
+                        help="also measure each stage's Python allocation peak (extra untimed run)")
+    parser.add_argument("--out", default="bench_results.json")
+    args = parser.parse_args()
+
+    import yaml
+    with open(args.config_path) as f:
+        cfg = yaml.safe_load(f)
+
+    timer = StageTimer(args.repeat, trace_alloc=args.trace_alloc)
+    n = args.rows
+
+    # -----------------------------------------------------
+    # Workload
+    # -----------------------------------------------------
+    records = timer.run("generate", n, lambda: AuthLogGenerator(
+        seed=args.seed, anomaly_rate=args.anomaly_rate).records(n))
+
+    # -----------------------------------------------------
+    # clean_message
+    # -----------------------------------------------------
+    from nlp.normalize import clean_message
+
+    cleaned = timer.run("clean_message", n, lambda: [clean_message(r["message"]) for r in records])
+
+    base = [
+        {
+            "@timestamp": r["@timestamp"],
+            "hostname": r["hostname"],
+            "process": r["process"],
+            "raw_message": r["message"],
+            "clean_message": c,
+            "label": r["label"],
+        }
+        for r, c in zip(records, cleaned)
+    ]
+
+    # -----------------------------------------------------
+    # LogEntityExtractor.extract (regex path only)
+    # -----------------------------------------------------
+    if args.skip_ner:
+        timer.skip("entity_extract", "--skip-ner")
+    else:
+        try:
+            from nlp.entities import LogEntityExtractor
+        except ImportError as e:
+            timer.skip("entity_extract", f"import failed: {e}")
+        else:
+            extractor = LogEntityExtractor(ml_model=None)
+            timer.run("entity_extract", n, lambda: [extractor.extract(r) for r in base])
+
+    # -----------------------------------------------------
+    # StageRunner: clean + stateless features (+ entity features)
+    # -----------------------------------------------------
+    from utils.process_pool import StageRunner
+
+    for w in (int(x) for x in args.workers.split(",")):
+        processing = cfg.get("processing") or {}
+        runner = StageRunner(workers=w, chunk_size=processing.get("chunk_size", 2000),
+                             entity_features=processing.get("entity_features", False))
+        runner.run(records[:max(1, w) * 10])   # start the workers outside the timing
+        timer.run(f"prepare_w{w}", n, lambda: runner.run(records).to_rows())
+        runner.close()
+
+    # -----------------------------------------------------
+    # build_features (incl. windowed UEBA state + sketches)
+    # -----------------------------------------------------
+    from feature.feature_builder import build_features
+    from feature.sketches import SprayingSketches
+    from feature.ueba_state import UEBAStateStore
+
+    def features():
+        ueba_cfg = dict(cfg.get("ueba") or {}, state_path=None)
+        sketch_cfg = dict(cfg.get("sketches") or {}, state_path=None)
+        state = UEBAStateStore.from_config(ueba_cfg)
+        sketches = SprayingSketches.from_config(sketch_cfg)
+        out = []
+        for r in base:
+            rec = dict(r)
+            rec.update(build_features(rec, ueba_state=state, sketches=sketches))
+            out.append(rec)
+        return out
+
+    featured = timer.run("build_features", n, features)
+
+    # -----------------------------------------------------
+    # Embedder.encode: one row per call, as main.process_records runs it,
+    # and the whole batch in one call for comparison
+    # -----------------------------------------------------
+    if args.skip_embed:
+        timer.skip("embed", "--skip-embed")
+        timer.skip("embed_batched", "--skip-embed")
+    else:
+        try:
+            from nlp.embedder import Embedder
+            embedder = Embedder(cfg["nlp"]["embedding_model"])
+        except Exception as e:
+            timer.skip("embed", f"model unavailable: {e}")
+            timer.skip("embed_batched", f"model unavailable: {e}")
+        else:
+            texts = cleaned[:args.embed_rows]
+            timer.run("embed", len(texts), lambda: [embedder.encode([t])[0] for t in texts])
+            timer.run("embed_batched", len(texts), lambda: embedder.encode(texts))
+
+    df = pd.DataFrame(featured)
+
+    # -----------------------------------------------------
+    # MLPipeline.train / predict
+    # -----------------------------------------------------
+    from ml.ml_pipeline import MLPipeline
+
+    ml = MLPipeline(cfg.get("ml"))
+    train_metrics = timer.run("ml_train", n, lambda: ml.train(df.copy(), auto_label=False))
+    timer.run("ml_predict", n, lambda: ml.predict(df))
+
+    # -----------------------------------------------------
+    # CSV I/O
+    # -----------------------------------------------------
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.csv")
+        timer.run("csv_write", n, lambda: df.to_csv(path, index=False))
+        timer.run("csv_read", n, lambda: pd.read_csv(path))
+
+    report = {
+        "meta": {
+            "rows": n,
+            "anomaly_rate": args.anomaly_rate,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "peak_rss_mb": peak_rss_mb(),
+            "train_metrics": train_metrics,
+        },
+        "stages": timer.results,
+    }
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"[BENCH] Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
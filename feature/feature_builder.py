@@ -1,26 +1,59 @@
 # feature/feature_builder.py
 
-from feature.time_features import extract_time_features
-from feature.statistical_features import extract_statistical_features
-from feature.ueba_features import build_ueba_features
+from feature.registry import FeaturePlan
 
 
-def build_features(record):
+def build_stateless_features(record, extractor=None, plan=None):
     """
-    Build complete feature set.
-    Each extractor is fault-tolerant.
-    Missing fields = handled gracefully.
+    Features that depend on this record only (safe to compute in any
+    order, e.g. in worker processes): time, statistical, per-line UEBA
+    and, when `extractor` (a LogEntityExtractor) is given, entity counts.
+
+    `plan` (a FeaturePlan, see feature/registry.py) restricts the groups
+    computed; None computes all of them.
     """
 
+    plan = plan or FeaturePlan.full()
+    resources = {"extractor": extractor}
+
     features = {}
+    for spec in plan.specs(stateful=False):
+        features.update(spec.extractor(record, features, resources))
+
+    return features
+
+
+def build_stateful_features(record, features, ueba_state=None, sketches=None, plan=None):
+    """
+    Features that read and update cross-record state; records must be
+    passed in time order. `features` are the record's stateless features.
+
+    `ueba_state` (a UEBAStateStore) enables the windowed UEBA features
+    and `sketches` (a SprayingSketches) the distinct-count spraying
+    features. Groups left out of `plan` do not touch their state.
+    """
+
+    plan = plan or FeaturePlan.full()
+    resources = {"ueba_state": ueba_state, "sketches": sketches}
+
+    out = {}
+    for spec in plan.specs(stateful=True):
+        out.update(spec.extractor(record, features, resources))
+
+    return out
 
-    # Time-based features
-    features.update(extract_time_features(record))
 
-    # Statistical features
-    features.update(extract_statistical_features(record))
+def build_features(record, ueba_state=None, sketches=None, extractor=None, plan=None):
+    """
+    Build complete feature set.
+    Each extractor is fault-tolerant.
+    Missing fields = handled gracefully.
 
-    # UEBA entity features
-    features.update(build_ueba_features(record))
+    `ueba_state` (a UEBAStateStore) enables the windowed UEBA features
+    and `sketches` (a SprayingSketches) the distinct-count spraying
+    features; records must then be passed in time order.
+    """
 
+    features = build_stateless_features(record, extractor, plan)
+    features.update(build_stateful_features(record, features, ueba_state, sketches, plan))
     return features
@@ -0,0 +1,240 @@
+# feature/registry.py
+
+"""
+Declares every feature group main.py can compute: the extractor that
+builds it, the columns it reads, the columns it produces and a rough
+relative per-record cost.
+
+    plan = plan_for(["hour", "user_fail_10m"])
+    plan.names      -> {"time", "ueba", "windowed"}
+
+plan_for() resolves the groups that produce a model's feature columns,
+plus the groups those depend on (e.g. the windowed UEBA counters need
+`username` / `src_ip` / `is_failed_login` from the per-line UEBA group).
+build_stateless_features / build_stateful_features then run only the
+planned extractors, and main.py skips the embedder when "embedding" is
+not in the plan.
+"""
+
+import re
+
+from feature.entity_features import build_entity_features
+from feature.sketches import SprayingSketches
+from feature.statistical_features import extract_statistical_features
+from feature.time_features import extract_time_features
+from feature.ueba_features import build_ueba_features, build_windowed_features
+from feature.ueba_state import parse_timestamp
+
+# Fields of the enriched record that exist before any feature group runs
+BASE_FIELDS = ("@timestamp", "hostname", "process", "raw_message", "clean_message")
+
+
+class FeatureSpec:
+    """
+    One feature group.
+
+    extractor(record, features, resources) -> dict, where `features` holds
+    the outputs of the groups computed so far and `resources` the optional
+    helpers ("extractor", "ueba_state", "sketches"). A group whose resource
+    is missing returns {}.
+    """
+
+    __slots__ = ("name", "extractor", "inputs", "outputs", "output_pattern",
+                 "cost", "stateful")
+
+    def __init__(self, name, extractor, inputs, outputs=(), output_pattern=None,
+                 cost=1, stateful=False):
+        self.name = name
+        self.extractor = extractor
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.output_pattern = re.compile(output_pattern) if output_pattern else None
+        self.cost = cost
+        self.stateful = stateful
+
+    def produces(self, column):
+        if column in self.outputs:
+            return True
+        return self.output_pattern is not None and self.output_pattern.match(column) is not None
+
+
+# -----------------------------------------------------
+# Extractors
+# -----------------------------------------------------
+def _time(record, features, resources):
+    return extract_time_features(record)
+
+
+def _statistical(record, features, resources):
+    return extract_statistical_features(record)
+
+
+def _ueba(record, features, resources):
+    return build_ueba_features(record)
+
+
+def _entity(record, features, resources):
+    extractor = resources.get("extractor")
+    if extractor is None:
+        return {}
+    return build_entity_features(extractor.extract(record))
+
+
+def _windowed(record, features, resources):
+    state = resources.get("ueba_state")
+    if state is None:
+        return {}
+    return build_windowed_features(
+        record,
+        features["username"],
+        features["src_ip"],
+        features["is_failed_login"],
+        state,
+    )
+
+
+def _sketches(record, features, resources):
+    sketches = resources.get("sketches")
+    if sketches is None:
+        return {}
+    ts = parse_timestamp(record.get("@timestamp"))
+    return sketches.update(
+        features["username"],
+        features["src_ip"],
+        ts,
+        sketches.is_replay(record, ts),
+    )
+
+
+# -----------------------------------------------------
+# Registry (in computation order)
+# -----------------------------------------------------
+FEATURE_SPECS = [
+    FeatureSpec(
+        "time", _time,
+        inputs=("@timestamp",),
+        outputs=("hour", "weekday", "is_weekend"),
+        cost=1,
+    ),
+    FeatureSpec(
+        # embedding_norm is only set for records carrying a JSON-encoded
+        # embedding; the embedder runs after the stateless features
+        "statistical", _statistical,
+        inputs=("clean_message",),
+        outputs=("embedding_norm", "message_length"),
+        cost=1,
+    ),
+    FeatureSpec(
+        "ueba", _ueba,
+        inputs=("raw_message", "process"),
+        outputs=("username", "has_username", "src_ip", "has_ip", "process_name",
+                 "has_process", "entity_count", "is_failed_login"),
+        cost=3,
+    ),
+    FeatureSpec(
+        "entity", _entity,
+        inputs=("raw_message",),
+        outputs=("ent_ip_count", "ent_user_count", "ent_hostname_count", "ent_path_count",
+                 "ent_port_count", "ent_has_pid", "ssh_failed", "ssh_accepted"),
+        cost=10,
+    ),
+    FeatureSpec(
+        "windowed", _windowed,
+        inputs=("@timestamp", "hostname", "username", "src_ip", "is_failed_login"),
+        output_pattern=r"^(user|ip|host)_(fail_\w+|secs_since_last|rate_z)$",
+        cost=3,
+        stateful=True,
+    ),
+    FeatureSpec(
+        "sketches", _sketches,
+        inputs=("@timestamp", "username", "src_ip"),
+        outputs=SprayingSketches.FEATURES,
+        cost=4,
+        stateful=True,
+    ),
+    FeatureSpec(
+        # Computed by the embedder in main.process_records, not here
+        "embedding", None,
+        inputs=("clean_message",),
+        outputs=("embedding",),
+        cost=100,
+    ),
+]
+
+SPECS_BY_NAME = {spec.name: spec for spec in FEATURE_SPECS}
+
+
+def producer_of(column):
+    for spec in FEATURE_SPECS:
+        if spec.produces(column):
+            return spec
+    return None
+
+
+# -----------------------------------------------------
+# Plans
+# -----------------------------------------------------
+class FeaturePlan:
+    """The set of feature groups to compute for one run."""
+
+    def __init__(self, names):
+        self.names = frozenset(names)
+
+    @classmethod
+    def full(cls):
+        return cls(SPECS_BY_NAME)
+
+    def __contains__(self, name):
+        return name in self.names
+
+    @property
+    def is_full(self):
+        return self.names == frozenset(SPECS_BY_NAME)
+
+    @property
+    def needs_embedding(self):
+        return "embedding" in self.names
+
+    def specs(self, stateful):
+        return [
+            s for s in FEATURE_SPECS
+            if s.name in self.names and s.stateful == stateful and s.extractor is not None
+        ]
+
+    def describe(self):
+        skipped = [s for s in FEATURE_SPECS if s.name not in self.names]
+        total = sum(s.cost for s in FEATURE_SPECS)
+        kept = total - sum(s.cost for s in skipped)
+        return (f"{', '.join(s.name for s in FEATURE_SPECS if s.name in self.names) or 'none'}"
+                f" (skipped: {', '.join(s.name for s in skipped) or 'none'};"
+                f" ~{kept}/{total} relative cost)")
+
+
+def plan_for(columns, embedding=False):
+    """
+    FeaturePlan computing `columns` (e.g. the model's feature names) and
+    everything they depend on. `embedding=True` adds the embedder (e.g.
+    for the novelty index). Columns no group declares fall back to the
+    full plan, so an unregistered feature is never silently dropped.
+    """
+    wanted = list(columns) + (["embedding"] if embedding else [])
+
+    names, unknown = set(), []
+    todo = list(wanted)
+    while todo:
+        col = todo.pop()
+        spec = producer_of(col)
+        if spec is None:
+            if col not in BASE_FIELDS:
+                unknown.append(col)
+            continue
+        if spec.name not in names:
+            names.add(spec.name)
+            todo.extend(spec.inputs)
+
+    if unknown:
+        print(f"[FEATURES] No registered extractor for {sorted(set(unknown))} "
+              f"→ computing all features.")
+        return FeaturePlan.full()
+
+    return FeaturePlan(names)
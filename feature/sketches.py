@@ -0,0 +1,460 @@
+# feature/sketches.py
+
+import hashlib
+import io
+from array import array
+import json
+import os
+
+import numpy as np
+
+from feature.replay import ReplayGuard, event_key
+
+MASK64 = (1 << 64) - 1
+
+
+def _hash128(value):
+    """
+    Stable 128-bit hash split into two 64-bit ints. Python's built-in
+    hash() is salted per process, so it cannot be used for sketches that
+    are merged across workers or reloaded between runs.
+    """
+    d = hashlib.blake2b(str(value).encode("utf-8"), digest_size=16).digest()
+    return int.from_bytes(d[:8], "little"), int.from_bytes(d[8:], "little")
+
+
+def _hll_alpha(m):
+    if m == 16:
+        return 0.673
+    if m == 32:
+        return 0.697
+    if m == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / m)
+
+
+def _hll_estimate(registers):
+    m = registers.shape[-1]
+    raw = _hll_alpha(m) * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+
+    zeros = int(np.count_nonzero(registers == 0))
+    if raw <= 2.5 * m and zeros:
+        return m * np.log(m / zeros)   # linear counting for small ranges
+    return raw
+
+
+class KeyedHyperLogLog:
+    """
+    One HyperLogLog per key, stored as rows of a single uint8 matrix.
+
+    A key starts sparse: the exact 64-bit hashes of its values, up to
+    `sparse_max` of them (8 bytes each), so the usual user / IP with one
+    or two values costs a few dozen bytes and is counted exactly. Past
+    that it becomes a dense row of 2**precision bytes (256 bytes at the
+    default precision, ~6.5% standard error). At most `max_keys` keys are
+    tracked; values of further keys are dropped and counted in
+    `untracked`. Sketches with the same precision merge by element-wise
+    max (and set union while sparse).
+    """
+
+    def __init__(self, precision=8, max_keys=500000, sparse_max=None):
+        self.precision = int(precision)
+        self.m = 1 << self.precision
+        self.max_keys = int(max_keys)
+        self.sparse_max = int(sparse_max if sparse_max is not None else self.m // 16)
+        self.index = {}    # dense key -> row
+        self.sparse = {}   # sparse key -> array("Q") of value hashes
+        self.registers = np.zeros((16, self.m), dtype=np.uint8)
+        self.untracked = 0
+
+    def __len__(self):
+        return len(self.index) + len(self.sparse)
+
+    def _row(self, key):
+        row = self.index.get(key)
+        if row is None:
+            row = len(self.index)
+            if row >= self.registers.shape[0]:
+                grown = np.zeros((self.registers.shape[0] * 2, self.m), dtype=np.uint8)
+                grown[:row] = self.registers[:row]
+                self.registers = grown
+            self.index[key] = row
+        return row
+
+    def _set_register(self, regs, h):
+        p = self.precision
+        bucket = h >> (64 - p)
+        w = (h << p) & MASK64
+        rank = min(64 - p, 64 - w.bit_length()) + 1
+        if rank > regs[bucket]:
+            regs[bucket] = rank
+
+    def _promote(self, key):
+        """Turn a sparse key into a dense row."""
+        hashes = self.sparse.pop(key)
+        row = self._row(key)   # may grow self.registers
+        for h in hashes:
+            self._set_register(self.registers[row], h)
+        return row
+
+    def _add_hash(self, key, h):
+        row = self.index.get(key)
+        if row is None:
+            hashes = self.sparse.get(key)
+            if hashes is None:
+                if len(self) >= self.max_keys:
+                    self.untracked += 1
+                    return
+                hashes = self.sparse[key] = array("Q")
+            if h in hashes:
+                return
+            if len(hashes) < self.sparse_max:
+                hashes.append(h)
+                return
+            row = self._promote(key)
+        self._set_register(self.registers[row], h)
+
+    def add(self, key, value):
+        h, _ = _hash128(value)
+        self._add_hash(key, h)
+
+    def estimate(self, key):
+        return self.union_estimate([self], key)
+
+    @staticmethod
+    def union_estimate(hlls, key):
+        """Distinct values of `key` over several sketches (e.g. generations)."""
+        exact, regs = set(), []
+        for hll in hlls:
+            row = hll.index.get(key)
+            if row is not None:
+                regs.append(hll.registers[row])
+            else:
+                exact.update(hll.sparse.get(key, ()))
+
+        if not regs:
+            return float(len(exact))
+
+        merged = np.maximum.reduce(regs) if len(regs) > 1 else regs[0].copy()
+        for h in exact:
+            hlls[0]._set_register(merged, h)
+        return float(_hll_estimate(merged))
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs with different precision")
+
+        for key, orow in other.index.items():
+            row = self.index.get(key)
+            if row is None:
+                row = self._promote(key) if key in self.sparse else self._row(key)
+            np.maximum(self.registers[row], other.registers[orow], out=self.registers[row])
+
+        for key, hashes in other.sparse.items():
+            for h in hashes:
+                self._add_hash(key, h)
+
+        self.untracked += other.untracked
+        return self
+
+    def to_arrays(self, prefix):
+        keys = sorted(self.index, key=self.index.get)
+        skeys = list(self.sparse)
+        return {
+            f"{prefix}_keys": np.array(keys, dtype=str),
+            f"{prefix}_registers": self.registers[:len(keys)].copy(),
+            f"{prefix}_sparse_keys": np.array(skeys, dtype=str),
+            f"{prefix}_sparse_sizes": np.array([len(self.sparse[k]) for k in skeys], dtype=np.int64),
+            f"{prefix}_sparse_hashes": np.array(
+                [h for k in skeys for h in self.sparse[k]], dtype=np.uint64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix, precision, max_keys=500000):
+        hll = cls(precision, max_keys)
+        keys = arrays[f"{prefix}_keys"].tolist()
+        regs = arrays[f"{prefix}_registers"]
+        hll.registers = np.zeros((max(16, len(keys)), hll.m), dtype=np.uint8)
+        hll.registers[:len(keys)] = regs
+        hll.index = {k: i for i, k in enumerate(keys)}
+
+        if f"{prefix}_sparse_keys" in arrays:
+            hashes = arrays[f"{prefix}_sparse_hashes"].tolist()
+            pos = 0
+            for key, size in zip(arrays[f"{prefix}_sparse_keys"].tolist(),
+                                 arrays[f"{prefix}_sparse_sizes"].tolist()):
+                hll.sparse[key] = array("Q", hashes[pos:pos + size])
+                pos += size
+        return hll
+
+
+class CountMinSketch:
+    """
+    Count-min sketch over a depth x width int64 table. Estimates never
+    undercount; the overcount is at most ~e/width of the total with
+    probability 1 - exp(-depth). Sketches of equal shape merge by addition.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = int(width)
+        self.depth = int(depth)
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self._rows = np.arange(self.depth)
+
+    def _cols(self, value):
+        h1, h2 = _hash128(value)
+        h2 |= 1
+        return np.array([(h1 + i * h2) % self.width for i in range(self.depth)])
+
+    def add(self, value, count=1):
+        cols = self._cols(value)
+        self.table[self._rows, cols] += count
+        return int(self.table[self._rows, cols].min())
+
+    def estimate(self, value):
+        return int(self.table[self._rows, self._cols(value)].min())
+
+    def merge(self, other):
+        if other.table.shape != self.table.shape:
+            raise ValueError("Cannot merge count-min sketches of different shape")
+        self.table += other.table
+        return self
+
+
+class _SketchSet:
+    """All sketches for a single time generation."""
+
+    def __init__(self, precision, width, depth, max_keys=500000):
+        self.ip_users = KeyedHyperLogLog(precision, max_keys)   # distinct usernames per IP
+        self.user_ips = KeyedHyperLogLog(precision, max_keys)   # distinct IPs per username
+        self.ip_counts = CountMinSketch(width, depth)
+        self.pair_counts = CountMinSketch(width, depth)
+
+    def merge(self, other):
+        self.ip_users.merge(other.ip_users)
+        self.user_ips.merge(other.user_ips)
+        self.ip_counts.merge(other.ip_counts)
+        self.pair_counts.merge(other.pair_counts)
+        return self
+
+
+class SprayingSketches:
+    """
+    Memory-bounded password-spraying / brute-force features.
+
+    Keeps the current and the previous time generation of sketches
+    (`window_seconds` each), so estimates cover between one and two
+    windows of history. All state is numpy arrays: serialisable with
+    `save()` / `load()` and mergeable across parallel workers with
+    `merge()`.
+
+    Observations must arrive in time order. Logs an earlier run already
+    saved are told apart per source host by a ReplayGuard
+    (feature/replay.py) and not added again, so re-processing the same
+    logs does not inflate the counts while a lagging host's late logs
+    still do. Each generation tracks at most `max_keys` IPs / usernames.
+    """
+
+    FEATURES = ("ip_distinct_users", "user_distinct_ips",
+                "ip_attempts", "ip_user_attempts")
+
+    def __init__(self, path=None, window_seconds=86400, hll_precision=8,
+                 cms_width=2048, cms_depth=4, max_keys=500000):
+        self.path = path
+        self.window_seconds = int(window_seconds)
+        self.hll_precision = int(hll_precision)
+        self.cms_width = int(cms_width)
+        self.cms_depth = int(cms_depth)
+        self.max_keys = int(max_keys)
+
+        self.generations = {}   # generation number -> _SketchSet
+        self.guard = ReplayGuard()
+
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    @classmethod
+    def from_config(cls, cfg, path=None):
+        """Build sketches from the `sketches` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            path=path or cfg.get("state_path", "state/sketches.npz"),
+            window_seconds=cfg.get("window_hours", 24) * 3600,
+            hll_precision=cfg.get("hll_precision", 8),
+            cms_width=cfg.get("cms_width", 2048),
+            cms_depth=cfg.get("cms_depth", 4),
+            max_keys=cfg.get("max_keys", 500000),
+        )
+
+    def _new_set(self):
+        return _SketchSet(self.hll_precision, self.cms_width, self.cms_depth, self.max_keys)
+
+    def _current(self, ts):
+        if self.generations:
+            latest = max(self.generations)
+        else:
+            latest = None
+
+        gen = latest if ts is None else int(ts // self.window_seconds)
+        if gen is None:
+            gen = 0
+
+        if gen not in self.generations:
+            if latest is not None and gen < latest - 1:
+                return None   # older than anything we still keep
+            self.generations[gen] = self._new_set()
+            for g in [g for g in self.generations if g < gen - 1]:
+                del self.generations[g]
+
+        return gen
+
+    def _window(self):
+        return [self.generations[g] for g in sorted(self.generations)[-2:]]
+
+    # -----------------------------------------------------
+    # Update / query
+    # -----------------------------------------------------
+    def is_replay(self, record, ts):
+        """True if `record` (at epoch `ts`) is already in the saved state. Once per record."""
+        return self.guard.check(record.get("hostname"), ts, event_key(record))
+
+    def update(self, username, ip, ts=None, replay=False):
+        """
+        Add one (username, src_ip) observation and return the estimates;
+        a `replay` (see is_replay) only returns them.
+        """
+        if replay:
+            return self.features(username, ip)
+
+        gen = self._current(ts)
+        if gen is not None:
+            cur = self.generations[gen]
+            if ip is not None:
+                cur.ip_counts.add(ip)
+                if username is not None:
+                    cur.ip_users.add(ip, username)
+                    cur.user_ips.add(username, ip)
+                    cur.pair_counts.add(f"{ip}|{username}")
+
+        return self.features(username, ip)
+
+    def features(self, username, ip):
+        out = {name: 0.0 for name in self.FEATURES}
+        window = self._window()
+        if not window:
+            return out
+
+        if ip is not None:
+            out["ip_distinct_users"] = self._distinct(window, "ip_users", ip)
+            out["ip_attempts"] = float(sum(s.ip_counts.estimate(ip) for s in window))
+            if username is not None:
+                pair = f"{ip}|{username}"
+                out["ip_user_attempts"] = float(sum(s.pair_counts.estimate(pair) for s in window))
+
+        if username is not None:
+            out["user_distinct_ips"] = self._distinct(window, "user_ips", username)
+
+        return out
+
+    @staticmethod
+    def _distinct(window, attr, key):
+        return KeyedHyperLogLog.union_estimate([getattr(s, attr) for s in window], key)
+
+    def merge(self, other):
+        """Merge another worker's sketches (same config) into this one."""
+        for gen, sset in other.generations.items():
+            if gen in self.generations:
+                self.generations[gen].merge(sset)
+            else:
+                self.generations[gen] = self._new_set().merge(sset)
+
+        for g in sorted(self.generations)[:-2]:
+            del self.generations[g]
+
+        self.guard.merge(other.guard)
+        return self
+
+    # -----------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------
+    def to_bytes(self):
+        arrays = {}
+        meta = {
+            "window_seconds": self.window_seconds,
+            "hll_precision": self.hll_precision,
+            "cms_width": self.cms_width,
+            "cms_depth": self.cms_depth,
+            "generations": sorted(self.generations),
+            "replay": self.guard.to_dict(),
+        }
+        for gen, sset in self.generations.items():
+            arrays.update(sset.ip_users.to_arrays(f"g{gen}_ip_users"))
+            arrays.update(sset.user_ips.to_arrays(f"g{gen}_user_ips"))
+            arrays[f"g{gen}_ip_counts"] = sset.ip_counts.table
+            arrays[f"g{gen}_pair_counts"] = sset.pair_counts.table
+
+        buf = io.BytesIO()
+        np.savez_compressed(buf, meta=np.array(json.dumps(meta)), **arrays)
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, path=None, max_keys=500000):
+        arrays = np.load(io.BytesIO(data), allow_pickle=False)
+        meta = json.loads(str(arrays["meta"]))
+
+        sk = cls(
+            path=None,
+            window_seconds=meta["window_seconds"],
+            hll_precision=meta["hll_precision"],
+            cms_width=meta["cms_width"],
+            cms_depth=meta["cms_depth"],
+            max_keys=max_keys,
+        )
+        sk.path = path
+        sk.guard = ReplayGuard.from_dict(meta.get("replay"))
+
+        for gen in meta["generations"]:
+            sset = sk._new_set()
+            p = sk.hll_precision
+            sset.ip_users = KeyedHyperLogLog.from_arrays(arrays, f"g{gen}_ip_users", p, sk.max_keys)
+            sset.user_ips = KeyedHyperLogLog.from_arrays(arrays, f"g{gen}_user_ips", p, sk.max_keys)
+            sset.ip_counts.table = arrays[f"g{gen}_ip_counts"].copy()
+            sset.pair_counts.table = arrays[f"g{gen}_pair_counts"].copy()
+            sk.generations[gen] = sset
+
+        return sk
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+
+        replayed = self.guard.replayed
+        self.guard.commit()
+        untracked = sum(s.ip_users.untracked + s.user_ips.untracked
+                        for s in self.generations.values())
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(tmp, path)
+
+        print(f"[SKETCH] Saved {len(self.generations)} sketch generation(s) to {path} "
+              f"(skipped {replayed} replayed observations, "
+              f"{untracked} over the max_keys limit)")
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, "rb") as f:
+            loaded = self.from_bytes(f.read(), max_keys=self.max_keys)
+
+        if (loaded.window_seconds, loaded.hll_precision, loaded.cms_width, loaded.cms_depth) != \
+                (self.window_seconds, self.hll_precision, self.cms_width, self.cms_depth):
+            print("[SKETCH] Sketch layout changed, discarding saved state.")
+            self.generations = {}
+            return
+
+        self.generations = loaded.generations
+        self.guard = loaded.guard
+        print(f"[SKETCH] Loaded {len(self.generations)} sketch generation(s) from {path}")
@@ -3,6 +3,17 @@
 import json
 import re
 
+from feature.ueba_state import parse_timestamp
+
+# One match per failed attempt. A bad ssh login also logs "Invalid user"
+# and a pam_unix(sshd:auth) "authentication failure" line, and sudo a
+# "incorrect password attempts" summary: only sshd's "Failed <method>"
+# line and the PAM failure of other services are counted.
+FAILED_LOGIN_RE = re.compile(
+    r"\bFailed (?:password|publickey|none|keyboard-interactive/pam) for\b|"
+    r"\bpam_\w+\((?!sshd:)[\w.-]+:auth\): authentication failure",
+)
+
 def extract_username(record):
     # Try ner-based extraction first
     ents = record.get("entities", "[]")
@@ -35,15 +46,42 @@ def extract_process(record):
     return record.get("process", None)
 
 
-def build_ueba_features(record):
+def is_failed_login(record):
+    msg = record.get("raw_message", "") or ""
+    return FAILED_LOGIN_RE.search(msg) is not None
+
+
+def build_windowed_features(record, username, ip, failed, state):
+    """
+    Time-windowed behavioural features per username / src_ip / hostname,
+    maintained incrementally in a UEBAStateStore.
+    """
+    ts = parse_timestamp(record.get("@timestamp"))
+    host = record.get("hostname")
+    if not isinstance(host, str) or not host:
+        host = None
+
+    replay = state.is_replay(record, ts)
+
+    out = {}
+    out.update(state.update("user", username, ts, failed, replay))
+    out.update(state.update("ip", ip, ts, failed, replay))
+    out.update(state.update("host", host, ts, failed, replay))
+    return out
+
+
+def build_ueba_features(record, state=None):
     """
-    Basic UEBA features (more will be added once we have historical context)
+    Per-line UEBA indicators, plus windowed behavioural features
+    (failed-login counts, time since last seen, rate z-score) when a
+    UEBAStateStore is given.
     """
     username = extract_username(record)
     ip = extract_ip(record)
     proc = extract_process(record)
+    failed = is_failed_login(record)
 
-    return {
+    out = {
         "username": username,
         "has_username": username is not None,
 
@@ -59,4 +97,10 @@ def build_ueba_features(record):
             ip is not None,
             proc is not None,
         ]),
+        "is_failed_login": failed,
     }
+
+    if state is not None:
+        out.update(build_windowed_features(record, username, ip, failed, state))
+
+    return out
@@ -0,0 +1,299 @@
+# feature/ueba_state.py
+
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+from feature.replay import ReplayGuard, event_key
+
+
+def parse_timestamp(ts):
+    """
+    Convert an ISO-8601 timestamp (as written by the ES date processor)
+    into epoch seconds. Returns None if missing or invalid.
+    """
+    if not ts or not isinstance(ts, str):
+        return None
+
+    try:
+        dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+
+    return dt.timestamp()
+
+
+def window_label(seconds):
+    """60 -> '1m', 600 -> '10m', 3600 -> '1h'."""
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+class _EntityState:
+    """
+    Per-entity ring buffers of bucketed counters.
+
+    Slot `b % horizon` holds the counts of time bucket `b`; `head` is the
+    newest bucket seen so far. Advancing the head zeroes at most `horizon`
+    slots, so an update costs O(horizon) in the worst case and O(1) on
+    average, independent of how much history the entity has.
+    """
+
+    __slots__ = ("head", "last_seen", "events", "fails",
+                 "rate_mean", "rate_var", "rate_n")
+
+    def __init__(self, horizon):
+        self.head = None
+        self.last_seen = None
+        self.events = [0] * horizon
+        self.fails = [0] * horizon
+        self.rate_mean = 0.0
+        self.rate_var = 0.0
+        self.rate_n = 0
+
+    # -----------------------------------------------------
+    # Compact (sparse) JSON encoding
+    # -----------------------------------------------------
+    def to_dict(self):
+        return {
+            "h": self.head,
+            "t": self.last_seen,
+            "e": [[i, c] for i, c in enumerate(self.events) if c],
+            "f": [[i, c] for i, c in enumerate(self.fails) if c],
+            "m": self.rate_mean,
+            "v": self.rate_var,
+            "n": self.rate_n,
+        }
+
+    @classmethod
+    def from_dict(cls, d, horizon):
+        st = cls(horizon)
+        st.head = d.get("h")
+        st.last_seen = d.get("t")
+        for i, c in d.get("e", []):
+            if i < horizon:
+                st.events[i] = c
+        for i, c in d.get("f", []):
+            if i < horizon:
+                st.fails[i] = c
+        st.rate_mean = d.get("m", 0.0)
+        st.rate_var = d.get("v", 0.0)
+        st.rate_n = d.get("n", 0)
+        return st
+
+
+class UEBAStateStore:
+    """
+    Incremental, persistent state for time-windowed UEBA features.
+
+    Keeps one `_EntityState` per (kind, key) — e.g. ("user", "root") or
+    ("ip", "1.2.3.4") — holding bucketed event / failed-login counters for
+    the largest configured window plus an exponentially weighted estimate
+    of the per-bucket event rate. Entities not seen for `ttl_seconds` are
+    expired on `expire()` / `save()`.
+
+    Events must arrive in time order. Logs an earlier run already saved
+    are told apart by a ReplayGuard (feature/replay.py): they return
+    features without being counted again, so re-runs are idempotent.
+    """
+
+    def __init__(self, path=None, bucket_seconds=60, windows=(60, 600, 3600),
+                 ttl_seconds=7 * 86400, rate_alpha=0.1):
+        self.path = path
+        self.bucket_seconds = int(bucket_seconds)
+        self.windows = sorted(int(w) for w in windows)
+        self.horizon = max(1, math.ceil(self.windows[-1] / self.bucket_seconds))
+        self.ttl_seconds = ttl_seconds
+        self.rate_alpha = rate_alpha
+
+        self.entities = {}
+        self.guard = ReplayGuard()
+
+        if self.path and os.path.exists(self.path):
+            self.load()
+
+    @classmethod
+    def from_config(cls, cfg, path=None):
+        """Build a store from the `ueba` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            path=path or cfg.get("state_path", "state/ueba_state.json"),
+            bucket_seconds=cfg.get("bucket_seconds", 60),
+            windows=cfg.get("windows", [60, 600, 3600]),
+            ttl_seconds=cfg.get("ttl_hours", 168) * 3600,
+            rate_alpha=cfg.get("rate_alpha", 0.1),
+        )
+
+    # -----------------------------------------------------
+    # Ring buffer maintenance
+    # -----------------------------------------------------
+    def _close_bucket(self, st, count):
+        """Fold a finished bucket's event count into the EWMA rate stats."""
+        a = self.rate_alpha
+        if st.rate_n == 0:
+            st.rate_mean = float(count)
+            st.rate_var = 0.0
+        else:
+            diff = count - st.rate_mean
+            incr = a * diff
+            st.rate_mean += incr
+            st.rate_var = (1 - a) * (st.rate_var + diff * incr)
+        st.rate_n += 1
+
+    def _advance(self, st, bucket):
+        if st.head is None:
+            st.head = bucket
+            return
+
+        gap = bucket - st.head
+        if gap <= 0:
+            return
+
+        H = self.horizon
+
+        # The old head bucket is now complete; empty buckets in between
+        # count as zero-rate buckets (capped at the horizon).
+        self._close_bucket(st, st.events[st.head % H])
+        for _ in range(min(gap - 1, H)):
+            self._close_bucket(st, 0)
+
+        for b in range(st.head + 1, st.head + min(gap, H) + 1):
+            st.events[b % H] = 0
+            st.fails[b % H] = 0
+
+        st.head = bucket
+
+    def _window_sum(self, ring, head, seconds):
+        n = min(self.horizon, math.ceil(seconds / self.bucket_seconds))
+        H = self.horizon
+        return sum(ring[(head - i) % H] for i in range(n))
+
+    # -----------------------------------------------------
+    # Public API
+    # -----------------------------------------------------
+    def is_replay(self, record, ts):
+        """True if `record` (at epoch `ts`) is already in the saved state. Once per record."""
+        return self.guard.check(record.get("hostname"), ts, event_key(record))
+
+    def update(self, kind, key, ts, failed=False, replay=False):
+        """
+        Record one event for entity (kind, key) at epoch `ts` and return
+        its windowed features, prefixed with `kind`. A `replay` (see
+        is_replay) returns the features without counting the event.
+        """
+        out = self.empty_features(kind)
+        if key is None or ts is None:
+            return out
+
+        ent_key = f"{kind}:{key}"
+        st = self.entities.get(ent_key)
+        if st is None:
+            if replay:
+                return out   # entity expired since the saved run
+            st = _EntityState(self.horizon)
+            self.entities[ent_key] = st
+
+        if st.last_seen is not None:
+            out[f"{kind}_secs_since_last"] = max(0.0, ts - st.last_seen)
+
+        H = self.horizon
+
+        if not replay:
+            bucket = int(ts // self.bucket_seconds)
+            self._advance(st, bucket)
+
+            # Late events inside the horizon are still counted; older ones
+            # only refresh last_seen.
+            if st.head - bucket < H:
+                st.events[bucket % H] += 1
+                if failed:
+                    st.fails[bucket % H] += 1
+
+            st.last_seen = ts if st.last_seen is None else max(st.last_seen, ts)
+
+        for w in self.windows:
+            out[f"{kind}_fail_{window_label(w)}"] = self._window_sum(st.fails, st.head, w)
+
+        if st.rate_n >= 2:
+            current = st.events[st.head % H]
+            std = math.sqrt(st.rate_var) + 1e-6
+            out[f"{kind}_rate_z"] = (current - st.rate_mean) / std
+
+        return out
+
+    def empty_features(self, kind):
+        out = {f"{kind}_fail_{window_label(w)}": 0 for w in self.windows}
+        out[f"{kind}_secs_since_last"] = -1.0
+        out[f"{kind}_rate_z"] = 0.0
+        return out
+
+    def expire(self, now=None):
+        """Drop entities whose last event is older than ttl_seconds."""
+        if now is None:
+            now = time.time()
+
+        stale = [
+            k for k, st in self.entities.items()
+            if st.last_seen is None or now - st.last_seen > self.ttl_seconds
+        ]
+        for k in stale:
+            del self.entities[k]
+
+        return len(stale)
+
+    # -----------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------
+    def save(self, path=None, now=None):
+        path = path or self.path
+        if not path:
+            return
+
+        if now is None:
+            # Logs are often replayed long after the fact, so expire
+            # relative to the newest event rather than wall-clock time.
+            seen = [st.last_seen for st in self.entities.values() if st.last_seen]
+            now = max(seen) if seen else time.time()
+        expired = self.expire(now)
+
+        replayed = self.guard.replayed
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "bucket_seconds": self.bucket_seconds,
+                "horizon": self.horizon,
+                "entities": {k: st.to_dict() for k, st in self.entities.items()},
+                "replay": self.guard.commit(),
+            }, f, separators=(",", ":"))
+        os.replace(tmp, path)
+
+        print(f"[UEBA] Saved state for {len(self.entities)} entities "
+              f"(expired {expired}, skipped {replayed} replayed events) to {path}")
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, "r") as f:
+            data = json.load(f)
+
+        if (data.get("bucket_seconds") != self.bucket_seconds
+                or data.get("horizon") != self.horizon):
+            print("[UEBA] Bucket layout changed, discarding saved state.")
+            self.entities = {}
+            return
+
+        self.entities = {
+            k: _EntityState.from_dict(d, self.horizon)
+            for k, d in data.get("entities", {}).items()
+        }
+        self.guard = ReplayGuard.from_dict(data.get("replay"))
+        print(f"[UEBA] Loaded state for {len(self.entities)} entities from {path}")
@@ -1,25 +1,36 @@
 import argparse
 import os
+import signal
 import yaml
 import requests
 import json
+import time
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
+from utils.file_tailer import FileTailer
+from utils.log_reader import is_log_file, iter_text_lines, split_ranges
+from utils.metrics import RunMetrics
+from utils.syslog_parser import SyslogParser
+
 def load_config():
     with open("config.yml", "r") as f:
         return yaml.safe_load(f)
 
-def send_to_es(line, cfg, pipeline):
+def send_to_es(line, cfg, pipeline, metrics=None):
     es_host = cfg["elasticsearch"]["host"]
     index = cfg["elasticsearch"].get("input_index", "raw_logs")  # FIXED
 
     url = f"{es_host}/{index}/_doc?pipeline={pipeline}"
 
+    t0 = time.perf_counter()
     response = requests.post(
         url,
         headers={"Content-Type": "application/json"},
         data=json.dumps({"raw_log": line.strip()})
     )
+    if metrics is not None:
+        metrics.record("ingest_send", time.perf_counter() - t0, 1)
 
     if response.status_code not in (200, 201):
         print("Error:", response.text)
@@ -28,30 +39,206 @@ def send_to_es(line, cfg, pipeline):
     return True
 
 
-def ingest_file(filepath, cfg, pipeline, success, failed):
-    with open(filepath, "r", errors="ignore") as f:
-        lines = f.readlines()
+def send_bulk(docs, cfg, metrics=None, pipeline=None, retries=3, ids=None):
+    """
+    Index docs with one _bulk request, through `pipeline` if given (raw
+    lines) or as-is (pre-parsed). Items rejected with 429 are resent up
+    to `retries` times. With `ids`, docs are sent as op_type create and a
+    409 (already indexed) counts as success. Returns (indexed, failed), or
+    None if the request itself failed and nothing can be assumed indexed.
+    """
+    es_host = cfg["elasticsearch"]["host"]
+    index = cfg["elasticsearch"].get("input_index", "raw_logs")
+
+    url = f"{es_host}/{index}/_bulk"
+    if pipeline:
+        url += f"?pipeline={pipeline}"
+
+    pending = list(zip(ids, docs)) if ids is not None else [(None, doc) for doc in docs]
+    indexed = 0
+    failed = 0
+
+    for attempt in range(retries + 1):
+        body = "".join(
+            ('{"index":{}}\n' if doc_id is None else json.dumps({"create": {"_id": doc_id}}) + "\n")
+            + json.dumps(doc) + "\n"
+            for doc_id, doc in pending
+        )
+
+        t0 = time.perf_counter()
+        try:
+            response = requests.post(
+                url,
+                headers={"Content-Type": "application/x-ndjson"},
+                data=body.encode("utf-8")
+            )
+        except requests.RequestException as e:
+            print("Error:", e)
+            return None
+        finally:
+            if metrics is not None:
+                metrics.record("ingest_bulk", time.perf_counter() - t0, len(pending))
+
+        if response.status_code != 200:
+            print("Error:", response.text)
+            return None
+
+        result = response.json()
+        if not result.get("errors"):
+            return indexed + len(pending), failed
+
+        retry = []
+        for doc, item in zip(pending, result["items"]):
+            status = list(item.values())[0].get("status", 500)
+            if status < 300:
+                indexed += 1
+            elif status == 409 and ids is not None:
+                indexed += 1
+                if metrics is not None:
+                    metrics.count("ingest_duplicates")
+            elif status == 429 and attempt < retries:
+                retry.append(doc)
+            else:
+                failed += 1
+                if failed == 1:
+                    print("Error:", json.dumps(list(item.values())[0].get("error")))
+
+        if not retry:
+            break
+        pending = retry
+        time.sleep(0.1 * 2 ** attempt)
+
+    return indexed, failed
+
+
+def _timed_lines(lines, metrics):
+    """Pass `lines` through, recording the time spent reading them as "ingest_read"."""
+    it = iter(lines)
+    spent = 0.0
+    n = 0
+    while True:
+        t0 = time.perf_counter()
+        line = next(it, None)
+        spent += time.perf_counter() - t0
+        if line is None:
+            break
+        n += 1
+        yield line
+
+    if metrics is not None:
+        metrics.record("ingest_read", spent, n)
 
-    print(f"\n[INFO] Ingesting file: {filepath}")
-    for line in tqdm(lines, desc="Ingesting", unit="line"):
+
+def ingest_parsed(lines, cfg, parser, success, failed, metrics=None, bulk_size=1000,
+                  progress=True):
+    """Parse lines client-side (same fields as the ES pipeline) and bulk-index them."""
+    batch = []
+
+    def flush():
+        ok, bad = send_bulk(batch, cfg, metrics) or (0, len(batch))
+        success[0] += ok
+        failed[0] += bad
+        batch.clear()
+
+    t_parse = 0.0
+    n = 0
+    for line in tqdm(lines, desc="Ingesting", unit="line", disable=not progress):
+        t0 = time.perf_counter()
         line = line.strip()
+        doc = parser.parse(line) if line else None
+        t_parse += time.perf_counter() - t0
+        n += 1
+
         if not line:
             continue
+        if doc is None:
+            # grok mismatch: the ES pipeline would reject this line as well
+            failed[0] += 1
+            continue
+
+        batch.append(doc)
+        if len(batch) >= bulk_size:
+            flush()
 
-        if send_to_es(line, cfg, pipeline):
+    if batch:
+        flush()
+
+    if metrics is not None:
+        metrics.record("ingest_parse", t_parse, n)
+
+
+def ingest_file(filepath, cfg, pipeline, success, failed, metrics=None,
+                parser=None, bulk_size=1000, start=0, end=None, progress=True):
+    """
+    Stream `filepath` (plain, .gz or .zst) into ES. `start` / `end` limit a
+    plain file to one byte range from log_reader.split_ranges().
+    """
+    lines = _timed_lines(iter_text_lines(filepath, start, end), metrics)
+
+    where = f" [{start}:{end}]" if start or end is not None else ""
+    print(f"\n[INFO] Ingesting file: {filepath}{where}")
+
+    if parser is not None:
+        if not parser.pipeline_compat:
+            # --lenient-timestamps: infer years from this file's mtime
+            parser = SyslogParser.for_file(filepath, pipeline_compat=False)
+        ingest_parsed(lines, cfg, parser, success, failed, metrics, bulk_size, progress)
+        return
+
+    for line in tqdm(lines, desc="Ingesting", unit="line", disable=not progress):
+        if send_to_es(line, cfg, pipeline, metrics):
             success[0] += 1
         else:
             failed[0] += 1
 
-def ingest_folder(folder, cfg, pipeline):
+
+def _ingest_range(task):
+    """Worker entry point: ingest one byte range, return counts and metrics."""
+    path, start, end, cfg, pipeline, parser_compat, bulk_size = task
+    success = [0]
+    failed = [0]
+    metrics = RunMetrics("ingest_worker")
+    parser = None if parser_compat is None else SyslogParser(pipeline_compat=parser_compat)
+    ingest_file(path, cfg, pipeline, success, failed, metrics, parser, bulk_size,
+                start, end, progress=False)
+    return success[0], failed[0], metrics
+
+
+def ingest_paths(paths, cfg, pipeline, success, failed, metrics=None, parser=None,
+                 bulk_size=1000, workers=1):
+    """
+    Ingest `paths`, one after another, or with `workers` > 1 in a process
+    pool, with big plain files split into line-aligned byte ranges.
+    """
+    if workers <= 1:
+        for path in paths:
+            ingest_file(path, cfg, pipeline, success, failed, metrics, parser, bulk_size)
+        return
+
+    tasks = [
+        (path, start, end, cfg, pipeline, None if parser is None else parser.pipeline_compat, bulk_size)
+        for path in paths
+        for start, end in split_ranges(path, workers)
+    ]
+    print(f"[INFO] {len(paths)} files -> {len(tasks)} ranges on {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for ok, bad, worker_metrics in pool.map(_ingest_range, tasks):
+            success[0] += ok
+            failed[0] += bad
+            if metrics is not None:
+                metrics.merge(worker_metrics)
+
+
+def ingest_folder(folder, cfg, pipeline, metrics=None, parser=None, bulk_size=1000,
+                  workers=1, rotated=False):
     success = [0]
     failed = [0]
 
     print(f"[INFO] Reading folder: {folder}")
 
-    for file in os.listdir(folder):
-        if file.endswith(".log") or file.endswith(".txt"):
-            ingest_file(os.path.join(folder, file), cfg, pipeline, success, failed)
+    paths = _log_paths(folder, rotated=rotated)
+    ingest_paths(paths, cfg, pipeline, success, failed, metrics, parser, bulk_size, workers)
 
     print("\n============================")
     print("      INGEST SUMMARY")
@@ -60,22 +247,160 @@ def ingest_folder(folder, cfg, pipeline):
     print(f"Failed:     {failed[0]}")
     print("============================")
 
+    if metrics is not None:
+        metrics.count("ingest_success", success[0])
+        metrics.count("ingest_failed", failed[0])
+
+def _log_paths(folder, file="", rotated=False):
+    if file:
+        return [file]
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+            if is_log_file(f, rotated)]
+
+
+def follow(list_paths, cfg, pipeline, metrics=None, parser=None, bulk_size=1000):
+    """
+    Tail the files returned by `list_paths()` and bulk-index appended lines,
+    flushing every `flush_docs` lines or `flush_seconds`, whichever comes
+    first. Offsets are checkpointed only after a flush succeeds.
+    """
+    fcfg = cfg.get("follow") or {}
+    tailer = FileTailer.from_config(fcfg)
+    flush_docs = int(fcfg.get("flush_docs", bulk_size))
+    flush_seconds = float(fcfg.get("flush_seconds", 2.0))
+    poll_seconds = float(fcfg.get("poll_seconds", 0.5))
+
+    docs, ids, marks = [], [], []
+    first_at = None
+    success = [0]
+    failed = [0]
+    stop = []
+
+    signal.signal(signal.SIGTERM, lambda *_: stop.append(True))
+
+    def flush():
+        nonlocal first_at
+        while docs:
+            n = min(bulk_size, len(docs))
+            res = send_bulk(docs[:n], cfg, metrics, pipeline=None if parser else pipeline,
+                            ids=ids[:n])
+            if res is None:
+                return False
+            success[0] += res[0]
+            failed[0] += res[1]
+            del docs[:n], ids[:n]
+
+        for mark in marks:
+            tailer.commit(mark)
+        tailer.save()
+        marks.clear()
+        first_at = None
+        return True
+
+    print(f"[TAIL] Following {len(list_paths())} files "
+          f"(flush every {flush_docs} lines or {flush_seconds}s)")
+
+    backoff = poll_seconds
+    try:
+        while not stop:
+            got = 0
+
+            # While a failed flush is being retried, don't read further
+            if len(docs) < flush_docs:
+                for path in list_paths():
+                    for seg in tailer.poll(path):
+                        t0 = time.perf_counter()
+                        for line_offset, line in seg.lines:
+                            if parser is not None:
+                                doc = parser.parse(line)
+                                if doc is None:
+                                    failed[0] += 1
+                                    continue
+                            else:
+                                doc = {"raw_log": line}
+                            docs.append(doc)
+                            ids.append(seg.line_id(line_offset, line))
+                        if metrics is not None and seg.lines:
+                            metrics.record("ingest_read", time.perf_counter() - t0, len(seg.lines))
+                        marks.append(seg.mark)
+                        got += len(seg.lines)
+
+            if marks and first_at is None:
+                first_at = time.monotonic()
+
+            due = marks and (len(docs) >= flush_docs or not docs
+                             or time.monotonic() - first_at >= flush_seconds)
+            if due:
+                if flush():
+                    backoff = poll_seconds
+                else:
+                    print(f"[TAIL] Flush failed; retrying in {backoff:.1f}s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+
+            if not got:
+                time.sleep(poll_seconds)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if marks and not flush():
+            print(f"[TAIL] {len(docs)} lines not flushed; they will be re-read on the next run")
+
+    print(f"\n[TAIL] Stopped. Successful: {success[0]}  Failed: {failed[0]}")
+    if metrics is not None:
+        metrics.count("ingest_success", success[0])
+        metrics.count("ingest_failed", failed[0])
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--folder", default="logs/")
     parser.add_argument("--file", default="")
     parser.add_argument("--pipeline", default="syslog_pipeline")
+    parser.add_argument("--client-parse", action="store_true",
+                        help="parse lines locally and bulk-index them, bypassing the ES ingest pipeline "
+                             "(same documents as the pipeline, see utils/syslog_parser.py)")
+    parser.add_argument("--lenient-timestamps", action="store_true",
+                        help="with --client-parse: also date space-padded days and infer the year "
+                             "(diverges from the pipeline, which leaves those without @timestamp)")
+    parser.add_argument("--bulk-size", type=int, default=1000)
+    parser.add_argument("--follow", action="store_true",
+                        help="keep tailing the files, sending only new lines (offsets kept in follow.checkpoint_path)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="ingest files / line-aligned byte ranges of big files in N processes")
+    parser.add_argument("--include-rotated", action="store_true",
+                        help="also ingest rotated files in --folder (auth.log.1, *.gz, *.zst) for a "
+                             "one-off backfill; their lines are indexed again if the live file "
+                             "was ingested before it rotated")
 
     args = parser.parse_args()
+    if args.follow and args.include_rotated:
+        parser.error("--follow reads rotated files itself; drop --include-rotated")
     cfg = load_config()
+    metrics = RunMetrics("ingest")
+
+    syslog_parser = None
+    if args.client_parse:
+        syslog_parser = SyslogParser(pipeline_compat=not args.lenient_timestamps)
 
-    if args.file:
+    if args.follow:
+        follow(lambda: _log_paths(args.folder, args.file), cfg, args.pipeline, metrics,
+               syslog_parser, args.bulk_size)
+    elif args.file:
         success = [0]
         failed = [0]
-        ingest_file(args.file, cfg, args.pipeline, success, failed)
+        ingest_paths([args.file], cfg, args.pipeline, success, failed, metrics,
+                     syslog_parser, args.bulk_size, args.workers)
         print(f"\nSuccessful: {success[0]}  Failed: {failed[0]}")
+        metrics.count("ingest_success", success[0])
+        metrics.count("ingest_failed", failed[0])
     else:
-        ingest_folder(args.folder, cfg, args.pipeline)
+        ingest_folder(args.folder, cfg, args.pipeline, metrics, syslog_parser, args.bulk_size,
+                      args.workers, args.include_rotated)
+
+    metrics.summary()
+    metrics.export(cfg.get("metrics"))
 
 if __name__ == "__main__":
     main()
@@ -2,87 +2,409 @@
 
 import argparse
 import json
+import os
+import time
 import pandas as pd
 
 from utils.io_manager import IOManager
-from nlp.normalize import clean_message
 from nlp.embedder import Embedder
-from feature.feature_builder import build_features
+from feature.feature_builder import build_stateful_features
+from feature.registry import SPECS_BY_NAME, FeaturePlan
+from feature.ueba_state import UEBAStateStore, parse_timestamp
+from feature.sketches import SprayingSketches
 
 from ml.ml_pipeline import MLPipeline
 from ml.model_store import ModelStore
+from ml.sampler import TrainingSampler
+from utils.metrics import RunMetrics, profiled
+from utils.process_pool import StageRunner
+from utils.sharding import ShardFilter
+
+
+def by_event_time(records):
+    """Records sorted by parsed @timestamp (stable; unparseable ones first)."""
+    def key(rec):
+        ts = parse_timestamp(rec.get("@timestamp"))
+        return (ts is not None, ts or 0.0)
+    return sorted(records, key=key)
+
+
+def process_records(raw_logs, embedder, ueba_state=None, sketches=None, metrics=None,
+                    runner=None, plan=None):
+    """
+    Clean, embed and build features for a batch of raw records.
+
+    Cleaning and the stateless features run in `runner` (a StageRunner,
+    possibly backed by a process pool); embeddings and the stateful UEBA /
+    sketch features are computed here. The windowed state assumes time
+    order, and neither ES scroll nor file order guarantees it, so the
+    batch is sorted by @timestamp first (output follows that order).
+
+    `plan` (a FeaturePlan) limits the feature groups computed; without
+    "embedding" in it no embedding is computed and `embedder` may be None.
+    """
+    if runner is None:
+        runner = StageRunner()
+    plan = plan or FeaturePlan.full()
+    raw_logs = by_event_time(raw_logs)
+
+    t0 = time.perf_counter()
+    prepared = runner.run(raw_logs, plan).to_rows()
+    t_clean = time.perf_counter() - t0
+
+    processed_logs = []
+    t_embed = t_feat = 0.0
+
+    for rec, row in zip(raw_logs, prepared):
+        t1 = time.perf_counter()
+        msg = str(rec.get("message", rec.get("raw_message", "")))
+        clean = row.pop("clean_message")
+
+        # Embedding (used for ML only)
+        embedding_vec = embedder.encode([clean])[0] if plan.needs_embedding else None
+        t2 = time.perf_counter()
+
+        enriched = {
+            "_id": rec.get("_id"),  # keep ES ID for reference only
+            "@timestamp": rec.get("@timestamp", ""),
+            "hostname": rec.get("hostname", ""),
+            "process": rec.get("process", ""),
+            "raw_message": msg,
+            "clean_message": clean,
+        }
+
+        # Store embedding internally (kept as dense_vector in the output index)
+        if embedding_vec is not None:
+            enriched["embedding"] = embedding_vec.tolist()
+
+        # Feature extraction: stateless part from the runner, then windowed state
+        enriched.update(row)
+        enriched.update(build_stateful_features(enriched, row, ueba_state, sketches, plan))
+
+        processed_logs.append(enriched)
+
+        t3 = time.perf_counter()
+        t_embed += t2 - t1
+        t_feat += t3 - t2
+
+    if metrics is not None:
+        n = len(processed_logs)
+        metrics.record("clean", t_clean, n)
+        if plan.needs_embedding:
+            metrics.record("embed", t_embed, n)
+        metrics.record("features", t_feat, n)
+
+    return processed_logs
+
+
+class LGBWrapper:
+    """Booster loaded from lightgbm.txt, exposed like the fitted LGBMClassifier."""
+
+    def __init__(self, booster):
+        self.booster_ = booster
+
+    def predict(self, X):
+        return self.booster_.predict(X)
+
+
+def load_trained_pipeline(cfg):
+    """MLPipeline with the models saved by the last training run restored."""
+    data = ModelStore("models").load()
+
+    ml = MLPipeline(cfg.get("ml"))
+
+    # Restore IsolationForest + scaler
+    ml.isolation_forest = data.get("isolation_forest")
+    ml.scaler = data.get("scaler")
+
+    # Restore LightGBM
+    if "lgb_booster" in data:
+        ml.lgb_model = LGBWrapper(data["lgb_booster"])
+
+    if "lgb_meta" in data:
+        ml.lgb_train_features = data["lgb_meta"]["feature_names"]
+
+    # Restore embedding novelty index (knn_distance)
+    ml.novelty_index = data.get("novelty_index")
+
+    # Restore training-time score bounds (batch-independent normalisation)
+    ml.score_bounds = data.get("score_bounds")
+    if ml.isolation_forest is not None and ml.score_bounds is None:
+        print("[WARN] Models have no score_bounds.json → scores are normalised per batch; "
+              "retrain to make them independent of chunking.")
+
+    return ml
+
+
+def stream_train(io, cfg, args, embedder, ueba_state, sketches, metrics, runner=None):
+    """
+    Out-of-core training: process the input chunk by chunk, keep a bounded
+    stratified sample and fit the scaler over the whole stream.
+    """
+    ml_cfg = cfg.get("ml") or {}
+    sampling = ml_cfg.get("sampling") or {}
+
+    sampler = TrainingSampler.from_config(sampling, seed=ml_cfg.get("random_seed", 42))
+    chunk_size = sampling.get("chunk_size", 5000)
+
+    print("[MAIN] Streaming logs into training sample...")
+    for chunk in io.iter_read(chunk_size):
+        processed = process_records(chunk, embedder, ueba_state, sketches, metrics, runner)
+        sampler.consume(pd.DataFrame(processed), MLPipeline.select_feature_columns)
+        print(f"[MAIN] Sampled from {sampler.total_seen} logs so far.")
+
+    # Training runs do not persist UEBA / sketch state: the scoring run
+    # over these logs counts them (and a re-run would double-count them)
+
+    if sampler.total_seen == 0:
+        print("[MAIN] No logs to train on.")
+        return
+
+    print("\n[ML] Training anomaly detection models on stream sample...")
+
+    ml = MLPipeline(ml_cfg)
+    ml.scaler = sampler.scaler
+    store = ModelStore("models")
+
+    df_sample = sampler.sample()
+    with metrics.stage("train", rows=len(df_sample)):
+        train_metrics = ml.train(
+            df=df_sample,
+            auto_label=args.auto_label,
+            label_threshold=args.label_threshold,
+            feature_cols=sampler.feature_cols,
+            prefit_scaler=True,
+        )
+    train_metrics.update(sampler.stats())
+
+    store.save(ml, metadata=train_metrics)
+    print("[ML] Training complete.")
+    print("[ML] Stored model metadata:", train_metrics)
+
+
+def scoring_plan(ml, cfg):
+    """
+    FeaturePlan for a scoring-only run: just the feature groups `ml` reads
+    (processing.feature_plan: model), or everything (feature_plan: all).
+    """
+    mode = (cfg.get("processing") or {}).get("feature_plan", "model")
+    if mode == "all" or ml.isolation_forest is None or not ml.lgb_train_features:
+        return FeaturePlan.full()
+
+    plan = ml.feature_plan()
+    print(f"[FEATURES] Plan: {plan.describe()}")
+    return plan
+
+
+def run_async(io, cfg, embedder, ueba_state, sketches, metrics, runner=None,
+              ml=None, plan=None):
+    """
+    Score the input with the trained models, overlapping ES reads, compute
+    and ES writes (see async_runner.py).
+    """
+    from async_runner import AsyncPipeline
+
+    ml = ml or load_trained_pipeline(cfg)
+    if ml.isolation_forest is None:
+        print("[MAIN] --async scores with trained models; run --train-ml first.")
+        return
+
+    def process_chunk(chunk):
+        processed = process_records(chunk, embedder, ueba_state, sketches, metrics,
+                                    runner, plan)
+        df = pd.DataFrame(processed)
+        with metrics.stage("predict", rows=len(df)):
+            scored = ml.predict(df)
+        return scored.to_dict(orient="records")
+
+    chunk_size = (cfg.get("async") or {}).get("chunk_size", 5000)
+    AsyncPipeline.from_config(io, process_chunk, metrics).run(chunk_size)
+
+    ueba_state.save()
+    sketches.save()
+
+
+def split_entity_features(ml, plan):
+    """
+    Features of a sharded run that read per-user / per-src_ip state. A
+    hostname shard only sees the events of its own hosts, so an attacker
+    spread over hosts in several shards is counted partially by each.
+    """
+    windowed = SPECS_BY_NAME["windowed"]
+    per_host = ("host_",)
+
+    if ml is not None and ml.lgb_train_features:
+        return [
+            c for c in ml.lgb_train_features
+            if c in SprayingSketches.FEATURES
+            or (windowed.produces(c) and not c.startswith(per_host))
+        ]
+    return [name for name in ("windowed", "sketches") if name in plan]
+
+
+def apply_shard(cfg, shard):
+    """Point this shard's persisted state and file outputs at its own paths."""
+    for section, default in (("ueba", "state/ueba_state.json"),
+                             ("sketches", "state/sketches.npz")):
+        cfg[section] = cfg.get(section) or {}
+        cfg[section]["state_path"] = shard.shard_path(cfg[section].get("state_path", default))
+
+    cfg["output"]["file"] = shard.shard_path(cfg["output"]["file"])
 
 
 def main():
     parser = argparse.ArgumentParser()
 
     # Input/output control
-    parser.add_argument("--in", dest="input_type", help="es/file")
+    parser.add_argument("--in", dest="input_type", help="es/file/log")
     parser.add_argument("--out", dest="output_type", help="es/file")
     parser.add_argument("--config", dest="config_path", default="config.yml")
 
     # ML actions
     parser.add_argument("--train-ml", action="store_true")
     parser.add_argument("--predict-ml", action="store_true")
+    parser.add_argument("--stream-train", action="store_true",
+                        help="train from a bounded sample of the chunked input (out-of-core)")
+    parser.add_argument("--async", dest="async_mode", action="store_true",
+                        help="score with overlapped read / compute / write stages (needs trained models)")
 
     # Auto-labeling for LightGBM
     parser.add_argument("--auto-label", action="store_true")
     parser.add_argument("--label-threshold", type=float, default=0.8)
 
+    # Sharding by hostname (see utils/sharding.py and shard_coordinator.py)
+    parser.add_argument("--shard", type=int, default=0,
+                        help="index of the hostname partition this process owns")
+    parser.add_argument("--num-shards", type=int, default=1,
+                        help="total number of hostname partitions")
+
+    # Instrumentation
+    parser.add_argument("--profile", action="store_true",
+                        help="run under cProfile + tracemalloc and dump the top hotspots")
+
     args = parser.parse_args()
 
+    if args.stream_train and args.predict_ml:
+        parser.error("--stream-train does not keep all logs in memory; predict in a separate run")
+    if args.async_mode and (args.train_ml or args.stream_train):
+        parser.error("--async only scores; train in a separate run")
+    if args.num_shards > 1 and (args.train_ml or args.stream_train):
+        parser.error("sharded runs only score; train on the full input in a separate run")
+    if not 0 <= args.shard < args.num_shards:
+        parser.error(f"--shard must be in [0, {args.num_shards})")
+
+    metrics = RunMetrics("main")
+
     # IO Manager
-    io = IOManager(args.config_path)
+    io = IOManager(args.config_path, metrics=metrics)
     io.override_config(
         input_type=args.input_type,
         output_type=args.output_type,
         config_path=args.config_path
     )
 
+    cfg = io.config
+    metrics_cfg = cfg.get("metrics") or {}
+
+    # Hostname partition: own reads, state, outputs and run report per shard
+    if args.num_shards > 1:
+        io.shard = ShardFilter.from_config(cfg.get("sharding"), args.shard, args.num_shards)
+        apply_shard(cfg, io.shard)
+        metrics.run_name = f"main_{io.shard.suffix}"
+    metrics.info.update({
+        "input": cfg["input"]["type"],
+        "output": cfg["output"]["type"],
+        "train_ml": args.train_ml,
+        "predict_ml": args.predict_ml,
+        "stream_train": args.stream_train,
+        "async": args.async_mode,
+        "workers": (cfg.get("processing") or {}).get("workers", 0),
+        "shard": args.shard,
+        "num_shards": args.num_shards,
+    })
+
+    # Clean + stateless features, optionally on a process pool
+    runner = StageRunner.from_config(cfg.get("processing"))
+
+    try:
+        if args.profile:
+            prefix = os.path.join(metrics_cfg.get("report_dir", "reports"), "main_profile")
+            with profiled(prefix, top=metrics_cfg.get("profile_top", 30)):
+                run(args, io, metrics, runner)
+        else:
+            run(args, io, metrics, runner)
+    finally:
+        runner.close()
+        metrics.summary()
+        metrics.export(metrics_cfg)
+
+
+def run(args, io, metrics, runner=None):
+    cfg = io.config
+
+    # Scoring-only runs compute just the features the trained models read
+    ml = None
+    plan = FeaturePlan.full()
+    if args.async_mode or (args.predict_ml and not args.train_ml):
+        ml = load_trained_pipeline(cfg)
+        plan = scoring_plan(ml, cfg)
+
+        entity = SPECS_BY_NAME["entity"]
+        if runner is not None and not runner.entity_features and \
+                any(entity.produces(c) for c in ml.lgb_train_features or []):
+            raise ValueError("The saved models were trained with entity features; "
+                             "set processing.entity_features: true or retrain.")
+
+    split = split_entity_features(ml, plan) if io.shard is not None else []
+    if split:
+        if not (cfg.get("sharding") or {}).get("allow_split_entity_state", False):
+            raise ValueError(
+                f"Sharding by hostname splits the user / src_ip state behind {split}; "
+                f"run unsharded, or set sharding.allow_split_entity_state: true "
+                f"to accept partial per-shard counts.")
+        print(f"[WARN] {split} are computed from this shard's hosts only.")
+
+    # NLP Embedding model (not loaded when nothing reads embeddings)
+    embedder = Embedder(cfg["nlp"]["embedding_model"]) if plan.needs_embedding else None
+
+    # Sliding-window UEBA state (persists between runs)
+    ueba_state = UEBAStateStore.from_config(cfg.get("ueba"))
+    sketches = SprayingSketches.from_config(cfg.get("sketches"))
+
+    if args.stream_train:
+        stream_train(io, cfg, args, embedder, ueba_state, sketches, metrics, runner)
+        return
+
+    if args.async_mode:
+        run_async(io, cfg, embedder, ueba_state, sketches, metrics, runner, ml, plan)
+        return
+
     # ===============================================================
     # STEP 1 — READ RAW LOGS
     # ===============================================================
     raw_logs = io.read()
     print(f"[MAIN] Loaded {len(raw_logs)} unprocessed logs from input index.")
 
-    # NLP Embedding model
-    cfg = io.config
-    embedder = Embedder(cfg["nlp"]["embedding_model"])
-
-    processed_logs = []
+    # Nothing new (or an empty shard partition)
+    if not raw_logs:
+        print("[MAIN] No logs to process.")
+        return
 
     # ===============================================================
     # STEP 2 — CLEAN → EMBED → FEATURES
     # ===============================================================
     print("[MAIN] Processing logs (cleaning, embedding, features)...")
 
-    for rec in raw_logs:
-        msg = str(rec.get("message", rec.get("raw_message", "")))
-        clean = clean_message(msg)
-
-        # Embedding (used for ML only)
-        embedding_vec = embedder.encode([clean])[0]
-
-        enriched = {
-            "_id": rec.get("_id"),  # keep ES ID for reference only
-            "@timestamp": rec.get("@timestamp", ""),
-            "hostname": rec.get("hostname", ""),
-            "process": rec.get("process", ""),
-            "raw_message": msg,
-            "clean_message": clean,
-
-            # Store embedding internally (DO NOT write this to ES)
-            "embedding": embedding_vec.tolist(),
-        }
-
-        # Feature extraction
-        feats = build_features(enriched)
-        enriched.update(feats)
-
-        processed_logs.append(enriched)
+    processed_logs = process_records(raw_logs, embedder, ueba_state, sketches, metrics,
+                                     runner, plan)
 
     print(f"[MAIN] Preprocessing complete for {len(processed_logs)} logs.")
 
+    # Persist windowed state unless this run only trains (see stream_train)
+    if args.predict_ml or not args.train_ml:
+        ueba_state.save()
+        sketches.save()
+
     # Save processed logs if using file mode
     if args.input_type == "file":
         io.write(processed_logs)
@@ -95,18 +417,19 @@ def main():
     if args.train_ml:
         print("\n[ML] Training anomaly detection models...")
 
-        ml = MLPipeline()
+        ml = MLPipeline(cfg.get("ml"))
         store = ModelStore("models")
 
-        metrics = ml.train(
-            df=df_struct,
-            auto_label=args.auto_label,
-            label_threshold=args.label_threshold,
-        )
+        with metrics.stage("train", rows=len(df_struct)):
+            train_metrics = ml.train(
+                df=df_struct,
+                auto_label=args.auto_label,
+                label_threshold=args.label_threshold,
+            )
 
-        store.save(ml, metadata=metrics)
+        store.save(ml, metadata=train_metrics)
         print("[ML] Training complete.")
-        print("[ML] Stored model metadata:", metrics)
+        print("[ML] Stored model metadata:", train_metrics)
 
     # ===============================================================
     # STEP 4 — PREDICT ML SCORES
@@ -114,49 +437,31 @@ def main():
     if args.predict_ml:
         print("\n[ML] Performing anomaly scoring...")
 
-        store = ModelStore("models")
-        data = store.load()
-
-        ml = MLPipeline()
-
-        # Restore IsolationForest + scaler
-        ml.isolation_forest = data.get("isolation_forest")
-        ml.scaler = data.get("scaler")
-
-        # Restore LightGBM
-        if "lgb_booster" in data:
-            booster = data["lgb_booster"]
-
-            class LGBWrapper:
-                def __init__(self, booster):
-                    self.booster_ = booster
+        # Reload when --train-ml just replaced the saved models
+        if ml is None or args.train_ml:
+            ml = load_trained_pipeline(cfg)
 
-                def predict(self, X):
-                    return self.booster_.predict(X)
-
-            ml.lgb_model = LGBWrapper(booster)
-
-        if "lgb_meta" in data:
-            ml.lgb_train_features = data["lgb_meta"]["feature_names"]
-
-        scored = ml.predict(df_struct)
+        with metrics.stage("predict", rows=len(df_struct)):
+            scored = ml.predict(df_struct)
 
         # Save to CSV always
-        scored.to_csv("anomaly_scored_logs.csv", index=False)
-        print("[ML] Saved anomaly_scored_logs.csv")
+        scored_path = "anomaly_scored_logs.csv"
+        if io.shard is not None:
+            scored_path = io.shard.shard_path(scored_path)
+
+        with metrics.stage("write_csv", rows=len(scored)):
+            scored.to_csv(scored_path, index=False)
+        print(f"[ML] Saved {scored_path}")
 
         # ===============================================================
-        # STEP 5 — WRITE ENRICHED LOGS TO NEW ES INDEX (NO EMBEDDINGS)
+        # STEP 5 — WRITE ENRICHED LOGS TO NEW ES INDEX
         # ===============================================================
         if args.output_type == "es":
-            print("[MAIN] Writing enriched logs to Elasticsearch index WITHOUT embeddings...")
+            print("[MAIN] Writing enriched logs to Elasticsearch index...")
 
             output_records = scored.to_dict(orient="records")
 
-            # Remove embedding (to avoid ES errors)
-            for rec in output_records:
-                rec.pop("embedding", None)
-
+            # Embeddings are kept as an int8 HNSW dense_vector (see utils/output_index.py)
             io.write_to_es(output_records)
 
             print("[MAIN] Successfully wrote enriched logs into output index.")
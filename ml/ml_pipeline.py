@@ -1,5 +1,8 @@
 # ml/ml_pipeline.py
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
@@ -9,34 +12,89 @@ from sklearn.metrics import roc_auc_score, average_precision_score
 import lightgbm as lgb
 from river.drift import ADWIN
 
+from feature.registry import plan_for
+from ml.novelty_index import NoveltyIndex
+
+
+DEFAULT_LGB_CONFIG = {
+    "fast_cv": True,
+    "cv_folds": 5,
+    "num_boost_round": 500,
+    "early_stopping_rounds": 30,
+    "early_stopping_fraction": 0.2,
+    "num_threads": 0,
+    "parallel_folds": 0,
+    "max_bin": 255,
+}
+
+
+def _bounds(values):
+    """(min, max) of a training-time score distribution, as plain floats."""
+    return float(np.min(values)), float(np.max(values))
+
 
 class MLPipeline:
-    def __init__(self):
+    def __init__(self, config=None):
+        config = config or {}
+        self.random_seed = config.get("random_seed", 42)
+        self.lgb_config = {**DEFAULT_LGB_CONFIG, **(config.get("lgb") or {})}
+        self.iso_config = config.get("isolation_forest") or {}
+        self.novelty_config = config.get("novelty") or {}
+
         self.isolation_forest = None
         self.lgb_model = None
         self.scaler = StandardScaler()
         self.adwin = ADWIN()
         self.lgb_train_features = None
+        self.novelty_index = None
+        # Training-time (min, max) of each raw model score. predict() scales
+        # with these, so a row's scores do not depend on the batch it is in.
+        self.score_bounds = None
 
         self.weights = {
             "isolation": 0.4,
             "lgbm": 0.5,
             "adwin": 0.1
         }
+        self.novelty_weight = float(self.novelty_config.get("weight", 0.2))
 
     # ============================================================
     # FEATURE PREPARATION
     # ============================================================
-    def _prepare_features(self, df, feature_cols=None, fit=False):
+    @staticmethod
+    def select_feature_columns(df):
         exclude = ["timestamp", "@timestamp", "raw_message",
                    "clean_message", "message", "label", "embedding"]
 
+        return [
+            c for c in df.columns
+            if c not in exclude
+            and pd.api.types.is_numeric_dtype(df[c].dtype)
+            and not pd.api.types.is_bool_dtype(df[c].dtype)
+        ]
+
+    def feature_plan(self):
+        """
+        FeaturePlan with only the feature groups the trained models read:
+        the LightGBM / IsolationForest columns, plus the embedder when the
+        novelty index is in use.
+        """
+        return plan_for(
+            self.lgb_train_features or [],
+            embedding=self.novelty_index is not None,
+        )
+
+    def _prepare_features(self, df, feature_cols=None, fit=False, fill_missing=False):
+        """
+        Scaled feature matrix. A column of `feature_cols` missing from `df`
+        raises KeyError, unless `fill_missing` (stream-sampled training,
+        where a column can be absent from every sampled row) zero-fills it.
+        """
         if feature_cols is None:
-            feature_cols = [
-                c for c in df.columns
-                if c not in exclude and np.issubdtype(df[c].dtype, np.number)
-            ]
+            feature_cols = self.select_feature_columns(df)
 
+        if fill_missing:
+            df = df.reindex(columns=feature_cols)
         X = df[feature_cols].fillna(0).astype(float).values
 
         if fit:
@@ -46,12 +104,22 @@ class MLPipeline:
 
         return X, feature_cols
 
+    def _normalise(self, name, values):
+        """
+        Scale raw scores to 0..1 with the training bounds of `name`, clipped.
+        Models saved without bounds fall back to the batch's own min / max.
+        """
+        bounds = (self.score_bounds or {}).get(name)
+        if bounds is None:
+            bounds = _bounds(values) if len(values) else (0.0, 0.0)
+        lo, hi = bounds
+        return np.clip((values - lo) / (hi - lo + 1e-9), 0.0, 1.0)
+
     # ============================================================
     # AUTO LABELING
     # ============================================================
     def _auto_label(self, df, X, threshold=0.8):
-        iso_raw = self.isolation_forest.decision_function(X)
-        iso_score = 1 - (iso_raw - iso_raw.min()) / (iso_raw.max() - iso_raw.min() + 1e-9)
+        iso_score = 1 - self._normalise("isolation", self.isolation_forest.decision_function(X))
 
         df["label"] = (iso_score >= threshold).astype(int)
         print(f"[Auto-Label] Applied threshold {threshold} → {df['label'].sum()} anomalies")
@@ -61,18 +129,29 @@ class MLPipeline:
     # ============================================================
     # TRAINING PIPELINE
     # ============================================================
-    def train(self, df, auto_label=True, label_threshold=0.8):
+    def train(self, df, auto_label=True, label_threshold=0.8,
+              feature_cols=None, prefit_scaler=False):
+        """
+        Train on `df`. With `prefit_scaler=True` the scaler is taken as
+        already fitted (e.g. by TrainingSampler over the full stream) and
+        `feature_cols` must be the columns it was fitted on.
+        """
         print("\n[TRAIN] Starting ML training...")
 
-        X, feature_cols = self._prepare_features(df, fit=True)
+        X, feature_cols = self._prepare_features(
+            df, feature_cols=feature_cols, fit=not prefit_scaler, fill_missing=prefit_scaler
+        )
         self.lgb_train_features = feature_cols
 
         print("[TRAIN] Training Isolation Forest...")
         self.isolation_forest = IsolationForest(
+            n_estimators=self.iso_config.get("n_estimators", 100),
+            max_samples=self.iso_config.get("max_samples", "auto"),
             contamination="auto",
             n_jobs=-1,
             random_state=42
         ).fit(X)
+        self.score_bounds = {"isolation": _bounds(self.isolation_forest.decision_function(X))}
 
         has_label = "label" in df.columns
 
@@ -81,6 +160,11 @@ class MLPipeline:
             df = self._auto_label(df, X, threshold=label_threshold)
             has_label = True
 
+        self._fit_novelty_index(df[df.label == 0] if has_label else df)
+        if self.novelty_index is not None:
+            knn = self.novelty_index.knn_distance(self._embedding_matrix(df))
+            self.score_bounds["knn"] = _bounds(knn)
+
         if not has_label:
             print("[TRAIN] No labels available → LGBM skipped.")
             self.lgb_model = None
@@ -97,11 +181,46 @@ class MLPipeline:
         normal_sampled = normal.sample(min(len(normal), len(anomaly) * 4), random_state=42)
         df_bal = pd.concat([normal_sampled, anomaly]).sample(frac=1, random_state=42)
 
-        X_bal, _ = self._prepare_features(df_bal, feature_cols=feature_cols, fit=False)
+        X_bal, _ = self._prepare_features(df_bal, feature_cols=feature_cols, fit=False,
+                                          fill_missing=prefit_scaler)
         y_bal = df_bal["label"].astype(int).values
 
+        if self.lgb_config["fast_cv"]:
+            result = self._train_lgb_fast(X_bal, y_bal)
+        else:
+            result = self._train_lgb_legacy(X_bal, y_bal)
+
+        self.score_bounds["lgbm"] = _bounds(self.lgb_model.predict(X))
+        return result
+
+    # ============================================================
+    # EMBEDDING NOVELTY INDEX
+    # ============================================================
+    @staticmethod
+    def _embedding_matrix(df):
+        return np.asarray(df["embedding"].tolist(), dtype=np.float32)
+
+    def _fit_novelty_index(self, df_normal):
+        self.novelty_index = None
+        if not self.novelty_config.get("enabled", True):
+            return
+        if "embedding" not in df_normal.columns or df_normal.empty:
+            print("[TRAIN] No embeddings available → novelty index skipped.")
+            return
+
+        print("[TRAIN] Building embedding novelty index...")
+        self.novelty_index = NoveltyIndex.from_config(
+            self.novelty_config, seed=self.random_seed
+        ).fit(self._embedding_matrix(df_normal))
+
+    # ============================================================
+    # LIGHTGBM: SEQUENTIAL CV (ORIGINAL MODE)
+    # ============================================================
+    def _train_lgb_legacy(self, X_bal, y_bal):
+        params = {"objective": "binary", "metric": "auc", "verbosity": -1}
+
         print("[TRAIN] Running LightGBM CV...")
-        tscv = TimeSeriesSplit(n_splits=5)
+        tscv = TimeSeriesSplit(n_splits=self.lgb_config["cv_folds"])
 
         aucs, prs = [], []
 
@@ -113,7 +232,7 @@ class MLPipeline:
             valid_data = lgb.Dataset(X_val, label=y_val)
 
             model = lgb.train(
-                {"objective": "binary", "metric": "auc", "verbosity": -1},
+                params,
                 train_data,
                 valid_sets=[valid_data]
             )
@@ -131,13 +250,125 @@ class MLPipeline:
 
         print("[TRAIN] Training final LightGBM model...")
         full_data = lgb.Dataset(X_bal, label=y_bal)
+        self.lgb_model = lgb.train(params, full_data)
+        self.lgb_model.booster_ = self.lgb_model
+
+        return {"cv_auc_mean": cv_auc, "cv_pr_mean": cv_pr}
+
+    # ============================================================
+    # LIGHTGBM: SHARED BINS, PARALLEL FOLDS, EARLY STOPPING
+    # ============================================================
+    def _thread_budget(self, n_folds):
+        cfg = self.lgb_config
+        budget = cfg["num_threads"] or os.cpu_count() or 1
+        workers = min(n_folds, cfg["parallel_folds"] or budget)
+        return budget, max(1, workers), max(1, budget // max(1, workers))
+
+    def _early_stopping_split(self, train_idx, y_bal):
+        """
+        Split a fold's training indices into a part to fit on and its last
+        `early_stopping_fraction` to pick the boosting iteration on, so the
+        validation fold only scores. Returns (train_idx, None) if either
+        part would miss a class.
+        """
+        n_stop = int(len(train_idx) * self.lgb_config["early_stopping_fraction"])
+        if n_stop < 1 or n_stop >= len(train_idx):
+            return train_idx, None
+
+        fit_idx, stop_idx = train_idx[:-n_stop], train_idx[-n_stop:]
+        if len(np.unique(y_bal[fit_idx])) < 2 or len(np.unique(y_bal[stop_idx])) < 2:
+            return train_idx, None
+        return fit_idx, stop_idx
+
+    def _train_lgb_fast(self, X_bal, y_bal):
+        cfg = self.lgb_config
+        n_folds = cfg["cv_folds"]
+        budget, workers, fold_threads = self._thread_budget(n_folds)
+
+        # Dataset-level params must be identical for the parent and every
+        # subset, otherwise LightGBM refuses to reuse the bins.
+        ds_params = {"max_bin": cfg["max_bin"], "verbosity": -1}
+        params = {
+            "objective": "binary",
+            "metric": "auc",
+            "verbosity": -1,
+            "seed": self.random_seed,
+            **ds_params,
+        }
+
+        # Bin once; every fold is a subset of these bins
+        full_data = lgb.Dataset(X_bal, label=y_bal, params=ds_params, free_raw_data=False)
+        full_data.construct()
+
+        folds = []
+        for train_idx, val_idx in TimeSeriesSplit(n_splits=n_folds).split(X_bal):
+            fit_idx, stop_idx = self._early_stopping_split(train_idx, y_bal)
+            if stop_idx is None:
+                # No usable inner slice: stop on the validation fold itself
+                fit_idx, stop_idx = train_idx, val_idx
+            train_data = full_data.subset(fit_idx.tolist()).construct()
+            stop_data = full_data.subset(stop_idx.tolist()).construct()
+            folds.append((train_data, stop_data, val_idx, stop_idx is val_idx))
+
+        def run_fold(fold):
+            train_data, stop_data, val_idx, _ = fold
+            model = lgb.train(
+                {**params, "num_threads": fold_threads},
+                train_data,
+                num_boost_round=cfg["num_boost_round"],
+                valid_sets=[stop_data],
+                callbacks=[lgb.early_stopping(cfg["early_stopping_rounds"], verbose=False)],
+            )
+            best = model.best_iteration or model.current_iteration()
+            y_val = y_bal[val_idx]
+            y_pred = model.predict(X_bal[val_idx], num_iteration=best)
+            return (
+                roc_auc_score(y_val, y_pred),
+                average_precision_score(y_val, y_pred),
+                best,
+            )
+
+        print(f"[TRAIN] Running LightGBM CV ({n_folds} folds, "
+              f"{workers} parallel x {fold_threads} threads)...")
+
+        # LightGBM releases the GIL while boosting, so threads suffice
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run_fold, folds))
+
+        aucs, prs, best_iters = zip(*results)
+
+        cv_auc = float(np.mean(aucs))
+        cv_pr = float(np.mean(prs))
+        best_iteration = max(1, int(round(np.mean(best_iters))))
+
+        print(f"[TRAIN] Training final LightGBM model ({best_iteration} rounds)...")
         self.lgb_model = lgb.train(
-            {"objective": "binary", "metric": "auc"},
-            full_data
+            {**params, "num_threads": budget},
+            full_data,
+            num_boost_round=best_iteration,
         )
         self.lgb_model.booster_ = self.lgb_model
 
-        return {"cv_auc_mean": cv_auc, "cv_pr_mean": cv_pr}
+        # A fold that picked its iteration on the fold it is scored on gives
+        # an optimistic number: report it under its own name, not as CV.
+        if any(on_val for *_, on_val in folds):
+            print(f"[TRAIN] Early-stopping AUC = {cv_auc:.4f} (not held out)")
+            print(f"[TRAIN] Early-stopping PR  = {cv_pr:.4f}")
+            return {
+                "cv_auc_mean": None,
+                "cv_pr_mean": None,
+                "early_stopping_auc_mean": cv_auc,
+                "early_stopping_pr_mean": cv_pr,
+                "best_iteration": best_iteration,
+            }
+
+        print(f"[TRAIN] CV-AUC = {cv_auc:.4f}")
+        print(f"[TRAIN] CV-PR  = {cv_pr:.4f}")
+        return {
+            "cv_auc_mean": cv_auc,
+            "cv_pr_mean": cv_pr,
+            "best_iteration": best_iteration,
+        }
 
     # ============================================================
     # PREDICTION PIPELINE
@@ -148,13 +379,11 @@ class MLPipeline:
         df_out = df.copy()
         X, _ = self._prepare_features(df, feature_cols=self.lgb_train_features, fit=False)
 
-        iso_raw = self.isolation_forest.decision_function(X)
-        iso_score = 1 - (iso_raw - iso_raw.min()) / (iso_raw.max() - iso_raw.min() + 1e-9)
+        iso_score = 1 - self._normalise("isolation", self.isolation_forest.decision_function(X))
         df_out["iso_score"] = iso_score
 
         if self.lgb_model is not None:
-            lgb_pred = self.lgb_model.predict(X)
-            lgb_score = (lgb_pred - lgb_pred.min()) / (lgb_pred.max() - lgb_pred.min() + 1e-9)
+            lgb_score = self._normalise("lgbm", self.lgb_model.predict(X))
         else:
             lgb_score = np.zeros(len(df))
 
@@ -174,6 +403,17 @@ class MLPipeline:
             w["adwin"] * df_out["adwin_flag"]
         )
 
+        if self.novelty_index is not None and "embedding" in df.columns:
+            knn = self.novelty_index.knn_distance(self._embedding_matrix(df))
+            knn_score = self._normalise("knn", knn)
+
+            df_out["knn_distance"] = knn
+            df_out["knn_score"] = knn_score
+            df_out["fusion_score"] = (
+                (1 - self.novelty_weight) * df_out["fusion_score"] +
+                self.novelty_weight * knn_score
+            )
+
         df_out["is_anomaly"] = (df_out["fusion_score"] >= 0.5).astype(int)
 
         print("[PREDICT] Inference complete.")
@@ -3,6 +3,8 @@ import joblib
 import json
 import lightgbm as lgb
 
+from ml.novelty_index import NoveltyIndex
+
 class ModelStore:
     def __init__(self, path="models"):
         self.path = path
@@ -21,6 +23,21 @@ class ModelStore:
                 os.path.join(self.path, "lgb_meta.joblib")
             )
 
+        novelty_path = os.path.join(self.path, "novelty_index.npz")
+        if pipeline.novelty_index is not None:
+            pipeline.novelty_index.save(novelty_path)
+        elif os.path.exists(novelty_path):
+            # An index from an earlier training run no longer matches these models
+            os.remove(novelty_path)
+            print(f"[ML] Removed stale novelty index {novelty_path}")
+
+        bounds_path = os.path.join(self.path, "score_bounds.json")
+        if pipeline.score_bounds is not None:
+            with open(bounds_path, "w") as f:
+                json.dump(pipeline.score_bounds, f)
+        elif os.path.exists(bounds_path):
+            os.remove(bounds_path)
+
         if metadata:
             with open(os.path.join(self.path, "metadata.json"), "w") as f:
                 json.dump(metadata, f)
@@ -40,4 +57,11 @@ class ModelStore:
         if os.path.exists(os.path.join(self.path, "lgb_meta.joblib")):
             ms["lgb_meta"] = joblib.load(os.path.join(self.path, "lgb_meta.joblib"))
 
+        if os.path.exists(os.path.join(self.path, "novelty_index.npz")):
+            ms["novelty_index"] = NoveltyIndex.load(os.path.join(self.path, "novelty_index.npz"))
+
+        if os.path.exists(os.path.join(self.path, "score_bounds.json")):
+            with open(os.path.join(self.path, "score_bounds.json")) as f:
+                ms["score_bounds"] = {k: tuple(v) for k, v in json.load(f).items()}
+
         return ms
@@ -0,0 +1,220 @@
+# ml/novelty_index.py
+
+import json
+
+import numpy as np
+
+
+def _normalize(X):
+    X = np.asarray(X, dtype=np.float32)
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.maximum(norms, 1e-12)
+
+
+def _row_keys(codes):
+    """One opaque bytes key per row, for np.unique based de-duplication."""
+    codes = np.ascontiguousarray(codes)
+    return codes.view(np.dtype((np.void, codes.dtype.itemsize * codes.shape[1]))).ravel()
+
+
+class NoveltyIndex:
+    """
+    Nearest-neighbour index over message embeddings of normal traffic.
+
+    IVF layout: spherical k-means splits the (de-duplicated) vectors into
+    `n_lists` clusters and a query only scans the `n_probe` closest ones,
+    so lookups are sublinear in the index size. Vectors are stored int8
+    (per-dimension symmetric scale) or float16.
+
+    `knn_distance(E)` is the cosine distance from each row of E to its
+    nearest indexed neighbour: ~0 for messages seen in training, growing
+    for semantically new ones.
+    """
+
+    def __init__(self, n_lists="auto", n_probe=8, storage="int8", kmeans_iters=10,
+                 max_train=100000, query_batch=8192, seed=42):
+        if storage not in ("int8", "float16"):
+            raise ValueError("storage must be 'int8' or 'float16'")
+
+        self.n_lists = n_lists
+        self.n_probe = int(n_probe)
+        self.storage = storage
+        self.kmeans_iters = int(kmeans_iters)
+        self.max_train = int(max_train)
+        self.query_batch = int(query_batch)
+        self.seed = seed
+
+        self.centroids = None   # (n_lists, d) float32, unit norm
+        self.codes = None       # (n, d) int8 / float16, grouped by list
+        self.offsets = None     # (n_lists + 1,) list boundaries into `codes`
+        self.scale = None       # (d,) float32 dequantisation scale
+
+    @classmethod
+    def from_config(cls, cfg, seed=42):
+        """Build an index from the `ml.novelty` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            n_lists=cfg.get("n_lists", "auto"),
+            n_probe=cfg.get("n_probe", 8),
+            storage=cfg.get("storage", "int8"),
+            kmeans_iters=cfg.get("kmeans_iters", 10),
+            max_train=cfg.get("max_train", 100000),
+            query_batch=cfg.get("query_batch", 8192),
+            seed=seed,
+        )
+
+    def __len__(self):
+        return 0 if self.codes is None else len(self.codes)
+
+    # -----------------------------------------------------
+    # Quantisation
+    # -----------------------------------------------------
+    def _encode(self, X):
+        if self.storage == "float16":
+            return X.astype(np.float16)
+        return np.clip(np.rint(X / self.scale), -127, 127).astype(np.int8)
+
+    # -----------------------------------------------------
+    # Spherical k-means
+    # -----------------------------------------------------
+    def _assign(self, X, C):
+        out = np.empty(len(X), dtype=np.int64)
+        for i in range(0, len(X), self.query_batch):
+            out[i:i + self.query_batch] = np.argmax(X[i:i + self.query_batch] @ C.T, axis=1)
+        return out
+
+    def _kmeans(self, X, k, rng):
+        C = X[rng.choice(len(X), k, replace=False)].copy()
+
+        for _ in range(self.kmeans_iters):
+            assign = self._assign(X, C)
+            counts = np.bincount(assign, minlength=k)
+
+            sums = np.zeros_like(C)
+            np.add.at(sums, assign, X)
+
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = X[rng.choice(len(X), int(empty.sum()), replace=False)]
+                counts[empty] = 1
+
+            C = _normalize(sums / counts[:, None])
+
+        return C
+
+    # -----------------------------------------------------
+    # Build
+    # -----------------------------------------------------
+    def fit(self, embeddings):
+        X = _normalize(embeddings)
+        if len(X) == 0:
+            raise ValueError("cannot build a novelty index from 0 embeddings")
+
+        rng = np.random.default_rng(self.seed)
+
+        self.scale = np.maximum(np.abs(X).max(axis=0), 1e-6).astype(np.float32) / 127.0
+        if self.storage == "float16":
+            self.scale = np.ones(X.shape[1], dtype=np.float32)
+
+        # Repeated log templates embed (near-)identically: keep one copy
+        codes = self._encode(X)
+        _, first = np.unique(_row_keys(codes), return_index=True)
+        first.sort()
+        X, codes = X[first], codes[first]
+
+        n = len(X)
+        k = self.n_lists
+        if k == "auto":
+            k = int(np.sqrt(n))
+        k = max(1, min(int(k), n))
+
+        train = X if n <= self.max_train else X[rng.choice(n, self.max_train, replace=False)]
+        self.centroids = self._kmeans(train, min(k, len(train)), rng)
+
+        assign = self._assign(X, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        self.codes = codes[order]
+        self.offsets = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+
+        print(f"[NOVELTY] Indexed {n} unique embeddings (from {len(embeddings)}) "
+              f"in {len(self.centroids)} lists, {self.storage} storage")
+        return self
+
+    # -----------------------------------------------------
+    # Query
+    # -----------------------------------------------------
+    def _search(self, Q):
+        """Best cosine similarity per row of unit-norm Q among the probed lists."""
+        n_lists = len(self.centroids)
+        probe = max(1, min(self.n_probe, n_lists))
+        m = len(Q)
+
+        cs = Q @ self.centroids.T
+        if probe < n_lists:
+            lists = np.argpartition(-cs, probe - 1, axis=1)[:, :probe]
+        else:
+            lists = np.broadcast_to(np.arange(n_lists), (m, n_lists))
+
+        # Group (query, list) pairs by list, then scan each list once
+        flat_l = lists.ravel()
+        flat_q = np.repeat(np.arange(m), probe)
+        order = np.argsort(flat_l, kind="stable")
+        flat_l, flat_q = flat_l[order], flat_q[order]
+        bounds = np.searchsorted(flat_l, np.arange(n_lists + 1))
+
+        Qs = Q * self.scale
+        best = np.full(m, -np.inf, dtype=np.float32)
+
+        for l in np.flatnonzero(np.diff(bounds)):
+            a, b = self.offsets[l], self.offsets[l + 1]
+            if a == b:
+                continue
+            qs = flat_q[bounds[l]:bounds[l + 1]]
+            sims = Qs[qs] @ self.codes[a:b].astype(np.float32).T
+            best[qs] = np.maximum(best[qs], sims.max(axis=1))
+
+        return best
+
+    def knn_distance(self, embeddings):
+        """Cosine distance (0..2) from each embedding to its nearest indexed neighbour."""
+        Q = _normalize(embeddings)
+        if len(Q) == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        # Score each distinct (quantised) query vector once
+        _, first, inverse = np.unique(_row_keys(self._encode(Q)),
+                                      return_index=True, return_inverse=True)
+        U = Q[first]
+
+        best = np.empty(len(U), dtype=np.float32)
+        for i in range(0, len(U), self.query_batch):
+            best[i:i + self.query_batch] = self._search(U[i:i + self.query_batch])
+
+        dist = np.where(np.isfinite(best), 1.0 - best, 1.0)
+        return np.clip(dist, 0.0, 2.0)[inverse.ravel()]
+
+    # -----------------------------------------------------
+    # Persistence
+    # -----------------------------------------------------
+    def save(self, path):
+        params = {
+            "n_probe": self.n_probe,
+            "storage": self.storage,
+            "kmeans_iters": self.kmeans_iters,
+            "max_train": self.max_train,
+            "query_batch": self.query_batch,
+            "seed": self.seed,
+        }
+        np.savez(path, centroids=self.centroids, codes=self.codes, offsets=self.offsets,
+                 scale=self.scale, params=np.array(json.dumps(params)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as z:
+            idx = cls(**json.loads(str(z["params"])))
+            idx.centroids = z["centroids"]
+            idx.codes = z["codes"]
+            idx.offsets = z["offsets"]
+            idx.scale = z["scale"]
+        idx.n_lists = len(idx.centroids)
+        return idx
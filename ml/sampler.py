@@ -0,0 +1,170 @@
+# ml/sampler.py
+
+import random
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+
+class TrainingSampler:
+    """
+    Bounded training set built from a chunked input stream.
+
+    - Rows are kept in per-stratum reservoirs (Algorithm R), so every
+      hostname/process (or message template) is represented no matter how
+      skewed the stream is. At most `max_strata` strata get their own
+      reservoir; later ones share one "other" reservoir. Every stratum,
+      own or overflowed, counts as one share of `capacity`: an own
+      reservoir holds one share, "other" the rest, so memory never
+      exceeds `capacity` rows and the tail keeps a proportional weight.
+    - The StandardScaler is fitted with partial_fit over *every* chunk, so
+      scaling statistics come from the full stream, not just the sample.
+    """
+
+    OTHER = "\x00other"
+
+    def __init__(self, capacity=200000, strata="auto", seed=42,
+                 keep_embeddings=False, feature_columns=None, max_strata=1000):
+        self.capacity = int(capacity)
+        # Reserve one slot for the shared overflow reservoir
+        self.max_strata = max(1, min(int(max_strata), self.capacity - 1))
+        self.strata = strata
+        self.keep_embeddings = keep_embeddings
+        self.rng = random.Random(seed)
+
+        self.scaler = StandardScaler()
+        self.feature_cols = feature_columns
+        self.strata_cols = None
+
+        self.reservoirs = {}   # stratum -> list of row dicts
+        self.seen = {}         # stratum -> rows seen so far
+        self.total_seen = 0
+        self.overflow_keys = set()   # distinct strata sent to OTHER
+
+    @classmethod
+    def from_config(cls, cfg, seed=42):
+        """Build a sampler from the `ml.sampling` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            capacity=cfg.get("capacity", 200000),
+            strata=cfg.get("strata", "auto"),
+            keep_embeddings=cfg.get("keep_embeddings", False),
+            max_strata=cfg.get("max_strata", 1000),
+            seed=seed,
+        )
+
+    # -----------------------------------------------------
+    # Strata
+    # -----------------------------------------------------
+    def _resolve_strata(self, df):
+        if isinstance(self.strata, (list, tuple)):
+            return [c for c in self.strata if c in df.columns]
+
+        if self.strata == "template" or (self.strata == "auto" and "template" in df.columns):
+            return ["template"]
+
+        return [c for c in ("hostname", "process") if c in df.columns]
+
+    def _own_strata(self):
+        return len(self.reservoirs) - (self.OTHER in self.reservoirs)
+
+    def _share(self):
+        strata = self._own_strata() + len(self.overflow_keys)
+        return max(1, self.capacity // max(1, strata))
+
+    def _cap(self, key):
+        if key == self.OTHER:
+            return max(1, self.capacity - self._own_strata() * self._share())
+        return self._share()
+
+    def _shrink(self):
+        for key, res in self.reservoirs.items():
+            cap = self._cap(key)
+            if len(res) > cap:
+                self.reservoirs[key] = self.rng.sample(res, cap)
+
+    # -----------------------------------------------------
+    # Streaming
+    # -----------------------------------------------------
+    def consume(self, df, feature_selector):
+        """
+        Fold one chunk (DataFrame of processed logs) into the sample.
+        `feature_selector(df)` returns the numeric feature columns; it is
+        only called on the first chunk so the scaler keeps a fixed shape.
+        """
+        if df.empty:
+            return
+
+        if self.feature_cols is None:
+            self.feature_cols = feature_selector(df)
+            self.strata_cols = self._resolve_strata(df)
+            print(f"[SAMPLE] {len(self.feature_cols)} features, "
+                  f"strata by {self.strata_cols or 'none'}")
+
+        X = df.reindex(columns=self.feature_cols).fillna(0).astype(float).values
+        self.scaler.partial_fit(X)
+
+        if not self.keep_embeddings and "embedding" in df.columns:
+            df = df.drop(columns=["embedding"])
+
+        if self.strata_cols:
+            keys = df[self.strata_cols].astype(str).agg("|".join, axis=1).tolist()
+        else:
+            keys = [""] * len(df)
+
+        for key, row in zip(keys, df.to_dict(orient="records")):
+            self._add(key, row)
+
+        self.total_seen += len(df)
+
+    def _add(self, key, row):
+        if key not in self.reservoirs:
+            old_share = self._share()
+
+            if self._own_strata() >= self.max_strata:
+                # Tail strata share one reservoir
+                self.overflow_keys.add(key)
+                key = self.OTHER
+
+            if key not in self.reservoirs:
+                self.reservoirs[key] = []
+                self.seen[key] = 0
+
+            if self._share() < old_share:
+                self._shrink()
+
+        res = self.reservoirs[key]
+        self.seen[key] += 1
+        cap = self._cap(key)
+
+        if len(res) < cap:
+            res.append(row)
+        else:
+            j = self.rng.randrange(self.seen[key])
+            if j < cap:
+                res[j] = row
+
+    def sample(self):
+        """The current sample as a DataFrame (stream order is not kept)."""
+        rows = [r for res in self.reservoirs.values() for r in res]
+        df = pd.DataFrame(rows)
+
+        kept = len(df)
+        print(f"[SAMPLE] Kept {kept} of {self.total_seen} rows "
+              f"across {len(self.reservoirs)} strata.")
+
+        if "@timestamp" in df.columns:
+            # TimeSeriesSplit downstream expects rows in time order
+            df = df.sort_values("@timestamp", kind="stable").reset_index(drop=True)
+
+        return df
+
+    def stats(self):
+        sizes = np.array([len(r) for r in self.reservoirs.values()] or [0])
+        return {
+            "rows_seen": self.total_seen,
+            "rows_kept": int(sizes.sum()),
+            "strata": len(self.reservoirs),
+            "overflow_strata": len(self.overflow_keys),
+        }
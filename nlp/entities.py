@@ -2,7 +2,6 @@
 
 import re
 import json
-from transformers import pipeline
 
 
 class LogEntityExtractor:
@@ -12,10 +11,16 @@ class LogEntityExtractor:
         A hybrid NER system:
         - Regex/entity extraction (primary)
         - Log-pattern extraction
-        - ML fallback
+        - ML fallback (skipped when ml_model is None)
         """
+        if ml_model is None:
+            self.ner_pipe = None
+            return
+
         print(f"[NER] Loading ML model (fallback): {ml_model}")
         try:
+            # Imported here so regex-only extractors (e.g. in worker processes) stay light
+            from transformers import pipeline
             self.ner_pipe = pipeline( "ner", model=ml_model, aggregation_strategy="simple" )
         except Exception as e:
             print("[NER] ML model load failed, fallback to regex only.")
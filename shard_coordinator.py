@@ -0,0 +1,166 @@
+# shard_coordinator.py
+
+"""
+Runs main.py as N hostname shards and merges their run reports.
+
+    # 4 shards on this machine
+    python shard_coordinator.py --num-shards 4 --in es --out es --predict-ml
+
+    # 8 shards over two nodes, then merge (shared or copied report_dir)
+    node-a$ python shard_coordinator.py --num-shards 8 --shards 0-3 --predict-ml
+    node-b$ python shard_coordinator.py --num-shards 8 --shards 4-7 --predict-ml
+    any$    python shard_coordinator.py --num-shards 8 --merge-only
+
+Arguments the coordinator does not know are passed on to every main.py.
+Each shard owns a consistent-hash partition of hostname (utils/sharding.py),
+so no record is scored twice and no host's state is split across shards.
+
+Shard stdout goes to <report_dir>/main_shard<i>of<N>.log. The merged report
+<report_dir>/main_sharded_report.json (+ .prom) sums stage seconds and
+rows over shards; info["shards"] keeps per-shard rows and durations, to
+spot partition skew.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import yaml
+
+from utils.metrics import RunMetrics
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+def parse_shards(spec, num_shards):
+    """"0-3,6" -> [0, 1, 2, 3, 6]; None -> all shards."""
+    if not spec:
+        return list(range(num_shards))
+
+    shards = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition("-")
+        shards.update(range(int(lo), int(hi or lo) + 1))
+
+    bad = [s for s in shards if not 0 <= s < num_shards]
+    if bad:
+        raise ValueError(f"shards {bad} outside [0, {num_shards})")
+    return sorted(shards)
+
+
+def report_name(shard, num_shards):
+    return f"main_shard{shard}of{num_shards}"
+
+
+# -----------------------------------------------------
+# Launch
+# -----------------------------------------------------
+def run_shards(shards, num_shards, main_args, config_path, report_dir):
+    """Start one main.py per shard, wait for all; returns {shard: exit code}."""
+    os.makedirs(report_dir, exist_ok=True)
+
+    procs = {}
+    for shard in shards:
+        log_path = os.path.join(report_dir, report_name(shard, num_shards) + ".log")
+        cmd = [sys.executable, MAIN, "--config", config_path,
+               "--shard", str(shard), "--num-shards", str(num_shards), *main_args]
+        log = open(log_path, "w")
+        procs[shard] = (subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT), log, time.time())
+        print(f"[SHARD] Started shard {shard}/{num_shards} (log: {log_path})")
+
+    codes = {}
+    for shard, (proc, log, t0) in procs.items():
+        codes[shard] = proc.wait()
+        log.close()
+        status = "ok" if codes[shard] == 0 else f"FAILED (exit {codes[shard]})"
+        print(f"[SHARD] Shard {shard} {status} after {time.time() - t0:.1f}s")
+
+    return codes
+
+
+# -----------------------------------------------------
+# Merge
+# -----------------------------------------------------
+def merge_reports(report_dir, num_shards, shards):
+    merged = RunMetrics("main_sharded")
+    per_shard, missing = {}, []
+
+    for shard in shards:
+        path = os.path.join(report_dir, report_name(shard, num_shards) + "_report.json")
+        if not os.path.exists(path):
+            missing.append(shard)
+            continue
+
+        with open(path) as f:
+            report = json.load(f)
+
+        run = RunMetrics.from_dict(report)
+        merged.merge(run)
+
+        rows = run.stages["clean"].rows if "clean" in run.stages else 0
+        per_shard[shard] = {"rows": rows, "duration_seconds": report.get("duration_seconds")}
+
+    if missing:
+        print(f"[SHARD] No run report for shards {missing}; merged report is partial.")
+
+    total_rows = sum(s["rows"] for s in per_shard.values())
+    wall = max((s["duration_seconds"] or 0 for s in per_shard.values()), default=0)
+
+    merged.info.update({
+        "num_shards": num_shards,
+        "shards": per_shard,
+        "missing_shards": missing,
+        "rows": total_rows,
+        # Shards run in parallel: the slowest one bounds the run
+        "wall_seconds": wall,
+        "rows_per_sec": round(total_rows / wall, 1) if wall > 0 else None,
+    })
+
+    print(f"[SHARD] Merged {len(per_shard)}/{len(shards)} shard reports: "
+          f"{total_rows} rows, slowest shard {wall:.1f}s")
+    for shard, s in sorted(per_shard.items()):
+        print(f"[SHARD]   shard {shard}: {s['rows']:>9} rows  {s['duration_seconds'] or 0:8.1f}s")
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--num-shards", type=int, required=True)
+    parser.add_argument("--shards", default=None,
+                        help="shards to run on this node, e.g. 0-3 (default: all)")
+    parser.add_argument("--merge-only", action="store_true",
+                        help="only merge existing shard reports")
+    parser.add_argument("--config", dest="config_path", default="config.yml")
+    args, main_args = parser.parse_known_args()
+
+    if any(a.startswith(("--shard", "--num-shards")) for a in main_args):
+        parser.error("--shard / --num-shards are set per process by the coordinator")
+
+    try:
+        shards = parse_shards(args.shards, args.num_shards)
+    except ValueError as e:
+        parser.error(str(e))
+
+    with open(args.config_path) as f:
+        cfg = yaml.safe_load(f)
+    metrics_cfg = cfg.get("metrics") or {}
+    report_dir = metrics_cfg.get("report_dir", "reports")
+
+    codes = {}
+    if not args.merge_only:
+        codes = run_shards(shards, args.num_shards, main_args, args.config_path, report_dir)
+
+    merged = merge_reports(report_dir, args.num_shards, shards)
+    merged.info["exit_codes"] = codes
+    merged.summary()
+    merged.export(metrics_cfg)
+
+    if any(codes.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import copy
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from async_runner import AsyncPipeline
+from feature.registry import plan_for
+from ml.ml_pipeline import MLPipeline
+from utils.io_manager import IOManager
+from utils.metrics import RunMetrics
+from utils.process_pool import StageRunner
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "config.yml")
+COLUMNS = ["hour", "message_length"]
+N = 1000
+
+
+@pytest.fixture(scope="module")
+def logs():
+    rng = np.random.default_rng(0)
+    return [{
+        "_id": f"id{i}",
+        "@timestamp": f"2026-01-01T{(i // 60) % 24:02d}:{i % 60:02d}:00Z",
+        "hostname": "web-1",
+        "process": "sshd",
+        "raw_message": "Failed password for root" if i % 25 == 0 else "x" * int(rng.integers(10, 120)),
+    } for i in range(N)]
+
+
+@pytest.fixture(scope="module")
+def ml(logs):
+    df = pd.DataFrame(_features(logs))
+    df["label"] = [int(i % 25 == 0) for i in range(N)]
+    ml = MLPipeline({"lgb": {"cv_folds": 3, "num_boost_round": 20}, "novelty": {"enabled": False}})
+    ml.train(df, feature_cols=COLUMNS, auto_label=False)
+    return ml
+
+
+def _features(chunk):
+    rows = StageRunner().run(chunk, plan_for(COLUMNS)).to_rows()
+    return [{"_id": rec["_id"], **row} for rec, row in zip(chunk, rows)]
+
+
+def _io(tmp_path, logs):
+    src = tmp_path / "in.csv"
+    pd.DataFrame(logs).to_csv(src, index=False)
+
+    io = IOManager(CONFIG)
+    io.config["input"].update({"type": "file", "file": str(src)})
+    io.config["output"].update({"type": "file", "file": str(tmp_path / "out.csv")})
+    return io
+
+
+def _scorer(ml):
+    def process_chunk(chunk):
+        return ml.predict(pd.DataFrame(_features(chunk))).to_dict(orient="records")
+    return process_chunk
+
+
+def test_file_to_file_writes_every_row_and_matches_batch_scoring(tmp_path, logs, ml):
+    io = _io(tmp_path, logs)
+    pipeline = AsyncPipeline(io, _scorer(copy.deepcopy(ml)), RunMetrics("test"),
+                             queue_size=2, writers=2)
+    pipeline.run(chunk_size=97)
+
+    out = pd.read_csv(io.config["output"]["file"])
+    assert pipeline.rows_in == pipeline.rows_out == N
+    assert sorted(out["_id"]) == sorted(rec["_id"] for rec in logs)
+
+    batch = copy.deepcopy(ml).predict(pd.DataFrame(_features(logs)))
+    out = out.set_index("_id").loc[batch["_id"]]
+    for col in ("iso_score", "lgbm_score", "adwin_flag", "fusion_score", "is_anomaly"):
+        np.testing.assert_allclose(out[col].values, batch[col].values, rtol=1e-6, err_msg=col)
+
+
+def test_compute_error_stops_the_reader_and_writers(tmp_path, logs, ml):
+    io = _io(tmp_path, logs)
+    score = _scorer(copy.deepcopy(ml))
+    seen = []
+
+    def process_chunk(chunk):
+        seen.append(len(chunk))
+        if len(seen) == 3:
+            raise RuntimeError("boom")
+        return score(chunk)
+
+    pipeline = AsyncPipeline(io, process_chunk, RunMetrics("test"), queue_size=1, writers=2)
+    with pytest.raises(RuntimeError, match="boom"):
+        pipeline.run(chunk_size=10)
+
+    # The reader was blocked on the full queue and did not read the rest;
+    # chunks still being written when the error hit are not counted
+    assert len(seen) == 3
+    assert io.metrics.stages["read"].rows < N
+    assert pipeline.rows_out <= 20
+
+
+def test_writer_error_stops_the_pipeline(tmp_path, logs, ml, monkeypatch):
+    io = _io(tmp_path, logs)
+    pipeline = AsyncPipeline(io, _scorer(copy.deepcopy(ml)), RunMetrics("test"),
+                             queue_size=1, writers=1)
+
+    def fail(records):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pipeline, "_write_csv", fail)
+    with pytest.raises(OSError, match="disk full"):
+        pipeline.run(chunk_size=10)
+
+    assert pipeline.rows_out == 0
+    assert pipeline.rows_in < N
@@ -0,0 +1,77 @@
+import itertools
+import os
+
+import pytest
+
+from ingest import send_bulk
+from utils.es_standin import ESStandIn
+from utils.io_manager import IOManager
+from utils.metrics import RunMetrics
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "config.yml")
+
+
+@pytest.fixture
+def standin():
+    with ESStandIn() as es:
+        yield es
+
+
+def _cfg(url):
+    return {"elasticsearch": {"host": url, "input_index": "raw_logs"}}
+
+
+def _reject_first(es, n):
+    """Reject the next `n` bulk items with 429, then accept everything."""
+    flags = itertools.chain([True] * n, itertools.repeat(False))
+    es.reject_item = lambda: next(flags)
+
+
+DOCS = [{"message": f"line {i}", "hostname": f"web-{i % 3}"} for i in range(50)]
+
+
+def test_bulk_then_scroll_reads_every_doc(standin):
+    assert send_bulk(DOCS, _cfg(standin.url)) == (50, 0)
+
+    io = IOManager(CONFIG)
+    io.config["elasticsearch"].update({"host": standin.url, "size": 7})
+    pages = list(io.iter_from_es())
+
+    assert [len(p) for p in pages] == [7] * 7 + [1]
+    assert sorted(d["message"] for p in pages for d in p) == sorted(d["message"] for d in DOCS)
+    assert all("_id" in d for p in pages for d in p)
+
+
+def test_rejected_items_are_retried(standin, monkeypatch):
+    monkeypatch.setattr("ingest.time.sleep", lambda s: None)
+    _reject_first(standin, 12)
+    metrics = RunMetrics("test")
+
+    assert send_bulk(DOCS, _cfg(standin.url), metrics) == (50, 0)
+    assert len(standin.store.indices["raw_logs"]["docs"]) == 50
+    # first request plus one retry of the 12 rejected items
+    assert metrics.stages["ingest_bulk"].rows == 62
+
+
+def test_items_still_rejected_after_retries_fail(standin, monkeypatch):
+    monkeypatch.setattr("ingest.time.sleep", lambda s: None)
+    standin.item_reject_rate = 1.0
+
+    assert send_bulk(DOCS[:5], _cfg(standin.url), retries=2) == (0, 5)
+
+
+def test_request_level_429_indexes_nothing(standin):
+    standin.reject_rate = 1.0
+
+    assert send_bulk(DOCS[:5], _cfg(standin.url)) is None
+    assert "raw_logs" not in standin.store.indices
+
+
+def test_retried_creates_with_ids_do_not_duplicate(standin, monkeypatch):
+    monkeypatch.setattr("ingest.time.sleep", lambda s: None)
+    ids = [f"id{i}" for i in range(10)]
+    assert send_bulk(DOCS[:10], _cfg(standin.url), ids=ids) == (10, 0)
+
+    _reject_first(standin, 3)
+    assert send_bulk(DOCS[:10], _cfg(standin.url), ids=ids) == (10, 0)
+    assert len(standin.store.indices["raw_logs"]["docs"]) == 10
@@ -0,0 +1,78 @@
+from utils.file_tailer import FileTailer
+
+
+def _tailer(tmp_path, **kwargs):
+    return FileTailer(str(tmp_path / "offsets.json"), **kwargs)
+
+
+def _poll(tailer, path):
+    lines = []
+    for seg in tailer.poll(str(path)):
+        lines += [line for _, line in seg.lines]
+        tailer.commit(seg.mark)
+    return lines
+
+
+def test_long_line_does_not_stall_follow(tmp_path):
+    log = tmp_path / "auth.log"
+    log.write_text("short\n" + "x" * 100)
+    tailer = _tailer(tmp_path, block_bytes=8, max_poll_bytes=32)
+
+    assert _poll(tailer, log) == ["short"]
+    # Still no newline: the long line waits like any partial line
+    assert _poll(tailer, log) == []
+
+    with open(log, "a") as f:
+        f.write("yy\nnext\n")
+
+    assert _poll(tailer, log) == ["x" * 32]
+    assert _poll(tailer, log) == ["next"]
+
+
+def test_partial_line_waits_for_newline(tmp_path):
+    log = tmp_path / "auth.log"
+    log.write_text("a\nb")
+    tailer = _tailer(tmp_path)
+
+    assert _poll(tailer, log) == ["a"]
+    with open(log, "a") as f:
+        f.write("c\n")
+    assert _poll(tailer, log) == ["bc"]
+
+
+def test_rotation_drains_old_file_first(tmp_path):
+    log = tmp_path / "auth.log"
+    log.write_text("1\n2\n")
+    tailer = _tailer(tmp_path)
+    assert _poll(tailer, log) == ["1", "2"]
+
+    with open(log, "a") as f:
+        f.write("3\n")
+    log.rename(tmp_path / "auth.log.1")
+    log.write_text("4\n")
+
+    assert _poll(tailer, log) == ["3", "4"]
+
+
+def test_offsets_survive_restart(tmp_path):
+    log = tmp_path / "auth.log"
+    log.write_text("1\n2\n")
+    tailer = _tailer(tmp_path)
+    _poll(tailer, log)
+    tailer.save()
+
+    with open(log, "a") as f:
+        f.write("3\n")
+
+    assert _poll(_tailer(tmp_path), log) == ["3"]
+
+
+def test_truncation_restarts_at_zero(tmp_path):
+    log = tmp_path / "auth.log"
+    log.write_text("first line\nsecond line\n")
+    tailer = _tailer(tmp_path)
+    _poll(tailer, log)
+
+    log.write_text("new\n")
+
+    assert _poll(tailer, log) == ["new"]
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from utils.io_manager import IOManager
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "config.yml")
+
+
+@pytest.fixture
+def io():
+    io = IOManager(CONFIG)
+    io.es = object()   # es_actions only builds actions; no request is sent
+    io.config["elasticsearch"]["output_mapping"] = {"manage": False}
+    return io
+
+
+RECORDS = [{"_id": "abc", "@timestamp": "2026-01-01T00:00:00Z", "fusion_score": 0.3}]
+
+
+def test_output_ids_are_not_reused_by_default(io):
+    (action,) = io.es_actions(RECORDS)
+
+    assert "_id" not in action
+    assert "_id" not in action["_source"]
+
+
+def test_output_ids_reused_on_request(io):
+    io.config["elasticsearch"]["output_reuse_ids"] = True
+
+    (action,) = io.es_actions(RECORDS)
+
+    assert action["_id"] == "abc"
+    assert "_id" not in action["_source"]
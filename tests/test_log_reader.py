@@ -0,0 +1,113 @@
+import gzip
+
+import pytest
+
+from utils.log_reader import (
+    is_log_file, iter_batches, iter_lines, iter_text_lines, split_ranges,
+)
+
+LINES = [f"Jan  1 00:00:{i % 60:02d} web-1 sshd[{i}]: line {i}" + "x" * (i % 37)
+         for i in range(2000)]
+
+
+def _write(path, lines=LINES, trailing_newline=True):
+    data = "\n".join(lines) + ("\n" if trailing_newline else "")
+    path.write_bytes(data.encode("utf-8"))
+    return str(path)
+
+
+@pytest.mark.parametrize("name", ["auth.log", "app.txt"])
+def test_live_files(name):
+    assert is_log_file(name)
+    assert is_log_file(name, rotated=True)
+
+
+@pytest.mark.parametrize("name", ["auth.log.1", "auth.log.2.gz", "auth.log.gz", "app.txt.zst"])
+def test_rotations_need_the_flag(name):
+    assert not is_log_file(name)
+    assert is_log_file(name, rotated=True)
+
+
+@pytest.mark.parametrize("name", ["auth.log.tmp", "notes.md", "auth.log.1.bak", "log"])
+def test_other_files(name):
+    assert not is_log_file(name, rotated=True)
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_mmap_lines_round_trip(tmp_path, trailing_newline):
+    path = _write(tmp_path / "auth.log", trailing_newline=trailing_newline)
+
+    assert list(iter_text_lines(path)) == LINES
+    assert [b.decode() for b in iter_lines(path)][:3] == LINES[:3]
+
+
+def test_blank_lines_and_empty_file(tmp_path):
+    path = _write(tmp_path / "auth.log", ["a", "", "  ", "b"])
+    empty = _write(tmp_path / "empty.log", [], trailing_newline=False)
+
+    assert list(iter_text_lines(path)) == ["a", "b"]
+    assert list(iter_text_lines(empty)) == []
+
+
+@pytest.mark.parametrize("parts", [2, 3, 7, 16])
+def test_split_ranges_lose_and_duplicate_no_line(tmp_path, parts):
+    path = _write(tmp_path / "auth.log")
+
+    ranges = split_ranges(path, parts, min_bytes=1)
+    assert 1 < len(ranges) <= parts
+    assert ranges[0][0] == 0
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+    data = (tmp_path / "auth.log").read_bytes()
+    assert all(data[start - 1:start] == b"\n" for start, _ in ranges[1:])
+
+    lines = [line for start, end in ranges for line in iter_text_lines(path, start, end)]
+    assert lines == LINES
+
+
+def test_split_ranges_on_exact_line_starts(tmp_path):
+    # Every line is 10 bytes, so each cut lands exactly on a line start
+    lines = [f"line {i:04d}" for i in range(100)]
+    path = _write(tmp_path / "auth.log", [line[:9] for line in lines])
+
+    ranges = split_ranges(path, 4, min_bytes=1)
+    read = [line for start, end in ranges for line in iter_text_lines(path, start, end)]
+
+    assert read == [line[:9] for line in lines]
+
+
+def test_small_and_compressed_files_are_not_split(tmp_path):
+    path = _write(tmp_path / "auth.log")
+    gz = tmp_path / "auth.log.1.gz"
+    gz.write_bytes(gzip.compress((tmp_path / "auth.log").read_bytes()))
+
+    assert split_ranges(path, 4) == [(0, None)]
+    assert split_ranges(str(gz), 4, min_bytes=1) == [(0, None)]
+
+
+def test_gzip_stream_round_trip(tmp_path):
+    gz = tmp_path / "auth.log.1.gz"
+    gz.write_bytes(gzip.compress(("\n".join(LINES)).encode("utf-8")))
+
+    # A small chunk size puts chunk edges in the middle of lines
+    assert list(iter_text_lines(str(gz), chunk_bytes=333)) == LINES
+    with pytest.raises(ValueError):
+        list(iter_lines(str(gz), start=10))
+
+
+def test_zstd_stream_round_trip(tmp_path):
+    zstandard = pytest.importorskip("zstandard")
+    zst = tmp_path / "auth.log.1.zst"
+    data = ("\n".join(LINES) + "\n").encode("utf-8")
+    zst.write_bytes(zstandard.ZstdCompressor().compress(data))
+
+    assert list(iter_text_lines(str(zst), chunk_bytes=333)) == LINES
+
+
+def test_batches(tmp_path):
+    path = _write(tmp_path / "auth.log")
+
+    batches = list(iter_batches(path, 300))
+
+    assert [len(b) for b in batches] == [300] * 6 + [200]
+    assert sum(batches, []) == LINES
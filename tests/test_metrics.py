@@ -0,0 +1,45 @@
+import json
+
+from utils.metrics import RunMetrics
+
+
+def _run():
+    m = RunMetrics("main")
+    m.record("clean", 1.5, rows=100, rss_delta_mb=2.0)
+    m.record("clean", 0.5, rows=50)
+    m.record("write_es", 0.25, rows=150, rss_delta_mb=-1.0)
+    m.count("shard_other_rows", 7)
+    m.info["shard"] = 1
+    return m
+
+
+def test_from_dict_round_trip():
+    m = _run()
+    report = json.loads(json.dumps(m.to_dict()))
+
+    back = RunMetrics.from_dict(report)
+
+    assert back.to_dict()["stages"] == report["stages"]
+    assert back.counters == m.counters
+    assert back.stages["clean"].rows == 150
+
+
+def test_merge_sums_stages():
+    merged = RunMetrics("sharded")
+    merged.merge(_run())
+    merged.merge(RunMetrics.from_dict(_run().to_dict()))
+
+    clean = merged.stages["clean"]
+    assert (clean.calls, clean.rows, clean.seconds) == (4, 300, 4.0)
+    assert clean.rss_delta_mb == 4.0
+    assert merged.counters["shard_other_rows"] == 14
+
+
+def test_prometheus_escapes_labels():
+    m = RunMetrics("main")
+    m.record('a\\b"c\nd', 1.0, rows=1)
+
+    text = m.to_prometheus()
+
+    assert 'stage="a\\\\b\\"c\\nd"' in text
+    assert "stage_rss_growth_bytes" in text
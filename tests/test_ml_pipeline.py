@@ -0,0 +1,100 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml.ml_pipeline import MLPipeline
+from ml.model_store import ModelStore
+
+
+@pytest.fixture(scope="module")
+def trained():
+    rng = np.random.default_rng(0)
+    n = 600
+    df = pd.DataFrame({
+        "hour": rng.integers(0, 24, n),
+        "message_length": rng.normal(80, 10, n),
+        "user_fail_10m": rng.poisson(0.2, n),
+    })
+    df.loc[::20, "user_fail_10m"] = 40
+    df["embedding"] = list(rng.normal(size=(n, 16)).astype(np.float32))
+
+    ml = MLPipeline({"lgb": {"cv_folds": 3, "num_boost_round": 20}})
+    ml.train(df.copy())
+    return ml, df
+
+
+def test_scores_do_not_depend_on_batching(trained):
+    ml, df = trained
+
+    whole = copy.deepcopy(ml).predict(df)
+    chunked_ml = copy.deepcopy(ml)
+    chunked = pd.concat([chunked_ml.predict(df.iloc[i:i + 97]) for i in range(0, len(df), 97)])
+
+    for col in ("iso_score", "lgbm_score", "knn_score", "fusion_score"):
+        np.testing.assert_allclose(chunked[col].values, whole[col].values, err_msg=col)
+
+
+def test_single_row_scores_are_in_range(trained):
+    ml, df = trained
+
+    out = copy.deepcopy(ml).predict(df.iloc[[0]])
+
+    assert set(ml.score_bounds) == {"isolation", "lgbm", "knn"}
+    for col in ("iso_score", "lgbm_score", "knn_score"):
+        assert 0.0 <= out[col].iloc[0] <= 1.0
+
+
+def test_missing_feature_column_is_an_error(trained):
+    ml, df = trained
+
+    with pytest.raises(KeyError):
+        copy.deepcopy(ml).predict(df.drop(columns=["hour"]))
+
+
+def test_model_store_keeps_bounds_and_drops_stale_index(trained, tmp_path):
+    ml, _ = trained
+    store = ModelStore(str(tmp_path))
+    store.save(ml)
+
+    loaded = store.load()
+    assert loaded["score_bounds"] == ml.score_bounds
+    assert "novelty_index" in loaded
+
+    retrained = copy.copy(ml)
+    retrained.novelty_index = None
+    store.save(retrained)
+    assert "novelty_index" not in store.load()
+
+
+def _labelled(n=600, seed=1):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "hour": rng.integers(0, 24, n),
+        "message_length": rng.normal(80, 10, n),
+    })
+    df["label"] = (rng.random(n) < 0.15).astype(int)
+    df.loc[df.label == 1, "message_length"] += 25
+    return df
+
+
+def test_cv_auc_is_scored_on_a_fold_early_stopping_did_not_see():
+    ml = MLPipeline({"lgb": {"cv_folds": 3, "num_boost_round": 30}, "novelty": {"enabled": False}})
+    result = ml.train(_labelled(), auto_label=False)
+
+    assert 0.5 < result["cv_auc_mean"] <= 1.0
+    assert "early_stopping_auc_mean" not in result
+
+    y = np.array([0, 1] * 10)
+    fit_idx, stop_idx = ml._early_stopping_split(np.arange(20), y)
+    assert list(fit_idx) == list(range(16)) and list(stop_idx) == list(range(16, 20))
+
+
+def test_without_inner_slice_the_metric_is_not_called_cv():
+    ml = MLPipeline({"lgb": {"cv_folds": 3, "num_boost_round": 30, "early_stopping_fraction": 0},
+                     "novelty": {"enabled": False}})
+    result = ml.train(_labelled(), auto_label=False)
+
+    assert result["cv_auc_mean"] is None
+    assert 0.5 < result["early_stopping_auc_mean"] <= 1.0
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pytest
+from elasticsearch import Elasticsearch
+
+import utils.io_manager as io_manager
+from utils.es_standin import ESStandIn
+from utils.io_manager import IOManager
+from utils.output_index import OutputIndex
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "config.yml")
+INDEX = "nlp_logs"
+
+
+@pytest.fixture
+def standin():
+    with ESStandIn() as es:
+        yield es
+
+
+@pytest.fixture
+def io(standin):
+    io = IOManager(CONFIG)
+    io.config["elasticsearch"]["host"] = standin.url
+    return io
+
+
+def _records(n, dims=16):
+    rng = np.random.default_rng(0)
+    return [{
+        "_id": f"in{i}",
+        "@timestamp": "2026-01-01T00:00:00Z",
+        "hostname": "web-1",
+        "raw_message": f"line {i}",
+        "fusion_score": 0.1,
+        "embedding": rng.normal(size=dims).astype(np.float32),
+    } for i in range(n)]
+
+
+def _index(standin):
+    return standin.store.indices[INDEX]
+
+
+def test_mapping_is_int8_hnsw_and_vectors_stay_out_of_source(io, standin):
+    io.write_to_es(_records(3))
+
+    mappings = _index(standin)["mappings"]
+    embedding = mappings["properties"]["embedding"]
+    assert embedding["type"] == "dense_vector"
+    assert embedding["dims"] == 16
+    assert embedding["index_options"] == {"type": "int8_hnsw"}
+    assert mappings["_source"] == {"excludes": ["embedding"]}
+
+    # The vector is sent, and dropped from the stored _source
+    assert len(io.es_actions(_records(1))[0]["_source"]["embedding"]) == 16
+    docs = [src for _, src in _index(standin)["docs"].values()]
+    assert len(docs) == 3 and all("embedding" not in d for d in docs)
+
+
+def test_no_vectors_means_no_embedding_field(io, standin):
+    records = _records(2)
+    for rec in records:
+        rec.pop("embedding")
+
+    actions = io.es_actions(records)
+
+    assert "embedding" not in _index(standin)["mappings"]["properties"]
+    assert "_source" not in _index(standin)["mappings"]
+    assert io.output_index.vectors_enabled is False
+    assert all("embedding" not in a["_source"] for a in actions)
+
+
+def test_existing_index_without_dense_vector_gets_no_embeddings(io, standin):
+    es = Elasticsearch(standin.url)
+    es.indices.create(index=INDEX, mappings={"properties": {"embedding": {"type": "float"}}})
+
+    actions = io.es_actions(_records(2))
+
+    assert io.output_index.vectors_enabled is False
+    assert all("embedding" not in a["_source"] for a in actions)
+
+
+def test_index_created_concurrently_is_reused(standin, monkeypatch):
+    es = Elasticsearch(standin.url)
+    other = OutputIndex(es, INDEX)
+    mine = OutputIndex(es, INDEX)
+
+    # Both writers see no index; the other one creates it first
+    monkeypatch.setattr(es.indices, "exists", lambda index: False)
+    assert other.ensure(_records(1, dims=8))
+    monkeypatch.undo()
+
+    calls = []
+    real_exists = es.indices.exists
+
+    def exists(index):
+        calls.append(index)
+        return False if len(calls) == 1 else real_exists(index=index)
+
+    monkeypatch.setattr(es.indices, "exists", exists)
+
+    # Its own dims would be 16; it must adopt the index the other writer made
+    assert mine.ensure(_records(1, dims=16))
+    assert len(calls) == 2
+    assert _index(standin)["mappings"]["properties"]["embedding"]["dims"] == 8
+
+
+def test_large_writes_disable_refresh_and_replicas_while_writing(io, standin, monkeypatch):
+    io.config["elasticsearch"]["output_mapping"]["backfill_min_docs"] = 5
+    seen = []
+    real_bulk = io_manager.helpers.bulk
+
+    def bulk(es, actions):
+        seen.append(dict(_index(standin)["settings"]["index"]))
+        return real_bulk(es, actions)
+
+    monkeypatch.setattr(io_manager.helpers, "bulk", bulk)
+
+    io.write_to_es(_records(5))
+
+    assert seen == [{"refresh_interval": "-1", "number_of_replicas": 0}]
+    assert _index(standin)["settings"]["index"] == {"refresh_interval": "1s",
+                                                    "number_of_replicas": 1}
+    assert len(_index(standin)["docs"]) == 5
+
+
+def test_small_writes_keep_index_settings(io, standin):
+    io.config["elasticsearch"]["output_mapping"]["backfill_min_docs"] = 5
+
+    io.write_to_es(_records(4))
+
+    assert "index" not in _index(standin)["settings"]
+    assert len(_index(standin)["docs"]) == 4
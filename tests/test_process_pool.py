@@ -0,0 +1,106 @@
+import math
+
+import numpy as np
+
+from feature.feature_builder import build_stateless_features
+from nlp.normalize import clean_message
+from utils.process_pool import ColumnBatch, StageRunner, _INPUT_FIELDS
+
+MESSAGES = [
+    "Failed password for root from 10.0.0.1 port 40000 ssh2",
+    "Accepted publickey for bob from 192.168.1.5 port 22 ssh2",
+    "pam_unix(sudo:auth): authentication failure; logname=bob uid=1000",
+    "CRON[1234]: (root) CMD (run-parts /etc/cron.hourly)",
+    "",
+    "Invalid user admin from 203.0.113.9 port 5555",
+    "kernel: [12345.678] eth0: link up 1000 Mbps",
+]
+
+
+def _logs(n=60):
+    logs = []
+    for i in range(n):
+        rec = {
+            "@timestamp": f"2026-01-01T{i % 24:02d}:{i % 60:02d}:00Z" if i % 9 else "",
+            "hostname": f"web-{i % 4}",
+            "process": "sshd" if i % 2 else "sudo",
+            "raw_message": MESSAGES[i % len(MESSAGES)] + f" #{i}" * (i % 3),
+        }
+        if i % 11 == 0:
+            del rec["hostname"]
+        logs.append(rec)
+    return logs
+
+
+def _expected(logs):
+    rows = []
+    for rec in logs:
+        msg = str(rec.get("message", rec.get("raw_message", "")))
+        record = {f: rec.get(f, "") for f in _INPUT_FIELDS}
+        record.update(raw_message=msg, clean_message=clean_message(msg))
+        rows.append({"clean_message": record["clean_message"], **build_stateless_features(record)})
+    return rows
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return type(a) is type(b) and a == b
+
+
+def _assert_rows_equal(got, expected):
+    assert len(got) == len(expected)
+    for g, e in zip(got, expected):
+        assert list(g) == list(e)
+        for k in e:
+            assert _same(g[k], e[k]), (k, g[k], e[k])
+
+
+def test_round_trip_keeps_values_types_and_none_vs_nan():
+    rows = [
+        {"b": True, "i": 1, "i_none": 3, "f": 0.5, "f_none": 1.0, "f_nan": float("nan"),
+         "both": None, "obj": "x", "mixed": 1},
+        {"b": None, "i": 2, "i_none": None, "f": float("nan"), "f_none": None, "f_nan": 2.0,
+         "both": float("nan"), "obj": None, "mixed": "a"},
+        {"b": False, "i": 3, "i_none": 5, "f": np.float32(1.5), "f_none": 2.5, "f_nan": 3.0,
+         "both": 1.0, "obj": ["list"], "mixed": 2.5},
+    ]
+
+    batch = ColumnBatch.from_rows(rows)
+
+    assert batch.kinds == {"b": "bool", "i": "int", "i_none": "int?", "f": "float",
+                           "f_none": "float?", "f_nan": "float", "both": "obj",
+                           "obj": "obj", "mixed": "obj"}
+    expected = [dict(r) for r in rows]
+    expected[2]["f"] = 1.5
+    _assert_rows_equal(batch.to_rows(), expected)
+
+
+def test_concat_of_differently_typed_chunks():
+    a = ColumnBatch.from_rows([{"x": None}, {"x": None}])
+    b = ColumnBatch.from_rows([{"x": 1.5}, {"x": float("nan")}])
+
+    rows = ColumnBatch.concat([a, b]).to_rows()
+
+    assert [r["x"] for r in rows[:3]] == [None, None, 1.5]
+    assert math.isnan(rows[3]["x"])
+
+
+def test_features_match_build_stateless_features():
+    logs = _logs()
+    _assert_rows_equal(StageRunner(workers=1).run(logs).to_rows(), _expected(logs))
+
+
+def test_one_and_two_workers_give_the_same_features():
+    logs = _logs()
+    single = StageRunner(workers=1, chunk_size=7).run(logs)
+
+    runner = StageRunner(workers=2, chunk_size=7)
+    try:
+        pooled = runner.run(logs)
+    finally:
+        runner.close()
+
+    assert pooled.kinds == single.kinds
+    _assert_rows_equal(pooled.to_rows(), single.to_rows())
+    _assert_rows_equal(pooled.to_rows(), _expected(logs))
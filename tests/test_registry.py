@@ -0,0 +1,29 @@
+from feature.registry import FEATURE_SPECS, FeaturePlan, plan_for
+
+
+def test_plan_pulls_in_dependencies():
+    plan = plan_for(["hour", "user_fail_10m"])
+
+    assert plan.names == {"time", "ueba", "windowed"}
+    assert not plan.needs_embedding
+
+
+def test_sketch_features_need_per_line_ueba():
+    assert plan_for(["ip_distinct_users"]).names == {"sketches", "ueba"}
+
+
+def test_embedding_on_request():
+    assert plan_for(["message_length"], embedding=True).names == {"statistical", "embedding"}
+
+
+def test_unknown_column_falls_back_to_full_plan():
+    plan = plan_for(["hour", "not_a_feature"])
+
+    assert plan.is_full
+
+
+def test_plan_specs_keep_registry_order():
+    plan = FeaturePlan.full()
+    names = [s.name for s in plan.specs(stateful=False) + plan.specs(stateful=True)]
+
+    assert names == [s.name for s in FEATURE_SPECS if s.extractor is not None]
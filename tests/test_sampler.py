@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from ml.sampler import TrainingSampler
+
+
+def _chunk(start, n, hosts):
+    return pd.DataFrame({
+        "@timestamp": [f"2026-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}Z" for i in range(start, start + n)],
+        "hostname": [f"h{i % hosts}" for i in range(start, start + n)],
+        "process": "sshd",
+        "x": np.arange(start, start + n, dtype=float),
+    })
+
+
+def _select(df):
+    return ["x"]
+
+
+def test_capacity_holds_with_many_strata():
+    sampler = TrainingSampler(capacity=100, max_strata=20)
+    for start in range(0, 5000, 500):
+        sampler.consume(_chunk(start, 500, hosts=400), _select)
+
+    stats = sampler.stats()
+    assert stats["rows_seen"] == 5000
+    assert stats["rows_kept"] == 100
+    assert stats["strata"] == 21
+    assert stats["overflow_strata"] == 380
+
+
+def test_other_reservoir_is_sized_by_overflowed_strata():
+    sampler = TrainingSampler(capacity=1000, max_strata=10)
+    sampler.consume(_chunk(0, 2000, hosts=50), _select)
+
+    # 50 strata -> 20 rows per share; 10 own shares, "other" gets the other 40
+    own = [len(r) for k, r in sampler.reservoirs.items() if k != sampler.OTHER]
+    assert own == [20] * 10
+    assert len(sampler.reservoirs[sampler.OTHER]) == 800
+
+
+def test_every_stratum_is_kept():
+    sampler = TrainingSampler(capacity=1000)
+    sampler.consume(_chunk(0, 900, hosts=3), _select)
+    sampler.consume(_chunk(900, 5, hosts=1).assign(hostname="rare"), _select)
+
+    df = sampler.sample()
+
+    assert set(df["hostname"]) == {"h0", "h1", "h2", "rare"}
+    assert df["@timestamp"].is_monotonic_increasing
+
+
+def test_scaler_sees_the_whole_stream():
+    sampler = TrainingSampler(capacity=10)
+    for start in range(0, 1000, 100):
+        sampler.consume(_chunk(start, 100, hosts=2), _select)
+
+    assert sampler.scaler.n_samples_seen_ == 1000
+    assert abs(sampler.scaler.mean_[0] - 499.5) < 1e-9
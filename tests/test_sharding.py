@@ -0,0 +1,81 @@
+import pytest
+
+import utils.sharding as sharding
+from utils.sharding import HashRing, ShardFilter
+
+HOSTS = [f"host-{i}" for i in range(2000)]
+
+
+def test_ring_is_stable():
+    a, b = HashRing(4), HashRing(4)
+    assert [a.shard_of(h) for h in HOSTS] == [b.shard_of(h) for h in HOSTS]
+
+
+def test_growing_the_ring_moves_few_keys():
+    four, five = HashRing(4), HashRing(5)
+    moved = sum(four.shard_of(h) != five.shard_of(h) for h in HOSTS)
+    # Ideal is 1/5 of the keys
+    assert moved < len(HOSTS) * 0.3
+
+
+def test_shards_are_disjoint_and_complete():
+    n = 3
+    filters = [ShardFilter(s, n) for s in range(n)]
+    records = [{"hostname": h} for h in HOSTS] + [{"hostname": None}, {}, {"hostname": ""}]
+
+    owned = [f.filter(records) for f in filters]
+
+    assert sum(len(o) for o in owned) == len(records)
+    assert all(len(o) > len(HOSTS) / n / 2 for o in owned)
+    # Records without a hostname all land on one shard
+    assert sum(f.owns({}) for f in filters) == 1
+
+
+def test_invalid_shard():
+    with pytest.raises(ValueError):
+        ShardFilter(4, 4)
+
+
+def test_shard_path():
+    f = ShardFilter(1, 4)
+    assert f.shard_path("state/ueba_state.json") == "state/ueba_state.shard1of4.json"
+
+
+class _CompositeES:
+    """Serves the hostname composite aggregation in pages of `size`."""
+
+    def __init__(self, hosts):
+        self.hosts = sorted(hosts)
+        self.calls = 0
+
+    def search(self, index, size, aggs):
+        self.calls += 1
+        comp = aggs["hosts"]["composite"]
+        after = (comp.get("after") or {}).get("host")
+        rest = [h for h in self.hosts if after is None or h > after]
+        page = rest[:comp["size"]]
+        agg = {"buckets": [{"key": {"host": h}, "doc_count": 1} for h in page]}
+        if page:
+            agg["after_key"] = {"host": page[-1]}
+        return {"aggregations": {"hosts": agg}}
+
+
+def test_es_query_pages_hosts_and_chunks_terms(monkeypatch):
+    monkeypatch.setattr(sharding, "MAX_TERMS", 100)
+    es = _CompositeES(HOSTS)
+    f = ShardFilter(0, 2, discovery_page=300)
+
+    query = f.es_query(es, "raw_logs")
+
+    # 2000 hosts in pages of 300, plus the final empty page
+    assert es.calls == 8
+    terms = [c["terms"]["hostname.keyword"] for c in query["bool"]["should"] if "terms" in c]
+    assert all(len(t) <= 100 for t in terms)
+    assert sorted(h for t in terms for h in t) == sorted(h for h in HOSTS if f.owns_host(h))
+
+
+def test_es_query_matches_nothing_for_an_empty_shard():
+    es = _CompositeES([])
+    f = next(ShardFilter(s, 2) for s in range(2) if not ShardFilter(s, 2).owns_host(""))
+
+    assert f.es_query(es, "raw_logs") == {"bool": {"must_not": {"match_all": {}}}}
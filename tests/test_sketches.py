@@ -0,0 +1,104 @@
+from feature.sketches import KeyedHyperLogLog, SprayingSketches
+
+T0 = 1_700_000_000.0
+
+
+def _observe(sk, user, ip, ts, host="web-1"):
+    record = {"hostname": host, "raw_message": f"Failed password for {user} from {ip} at {ts}"}
+    return sk.update(user, ip, ts, sk.is_replay(record, ts))
+
+
+def _spray(sk, users, ip="10.0.0.1", t0=T0, host="web-1"):
+    out = None
+    for i, user in enumerate(users):
+        out = _observe(sk, user, ip, t0 + i, host)
+    return out
+
+
+def test_distinct_users_per_ip():
+    sk = SprayingSketches()
+    out = _spray(sk, [f"user{i}" for i in range(200)])
+
+    assert 180 <= out["ip_distinct_users"] <= 220
+    assert out["ip_attempts"] >= 200
+    assert out["user_distinct_ips"] == 1
+
+
+def test_replay_after_save_is_not_counted(tmp_path):
+    path = str(tmp_path / "sketches.npz")
+    users = [f"user{i}" for i in range(50)]
+
+    sk = SprayingSketches(path)
+    first = _spray(sk, users)
+    sk.save()
+
+    again = SprayingSketches(path)
+    replay = _spray(again, users)
+
+    assert replay == first
+    assert again.guard.replayed == len(users)
+
+
+def test_lagging_source_and_edge_second_are_counted(tmp_path):
+    path = str(tmp_path / "sketches.npz")
+
+    sk = SprayingSketches(path)
+    _observe(sk, "alice", "10.0.0.1", T0 + 600, host="fast")
+    sk.save()
+
+    again = SprayingSketches(path)
+    # Older than the fast host's logs, but from another host
+    _observe(again, "bob", "10.0.0.1", T0 + 60, host="slow")
+    # Same second as the saved edge, but a new line
+    out = _observe(again, "carol", "10.0.0.1", T0 + 600, host="fast")
+
+    assert again.guard.replayed == 0
+    assert out["ip_distinct_users"] == 3
+
+
+def test_old_generations_expire():
+    sk = SprayingSketches(window_seconds=60)
+    _spray(sk, ["a", "b", "c"], t0=0)
+    out = _spray(sk, ["d"], t0=600)
+
+    assert out["ip_attempts"] == 1
+    assert len(sk.generations) == 1
+
+
+def test_small_keys_stay_sparse_and_exact():
+    hll = KeyedHyperLogLog(precision=8)
+    for i in range(1000):
+        hll.add(f"ip{i}", "root")
+    for i in range(100):
+        hll.add("sprayer", f"user{i}")
+
+    assert len(hll.sparse) == 1000 and list(hll.index) == ["sprayer"]
+    assert hll.estimate("ip7") == 1.0
+    assert 85 <= hll.estimate("sprayer") <= 115
+
+
+def test_sparse_and_dense_round_trip_and_merge():
+    a = KeyedHyperLogLog(precision=8)
+    b = KeyedHyperLogLog(precision=8)
+    for i in range(3):
+        a.add("k", f"v{i}")
+    for i in range(3, 40):
+        b.add("k", f"v{i}")
+    b.add("only_b", "x")
+
+    loaded = KeyedHyperLogLog.from_arrays(a.to_arrays("p"), "p", 8)
+    assert loaded.estimate("k") == 3.0
+
+    loaded.merge(b)
+    assert 34 <= loaded.estimate("k") <= 46
+    assert loaded.estimate("only_b") == 1.0
+
+
+def test_key_limit():
+    hll = KeyedHyperLogLog(precision=8, max_keys=10)
+    for i in range(15):
+        hll.add(f"ip{i}", "root")
+
+    assert len(hll) == 10
+    assert hll.untracked == 5
+    assert hll.estimate("ip12") == 0.0
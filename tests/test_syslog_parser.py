@@ -0,0 +1,111 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from utils.io_manager import IOManager
+from utils.syslog_parser import SyslogParser
+
+REF = datetime(2026, 1, 2, 12, 0, 0, tzinfo=timezone.utc)
+INGESTED_AT = "2026-01-02T12:00:00.000Z"
+
+CRON = ("Nov 30 06:47:01 ip-172-31-27-153 CRON[22087]: "
+        "pam_unix(cron:session): session opened for user root by (uid=0)")
+PADDED = "Nov  3 07:07:14 ip-172-31-27-153 sshd[22116]: Connection closed by 122.225.103.87 [preauth]"
+KV = "Dec 31 23:59:58 web-1 sudo: user=alice tty=\"pts/0\" PWD=/root"
+KV_OVERWRITE = "Dec 01 10:00:00 web-1 app: hostname=evil pid=[7] then user=ignored"
+
+
+# What es_patterns/syslog_pipeline.json indexes for each line (minus ingested_at)
+PIPELINE_DOCS = {
+    CRON: {
+        "raw_log": CRON,
+        "timestamp": "Nov 30 06:47:01",
+        "hostname": "ip-172-31-27-153",
+        "process": "CRON",
+        "pid": "22087",
+        "message": "pam_unix(cron:session): session opened for user root by (uid=0)",
+        "@timestamp": "2026-11-30T06:47:01.000Z",
+    },
+    PADDED: {
+        # "MMM dd" needs two digits: the date processor fails, no @timestamp
+        "raw_log": PADDED,
+        "timestamp": "Nov  3 07:07:14",
+        "hostname": "ip-172-31-27-153",
+        "process": "sshd",
+        "pid": "22116",
+        "message": "Connection closed by 122.225.103.87 [preauth]",
+    },
+    KV: {
+        # Dates get the current year, even right after new year
+        "raw_log": KV,
+        "timestamp": "Dec 31 23:59:58",
+        "hostname": "web-1",
+        "process": "sudo",
+        "message": "user=alice tty=\"pts/0\" PWD=/root",
+        "user": "alice",
+        "tty": "pts/0",
+        "PWD": "/root",
+        "@timestamp": "2026-12-31T23:59:58.000Z",
+    },
+    KV_OVERWRITE: {
+        # kv stops at "then"; flattened pairs overwrite grok fields
+        "raw_log": KV_OVERWRITE,
+        "timestamp": "Dec 01 10:00:00",
+        "hostname": "evil",
+        "process": "app",
+        "pid": "7",
+        "message": "hostname=evil pid=[7] then user=ignored",
+        "@timestamp": "2026-12-01T10:00:00.000Z",
+    },
+    "not a syslog line": None,
+}
+
+
+@pytest.mark.parametrize("line", list(PIPELINE_DOCS))
+def test_pipeline_compat_matches_pipeline(line):
+    parser = SyslogParser(pipeline_compat=True, reference_time=REF)
+    doc = parser.parse(line, ingested_at=INGESTED_AT)
+
+    expected = PIPELINE_DOCS[line]
+    if expected is not None:
+        expected = {**expected, "ingested_at": INGESTED_AT}
+    assert doc == expected
+
+
+def test_lenient_timestamps_diverge_from_pipeline():
+    parser = SyslogParser(pipeline_compat=False, reference_time=REF)
+
+    assert parser.parse(PADDED)["@timestamp"] == "2025-11-03T07:07:14.000Z"
+    assert parser.parse(KV)["@timestamp"] == "2025-12-31T23:59:58.000Z"
+    assert parser.parse(CRON)["@timestamp"] == "2025-11-30T06:47:01.000Z"
+
+
+def test_parse_lines_skips_blank_lines():
+    parser = SyslogParser(pipeline_compat=True, reference_time=REF)
+    out = list(parser.parse_lines([CRON + "\n", "\n", "  ", "junk\n"]))
+
+    assert [line for line, _ in out] == [CRON, "junk"]
+    assert out[0][1]["pid"] == "22087"
+    assert out[1][1] is None
+
+
+def test_for_file_anchors_the_year_to_the_mtime(tmp_path):
+    log = tmp_path / "auth.log.1"
+    log.write_text(KV + "\n")
+    # Written on Jan 2 2026: its "Dec 31" lines are from 2025
+    os.utime(log, (REF.timestamp(), REF.timestamp()))
+
+    assert SyslogParser.for_file(str(log)).parse(KV)["@timestamp"] == "2025-12-31T23:59:58.000Z"
+
+
+def test_log_input_uses_file_mtime(tmp_path):
+    log = tmp_path / "auth.log"
+    log.write_text(KV + "\n")
+    os.utime(log, (REF.timestamp(), REF.timestamp()))
+
+    io = IOManager(os.path.join(os.path.dirname(__file__), "..", "config.yml"))
+    io.config["input"]["log_path"] = str(tmp_path)
+
+    (record,) = [r for chunk in io.iter_from_log(100) for r in chunk]
+    assert record["@timestamp"] == "2025-12-31T23:59:58.000Z"
@@ -0,0 +1,123 @@
+from datetime import datetime, timezone
+
+from feature.ueba_features import build_windowed_features, is_failed_login
+from feature.ueba_state import UEBAStateStore
+
+T0 = 1_700_000_000
+
+
+def _record(ts, line, host="web-1"):
+    iso = datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+    return {"@timestamp": iso, "hostname": host, "raw_message": line}
+
+
+def _fail(store, ts, port, host="web-1", user="root"):
+    rec = _record(ts, f"Failed password for {user} from 10.0.0.1 port {port} ssh2", host)
+    return build_windowed_features(rec, user, "10.0.0.1", True, store)
+
+
+def _fails(store, n, t0=T0, step=10):
+    out = None
+    for i in range(n):
+        out = _fail(store, t0 + i * step, 40000 + i)
+    return out
+
+
+def test_windowed_counts():
+    store = UEBAStateStore()
+    out = _fails(store, 12)
+
+    assert out["user_fail_1h"] == 12
+    assert out["user_fail_1m"] <= 7
+    assert out["user_secs_since_last"] == 10
+
+
+def test_events_leave_the_window():
+    store = UEBAStateStore()
+    _fails(store, 5)
+    out = store.update("user", "root", T0 + 7200)
+
+    assert out["user_fail_1h"] == 0
+
+
+def test_state_round_trip_and_replay(tmp_path):
+    path = str(tmp_path / "ueba.json")
+
+    store = UEBAStateStore(path)
+    first = _fails(store, 15)
+    store.save()
+
+    reloaded = UEBAStateStore(path)
+    replay = _fails(reloaded, 15)
+
+    assert replay["user_fail_1h"] == first["user_fail_1h"] == 15
+    assert reloaded.guard.replayed == 15
+
+    newer = _fail(reloaded, T0 + 1000, 50000)
+    assert newer["user_fail_1h"] == 16
+
+
+def test_new_events_in_the_saved_edge_second_are_counted(tmp_path):
+    path = str(tmp_path / "ueba.json")
+    edge = T0 + 100
+
+    run1 = UEBAStateStore(path)
+    _fail(run1, T0, 1)
+    _fail(run1, edge, 2)
+    _fail(run1, edge, 3)
+    run1.save()
+
+    # The second run re-reads the overlap and gets one more line in the edge second
+    run2 = UEBAStateStore(path)
+    _fail(run2, edge, 2)
+    _fail(run2, edge, 3)
+    out = _fail(run2, edge, 4)
+
+    assert run2.guard.replayed == 2
+    assert out["user_fail_1h"] == 4
+
+    run2.save()
+    run3 = UEBAStateStore(path)
+    for port in (2, 3, 4):
+        out = _fail(run3, edge, port)
+    assert run3.guard.replayed == 3
+    assert out["user_fail_1h"] == 4
+
+
+def test_lagging_host_is_not_a_replay(tmp_path):
+    path = str(tmp_path / "ueba.json")
+
+    run1 = UEBAStateStore(path)
+    _fail(run1, T0 + 600, 1, host="fast")
+    run1.save()
+
+    run2 = UEBAStateStore(path)
+    out = _fail(run2, T0 + 60, 2, host="slow")
+
+    assert run2.guard.replayed == 0
+    assert out["user_fail_1h"] == 2
+
+
+def test_one_failed_ssh_attempt_counts_once():
+    attempt = [
+        "Invalid user admin from 10.0.0.1 port 40000",
+        "pam_unix(sshd:auth): authentication failure; logname= uid=0 euid=0 tty=ssh ruser= rhost=10.0.0.1",
+        "Failed password for invalid user admin from 10.0.0.1 port 40000 ssh2",
+    ]
+    sudo = [
+        "pam_unix(sudo:auth): authentication failure; logname=bob uid=1000 euid=0 tty=/dev/pts/0",
+        "bob : 1 incorrect password attempt ; TTY=pts/0 ; PWD=/home/bob ; USER=root",
+    ]
+
+    assert sum(is_failed_login({"raw_message": m}) for m in attempt) == 1
+    assert sum(is_failed_login({"raw_message": m}) for m in sudo) == 1
+    assert not is_failed_login({"raw_message": "Accepted password for bob from 10.0.0.1 port 22 ssh2"})
+
+
+def test_expire_uses_ttl():
+    store = UEBAStateStore(ttl_seconds=100)
+    store.update("ip", "1.2.3.4", T0)
+    store.update("ip", "5.6.7.8", T0 + 500)
+
+    assert store.expire(now=T0 + 550) == 1
+    assert list(store.entities) == ["ip:5.6.7.8"]
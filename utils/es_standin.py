@@ -0,0 +1,577 @@
+# utils/es_standin.py
+
+"""
+Lightweight in-memory Elasticsearch stand-in for local / CI throughput work.
+
+Implements only what this repo talks to:
+    GET  /                                  cluster info
+    PUT  /{index}, HEAD /{index}            create / exists (mappings + settings kept,
+                                            _source.excludes applied on write)
+    PUT  /{index}/_settings, GET /{index}/_mapping
+    POST /{index}/_doc, PUT /{index}/_doc/{id}   (?pipeline=)
+    POST /_bulk, /{index}/_bulk                  (?pipeline=)
+    POST /{index}/_search                   match_all / term(s) / bool filter,
+                                            size, sort, search_after, slice,
+                                            ?scroll= and point-in-time,
+                                            composite terms aggregations
+    POST /_search/scroll, DELETE /_search/scroll
+    POST /{index}/_pit, DELETE /_pit
+    PUT|GET /_ingest/pipeline/{name}
+    POST /{index}/_refresh, GET /{index}/_count
+
+with configurable per-request latency and HTTP 429 injection, so the read,
+ingest and write paths can be load-tested without a real cluster.
+
+    python -m utils.es_standin --port 9200 --latency-ms 5 --reject-rate 0.01
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def _get_field(doc, field):
+    if field.endswith(".keyword"):
+        field = field[:-len(".keyword")]
+    if field in doc:
+        return doc[field]
+
+    cur = doc
+    for part in field.split("."):
+        if not isinstance(cur, dict):
+            return None
+        cur = cur.get(part)
+    return cur
+
+
+def _matches(doc, query):
+    """Evaluate the small query subset we use against a _source dict."""
+    if not query or "match_all" in query:
+        return True
+
+    if "term" in query:
+        (field, value), = query["term"].items()
+        if isinstance(value, dict):
+            value = value.get("value")
+        return _get_field(doc, field) == value
+
+    if "terms" in query:
+        (field, values), = query["terms"].items()
+        return _get_field(doc, field) in set(values)
+
+    if "exists" in query:
+        return _get_field(doc, query["exists"]["field"]) is not None
+
+    if "bool" in query:
+        b = query["bool"]
+
+        def as_list(v):
+            return v if isinstance(v, list) else [v]
+
+        for clause in as_list(b.get("filter", [])) + as_list(b.get("must", [])):
+            if not _matches(doc, clause):
+                return False
+        for clause in as_list(b.get("must_not", [])):
+            if _matches(doc, clause):
+                return False
+        should = as_list(b.get("should", []))
+        if should and not any(_matches(doc, c) for c in should):
+            return False
+        return True
+
+    raise ValueError(f"unsupported query: {list(query)}")
+
+
+class _Store:
+    """Thread-safe in-memory indices, pipelines, scrolls and PITs."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indices = {}     # name -> {"docs": {id: (seq, source)}, "mappings", "settings"}
+        self.pipelines = {}
+        self.scrolls = {}     # scroll_id -> [hits, pos, size]
+        self.pits = {}        # pit_id -> snapshot [(seq, id, source)]
+        self.seq = itertools.count()
+
+    def index(self, name, create=True):
+        idx = self.indices.get(name)
+        if idx is None and create:
+            idx = self.indices[name] = {"docs": {}, "mappings": {}, "settings": {}}
+        return idx
+
+    def put_doc(self, index, doc_id, source, create_only=False):
+        """Store a doc; returns "created" / "updated", or None if `create_only` and it exists."""
+        with self.lock:
+            idx = self.index(index)
+            if create_only and doc_id in idx["docs"]:
+                return None
+            result = "updated" if doc_id in idx["docs"] else "created"
+            excludes = idx["mappings"].get("_source", {}).get("excludes")
+            if excludes:
+                source = {k: v for k, v in source.items() if k not in excludes}
+            idx["docs"][doc_id] = (next(self.seq), source)
+            return result
+
+    def snapshot(self, index):
+        with self.lock:
+            names = [n for n in index.split(",") if n in self.indices] if index else list(self.indices)
+            out = []
+            for n in names:
+                for doc_id, (seq, src) in self.indices[n]["docs"].items():
+                    out.append((seq, n, doc_id, src))
+            out.sort(key=lambda x: x[0])
+            return out
+
+
+class ESStandIn:
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0,
+                 reject_rate=0.0, item_reject_rate=0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.reject_rate = reject_rate
+        self.item_reject_rate = item_reject_rate
+        self.rng = random.Random(seed)
+
+        self.store = _Store()
+        self.processors = {}   # pipeline name -> callable(source) -> source
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        handler = type("Handler", (_Handler,), {"standin": self})
+        self.httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"[ES-STANDIN] Listening on {self.url}")
+        return self.url
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # -----------------------------------------------------
+    # Fault / latency injection
+    # -----------------------------------------------------
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            ms = self.latency_ms + self.rng.uniform(0, self.jitter_ms)
+            time.sleep(ms / 1000.0)
+
+    def reject(self):
+        return self.reject_rate > 0 and self.rng.random() < self.reject_rate
+
+    def reject_item(self):
+        return self.item_reject_rate > 0 and self.rng.random() < self.item_reject_rate
+
+    # -----------------------------------------------------
+    # Ingest pipelines
+    # -----------------------------------------------------
+    def register_processor(self, pipeline, fn):
+        """Run `fn(source) -> source | None` for docs sent with ?pipeline=name."""
+        self.processors[pipeline] = fn
+
+    def run_pipeline(self, name, source):
+        if name not in self.store.pipelines and name not in self.processors:
+            raise KeyError(name)
+        fn = self.processors.get(name)
+        return fn(source) if fn else source
+
+
+def _error(status, etype, reason):
+    return status, {"error": {"type": etype, "reason": reason}, "status": status}
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    standin = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # -----------------------------------------------------
+    # Plumbing
+    # -----------------------------------------------------
+    def _send(self, status, body=None):
+        data = b"" if body is None or self.command == "HEAD" else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def _read_body(self):
+        n = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(n) if n else b""
+        if self.headers.get("Content-Encoding") == "gzip":
+            raw = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+        return raw
+
+    def _dispatch(self):
+        es = self.standin
+        parts = urlsplit(self.path)
+        path = [p for p in parts.path.split("/") if p]
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        body = self._read_body()
+
+        es.delay()
+        if es.reject():
+            return self._send(*_error(429, "es_rejected_execution_exception",
+                                      "rejected execution (stand-in injected)"))
+
+        try:
+            status, resp = self._route(self.command, path, params, body)
+        except KeyError as e:
+            status, resp = _error(404, "resource_not_found_exception", f"not found: {e}")
+        except (ValueError, json.JSONDecodeError) as e:
+            status, resp = _error(400, "parsing_exception", str(e))
+
+        self._send(status, resp)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _dispatch
+
+    # -----------------------------------------------------
+    # Routing
+    # -----------------------------------------------------
+    def _route(self, method, path, params, body):
+        es = self.standin
+        store = es.store
+        json_body = json.loads(body) if body.strip() and path[-1:] != ["_bulk"] else {}
+
+        if not path:
+            return 200, {
+                "name": "es-standin",
+                "cluster_name": "es-standin",
+                "version": {"number": "8.12.0", "build_flavor": "default"},
+                "tagline": "You Know, for Search",
+            }
+
+        head = path[0]
+
+        if head == "_bulk":
+            return self._bulk(None, params, body)
+
+        if head == "_search" and path[1:2] == ["scroll"]:
+            scroll_id = json_body.get("scroll_id") or params.get("scroll_id")
+            if method == "DELETE":
+                with store.lock:
+                    ids = scroll_id if isinstance(scroll_id, list) else [scroll_id]
+                    freed = sum(store.scrolls.pop(i, None) is not None for i in ids)
+                return 200, {"succeeded": True, "num_freed": freed}
+            return 200, self._scroll_page(scroll_id)
+
+        if head == "_pit" and method == "DELETE":
+            with store.lock:
+                store.pits.pop(json_body.get("id"), None)
+            return 200, {"succeeded": True, "num_freed": 1}
+
+        if head == "_search":
+            return 200, self._search(None, params, json_body)
+
+        if head == "_ingest" and path[1:2] == ["pipeline"]:
+            name = path[2] if len(path) > 2 else None
+            if method == "PUT":
+                store.pipelines[name] = json_body
+                return 200, {"acknowledged": True}
+            if method == "DELETE":
+                store.pipelines.pop(name)
+                return 200, {"acknowledged": True}
+            if name:
+                return 200, {name: store.pipelines[name]}
+            return 200, dict(store.pipelines)
+
+        index = head
+        op = path[1] if len(path) > 1 else None
+
+        if op is None:
+            if method == "HEAD":
+                return (200 if index in store.indices else 404), None
+            if method == "PUT":
+                with store.lock:
+                    if index in store.indices:
+                        return _error(400, "resource_already_exists_exception",
+                                      f"index [{index}] already exists")
+                    idx = store.index(index)
+                    idx["mappings"] = json_body.get("mappings", {})
+                    idx["settings"] = json_body.get("settings", {})
+                return 200, {"acknowledged": True, "shards_acknowledged": True, "index": index}
+            if method == "DELETE":
+                with store.lock:
+                    del store.indices[index]
+                return 200, {"acknowledged": True}
+            idx = store.indices[index]
+            return 200, {index: {"mappings": idx["mappings"], "settings": idx["settings"]}}
+
+        if op == "_doc":
+            doc_id = path[2] if len(path) > 2 else uuid.uuid4().hex[:20]
+            if method == "GET":
+                _, src = store.indices[index]["docs"][doc_id]
+                return 200, {"_index": index, "_id": doc_id, "found": True, "_source": src}
+            src = json_body
+            pipeline = params.get("pipeline")
+            if pipeline:
+                try:
+                    src = es.run_pipeline(pipeline, src)
+                except KeyError:
+                    return _error(400, "illegal_argument_exception",
+                                  f"pipeline with id [{pipeline}] does not exist")
+                if src is None:
+                    return _error(400, "ingest_processor_exception", "pipeline failed")
+            result = store.put_doc(index, doc_id, src)
+            return (201 if result == "created" else 200), {
+                "_index": index, "_id": doc_id, "result": result, "_version": 1,
+            }
+
+        if op == "_bulk":
+            return self._bulk(index, params, body)
+
+        if op == "_search":
+            return 200, self._search(index, params, json_body)
+
+        if op == "_pit":
+            pit_id = uuid.uuid4().hex
+            snap = store.snapshot(index)
+            with store.lock:
+                store.pits[pit_id] = snap
+            return 200, {"id": pit_id}
+
+        if op == "_count":
+            query = json_body.get("query")
+            n = sum(1 for _, _, _, src in store.snapshot(index) if _matches(src, query))
+            return 200, {"count": n}
+
+        if op == "_refresh":
+            return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+
+        if op == "_mapping":
+            if method == "PUT":
+                props = json_body.get("properties", {})
+                store.indices[index]["mappings"].setdefault("properties", {}).update(props)
+                return 200, {"acknowledged": True}
+            return 200, {index: {"mappings": store.indices[index]["mappings"]}}
+
+        if op == "_settings":
+            idx = store.indices[index]
+            if method == "PUT":
+                settings = json_body.get("index", json_body)
+                idx["settings"].setdefault("index", {}).update(settings)
+                return 200, {"acknowledged": True}
+            return 200, {index: {"settings": idx["settings"]}}
+
+        raise ValueError(f"unsupported endpoint: {method} /{'/'.join(path)}")
+
+    # -----------------------------------------------------
+    # _bulk
+    # -----------------------------------------------------
+    def _bulk(self, default_index, params, body):
+        es = self.standin
+        lines = [l for l in body.split(b"\n") if l.strip()]
+        items = []
+        errors = False
+        i = 0
+
+        while i < len(lines):
+            action = json.loads(lines[i])
+            (op, meta), = action.items()
+            i += 1
+
+            source = None
+            if op != "delete":
+                source = json.loads(lines[i])
+                i += 1
+
+            index = meta.get("_index", default_index)
+            doc_id = meta.get("_id") or uuid.uuid4().hex[:20]
+
+            if es.reject_item():
+                errors = True
+                items.append({op: {"_index": index, "_id": doc_id, "status": 429, "error": {
+                    "type": "es_rejected_execution_exception",
+                    "reason": "rejected execution (stand-in injected)"}}})
+                continue
+
+            if op == "delete":
+                with es.store.lock:
+                    es.store.index(index)["docs"].pop(doc_id, None)
+                items.append({op: {"_index": index, "_id": doc_id, "status": 200, "result": "deleted"}})
+                continue
+
+            pipeline = meta.get("pipeline", params.get("pipeline"))
+            try:
+                if pipeline and pipeline != "_none":
+                    source = es.run_pipeline(pipeline, source)
+            except KeyError:
+                errors = True
+                items.append({op: {"_index": index, "_id": doc_id, "status": 400, "error": {
+                    "type": "illegal_argument_exception",
+                    "reason": f"pipeline with id [{pipeline}] does not exist"}}})
+                continue
+
+            if source is None:
+                errors = True
+                items.append({op: {"_index": index, "_id": doc_id, "status": 400, "error": {
+                    "type": "ingest_processor_exception", "reason": "pipeline failed"}}})
+                continue
+
+            result = es.store.put_doc(index, doc_id, source, create_only=(op == "create"))
+            if result is None:
+                errors = True
+                items.append({op: {"_index": index, "_id": doc_id, "status": 409, "error": {
+                    "type": "version_conflict_engine_exception",
+                    "reason": f"[{doc_id}]: version conflict, document already exists"}}})
+                continue
+            items.append({op: {"_index": index, "_id": doc_id, "result": result,
+                               "status": 201 if result == "created" else 200}})
+
+        return 200, {"took": 1, "errors": errors, "items": items}
+
+    # -----------------------------------------------------
+    # _search / scroll / PIT
+    # -----------------------------------------------------
+    def _search(self, index, params, body):
+        store = self.standin.store
+        size = int(body.get("size", params.get("size", 10)))
+        query = body.get("query")
+
+        pit = body.get("pit")
+        if pit:
+            with store.lock:
+                snap = store.pits[pit["id"]]
+        else:
+            snap = store.snapshot(index)
+
+        hits = [h for h in snap if _matches(h[3], query)]
+
+        sl = body.get("slice")
+        if sl:
+            hits = [h for h in hits
+                    if zlib.crc32(h[2].encode()) % int(sl["max"]) == int(sl["id"])]
+
+        after = body.get("search_after")
+        if after:
+            hits = [h for h in hits if h[0] > after[-1]]
+
+        total = len(hits)
+        aggs = body.get("aggs") or body.get("aggregations")
+
+        if params.get("scroll"):
+            scroll_id = uuid.uuid4().hex
+            with store.lock:
+                store.scrolls[scroll_id] = [hits, 0, size]
+            page = self._scroll_page(scroll_id)
+            page["hits"]["total"] = {"value": total, "relation": "eq"}
+            return page
+
+        resp = self._hits(hits[:size], total)
+        if pit:
+            resp["pit_id"] = pit["id"]
+        if aggs:
+            resp["aggregations"] = {
+                name: self._composite(hits, agg["composite"]) for name, agg in aggs.items()
+            }
+        return resp
+
+    @staticmethod
+    def _composite(hits, comp):
+        """Composite aggregation over `terms` sources (missing values skipped)."""
+        sources = [next(iter(src.items())) for src in comp["sources"]]
+        counts = {}
+        for h in hits:
+            key = tuple(_get_field(h[3], spec["terms"]["field"]) for _, spec in sources)
+            if None not in key:
+                counts[key] = counts.get(key, 0) + 1
+
+        keys = sorted(counts)
+        after = comp.get("after")
+        if after:
+            after_key = tuple(after[name] for name, _ in sources)
+            keys = [k for k in keys if k > after_key]
+        keys = keys[:int(comp.get("size", 10))]
+
+        buckets = [
+            {"key": {name: v for (name, _), v in zip(sources, k)}, "doc_count": counts[k]}
+            for k in keys
+        ]
+        out = {"buckets": buckets}
+        if buckets:
+            out["after_key"] = buckets[-1]["key"]
+        return out
+
+    def _scroll_page(self, scroll_id):
+        store = self.standin.store
+        with store.lock:
+            state = store.scrolls[scroll_id]
+            hits, pos, size = state
+            state[1] = pos + size
+        resp = self._hits(hits[pos:pos + size], len(hits))
+        resp["_scroll_id"] = scroll_id
+        return resp
+
+    @staticmethod
+    def _hits(page, total):
+        return {
+            "took": 1,
+            "timed_out": False,
+            "hits": {
+                "total": {"value": total, "relation": "eq"},
+                "max_score": None,
+                "hits": [
+                    {"_index": idx, "_id": doc_id, "_score": None,
+                     "_source": src, "sort": [seq]}
+                    for seq, idx, doc_id, src in page
+                ],
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Elasticsearch stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--reject-rate", type=float, default=0.0,
+                        help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--item-reject-rate", type=float, default=0.0,
+                        help="fraction of _bulk items rejected with status 429")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    standin = ESStandIn(args.host, args.port, args.latency_ms, args.jitter_ms,
+                        args.reject_rate, args.item_reject_rate, args.seed)
+    standin.start()
+    try:
+        standin.thread.join()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# utils/file_tailer.py
+
+"""
+Incremental reader for growing log files (ingest.py --follow).
+
+Each file's identity (device + inode, plus a hash of its first bytes) and
+the byte offset of the last line handed off for indexing are kept in a
+JSON checkpoint. A poll reads only the bytes appended since that offset,
+in large binary blocks, and returns complete lines only; a partial last
+line stays on disk until its newline arrives.
+
+Reading advances an in-memory cursor only. The caller commits the mark
+that came with each segment once its lines are indexed, then calls save(), so
+a crash replays at most the unflushed tail and never skips lines. Lines
+get a stable id (TailSegment.line_id) so the replayed tail is rejected by
+ES as already present rather than indexed twice.
+
+Rotation (logrotate-style):
+  - the path now has a different inode -> the remainder of the old file is
+    read from a rotated sibling first (`<path>.1` by inode, or
+    `<path>.1.gz` / `<path>.gz` by head hash), then the new file from 0
+  - the file shrank below the saved offset (copytruncate / truncation),
+    or its first bytes changed -> restart at offset 0
+"""
+
+import gzip
+import hashlib
+import json
+import os
+
+HEAD_BYTES = 256
+
+
+def _head_hash(data):
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+class TailSegment:
+    """
+    Lines read from one file, plus the checkpoint mark to commit after
+    indexing. `lines` holds (byte_offset, line) pairs.
+    """
+
+    __slots__ = ("path", "source", "lines", "mark")
+
+    def __init__(self, path, source, lines, mark):
+        self.path = path
+        self.source = source
+        self.lines = lines
+        self.mark = mark
+
+    def line_id(self, line_offset, line):
+        """
+        Stable document id for one line: the same line of the same file
+        always maps to the same id, so a replay after a crash is rejected
+        by ES as a duplicate (op_type create) instead of indexed twice.
+        """
+        key = f"{self.mark['dev']}:{self.mark['inode']}:{line_offset}:{line}"
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+
+
+class FileTailer:
+
+    def __init__(self, checkpoint_path, block_bytes=1 << 20, max_poll_bytes=16 << 20):
+        self.checkpoint_path = checkpoint_path
+        self.block_bytes = block_bytes
+        self.max_poll_bytes = max_poll_bytes
+        self.offsets = {}     # committed (indexed) positions, persisted
+        self.cursors = {}     # read positions, ahead of `offsets` until a flush
+        self.load()
+
+    @classmethod
+    def from_config(cls, cfg):
+        cfg = cfg or {}
+        return cls(
+            checkpoint_path=cfg.get("checkpoint_path", "state/ingest_offsets.json"),
+            block_bytes=int(cfg.get("block_kb", 1024)) * 1024,
+            max_poll_bytes=int(cfg.get("max_poll_mb", 16)) * 1024 * 1024,
+        )
+
+    # -----------------------------------------------------
+    # Checkpoint
+    # -----------------------------------------------------
+    def load(self):
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                self.offsets = json.load(f)
+            self.cursors = dict(self.offsets)
+            print(f"[TAIL] Loaded offsets for {len(self.offsets)} files from {self.checkpoint_path}")
+
+    def save(self):
+        if not self.checkpoint_path:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.offsets, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def commit(self, mark):
+        """Record that every line up to `mark["offset"]` of mark["path"] is indexed."""
+        path = mark["path"]
+        self.offsets[path] = {k: v for k, v in mark.items() if k != "path"}
+
+    # -----------------------------------------------------
+    # Reading
+    # -----------------------------------------------------
+    def _read_lines(self, f, offset, final):
+        """
+        Read complete lines from `f` starting at `offset`, up to
+        max_poll_bytes. Returns ([(line_offset, line), ...], new_offset).
+        With `final`, a trailing line without newline is returned too
+        (rotated file). A line longer than max_poll_bytes is returned
+        truncated to its first max_poll_bytes once its newline is on disk.
+        """
+        f.seek(offset)
+        buf = bytearray()
+        while len(buf) < self.max_poll_bytes:
+            block = f.read(self.block_bytes)
+            if not block:
+                break
+            buf += block
+
+        end = len(buf)
+        at_eof = len(buf) < self.max_poll_bytes
+        if not (final and at_eof):
+            end = buf.rfind(b"\n") + 1
+
+        if end == 0:
+            if at_eof:
+                return [], offset
+            return self._read_long_line(f, offset, buf, final)
+
+        lines = []
+        pos = 0
+        while pos < end:
+            nl = buf.find(b"\n", pos, end)
+            stop = end if nl < 0 else nl
+            line = bytes(buf[pos:stop]).decode("utf-8", errors="ignore").strip()
+            if line:
+                lines.append((offset + pos, line))
+            pos = stop + 1
+
+        return lines, offset + end
+
+    def _read_long_line(self, f, offset, buf, final):
+        """
+        `buf` is a full poll without a newline: skip to the end of the line
+        and return its first max_poll_bytes as one line, so --follow does
+        not stall on it. Waits (returns no lines) until the newline arrives,
+        unless `final`.
+        """
+        pos = offset + len(buf)
+        f.seek(pos)
+        while True:
+            block = f.read(self.block_bytes)
+            if not block:
+                if not final:
+                    return [], offset
+                break
+            nl = block.find(b"\n")
+            if nl >= 0:
+                pos += nl + 1
+                break
+            pos += len(block)
+
+        print(f"[TAIL] Line at offset {offset} is {pos - offset} bytes; "
+              f"truncated to {self.max_poll_bytes}")
+        line = bytes(buf).decode("utf-8", errors="ignore").strip()
+        return ([(offset, line)] if line else []), pos
+
+    def _find_rotated(self, path, saved):
+        """Locate the file `saved` describes after it was rotated away from `path`."""
+        plain = path + ".1"
+        try:
+            st = os.stat(plain)
+            if st.st_ino == saved["inode"] and st.st_dev == saved["dev"]:
+                return plain, open
+        except FileNotFoundError:
+            pass
+
+        for cand in (path + ".1.gz", path + ".gz"):
+            if not os.path.exists(cand):
+                continue
+            try:
+                with gzip.open(cand, "rb") as f:
+                    if _head(f, saved.get("head_len", HEAD_BYTES)) == (saved.get("head"), saved.get("head_len")):
+                        return cand, gzip.open
+            except OSError:
+                continue
+
+        return None, None
+
+    def poll(self, path):
+        """
+        Return the TailSegments with lines appended to `path` since the last
+        committed offset (the rotated remainder first, if the file rotated).
+        """
+        segments = []
+        saved = self.cursors.get(path)
+
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            st = None
+
+        rotated = saved is not None and (
+            st is None or st.st_ino != saved["inode"] or st.st_dev != saved["dev"]
+        )
+
+        if rotated:
+            old, opener = self._find_rotated(path, saved)
+            if old is None:
+                if st is None:
+                    return segments
+                print(f"[TAIL] {path} rotated; old file not found, "
+                      f"lines after offset {saved['offset']} may be lost")
+            else:
+                with opener(old, "rb") as f:
+                    lines, offset = self._read_lines(f, saved["offset"], final=True)
+                    more = bool(f.read(1))
+                if lines:
+                    print(f"[TAIL] {path} rotated; draining {len(lines)} lines from {old}")
+                segments.append(TailSegment(path, old, lines, {**saved, "path": path, "offset": offset}))
+                # Large rotated remainder: finish it over the next polls first
+                if more or st is None:
+                    self.cursors[path] = {k: v for k, v in segments[-1].mark.items() if k != "path"}
+                    return segments
+            saved = None
+
+        if st is None:
+            return segments
+
+        offset = 0 if saved is None else saved["offset"]
+
+        with open(path, "rb") as f:
+            head, head_len = _head(f, HEAD_BYTES)
+
+            if saved is not None:
+                if st.st_size < offset:
+                    print(f"[TAIL] {path} truncated ({st.st_size} < {offset}); restarting at 0")
+                    offset = 0
+                elif saved["head_len"] == HEAD_BYTES and saved["head"] != head:
+                    # Same inode, different first bytes: truncated and rewritten
+                    print(f"[TAIL] {path} was rewritten; restarting at 0")
+                    offset = 0
+                elif st.st_size == offset:
+                    return segments
+
+            lines, new_offset = self._read_lines(f, offset, final=False)
+
+        segments.append(TailSegment(path, path, lines, {
+            "path": path, "inode": st.st_ino, "dev": st.st_dev,
+            "offset": new_offset, "head": head, "head_len": head_len,
+        }))
+        self.cursors[path] = {k: v for k, v in segments[-1].mark.items() if k != "path"}
+        return segments
+
+
+def _head(f, n):
+    """(hash, length) of the first `n` bytes of an open binary file."""
+    f.seek(0)
+    data = f.read(n)
+    return _head_hash(data), len(data)
@@ -1,15 +1,29 @@
 # utils/io_manager.py
 
+import os
+import time
+from contextlib import nullcontext
+
 import yaml
 import pandas as pd
 from elasticsearch import Elasticsearch, helpers
 
+from utils.log_reader import is_log_file, iter_batches
+from utils.metrics import RunMetrics
+from utils.output_index import OutputIndex
+from utils.syslog_parser import SyslogParser
+
 
 class IOManager:
 
-    def __init__(self, config_path="config.yml"):
+    def __init__(self, config_path="config.yml", metrics=None):
         self.config = self.load_config(config_path)
         self.es = None
+        self.output_index = None
+        self.metrics = metrics or RunMetrics("io")
+
+        # ShardFilter for sharded runs (main.py --shard); None = read everything
+        self.shard = None
 
         # Fields that indicate the log is already enriched by ML
         self.ml_fields = [
@@ -54,10 +68,27 @@ class IOManager:
     def _skip_if_processed(self, doc):
         return any(f in doc for f in self.ml_fields)
 
+    def _shard_rows(self, records):
+        """Keep only this shard's records (file / log input are read by every shard)."""
+        if self.shard is None:
+            return records
+        kept = self.shard.filter(records)
+        self.metrics.count("shard_other_rows", len(records) - len(kept))
+        return kept
+
+    def es_input_query(self):
+        """Scroll query for the input index: everything, or this shard's hostnames."""
+        if self.shard is None:
+            return {"match_all": {}}
+        if self.es is None:
+            self.connect_es()
+        return self.shard.es_query(self.es, self.config["elasticsearch"]["input_index"])
+
     # -----------------------------------------------------
     # Read raw logs from Elasticsearch (input_index)
     # -----------------------------------------------------
-    def read_from_es(self):
+    def iter_from_es(self):
+        """Yield unprocessed logs one scroll page at a time."""
         index = self.config["elasticsearch"]["input_index"]
         size = self.config["elasticsearch"]["size"]
         scroll = self.config["elasticsearch"]["scroll_timeout"]
@@ -65,14 +96,15 @@ class IOManager:
         if self.es is None:
             self.connect_es()
 
+        query = self.es_input_query()
         print(f"[IO] Reading from ES index: {index}")
 
-        results = []
+        t0 = time.perf_counter()
         resp = self.es.search(
             index=index,
             scroll=scroll,
             size=size,
-            body={"query": {"match_all": {}}}
+            body={"query": query}
         )
 
         scroll_id = resp["_scroll_id"]
@@ -82,6 +114,7 @@ class IOManager:
             if not hits:
                 break
 
+            page = []
             for h in hits:
                 src = h["_source"]
                 src["_id"] = h["_id"]   # Keep ES ID for reference
@@ -89,10 +122,19 @@ class IOManager:
                 if self._skip_if_processed(src):
                     continue
 
-                results.append(src)
+                page.append(src)
+
+            self.metrics.record("read", time.perf_counter() - t0, len(hits))
+            yield page
 
+            t0 = time.perf_counter()
             resp = self.es.scroll(scroll_id=scroll_id, scroll=scroll)
 
+    def read_from_es(self):
+        results = []
+        for page in self.iter_from_es():
+            results.extend(page)
+
         print(f"[IO] Retrieved {len(results)} unprocessed logs from ES.")
         return results
 
@@ -102,25 +144,99 @@ class IOManager:
     def read_from_csv(self):
         path = self.config["input"]["file"]
         print(f"[IO] Reading from CSV: {path}")
-        df = pd.read_csv(path)
+        with self.metrics.stage("read") as st:
+            df = pd.read_csv(path)
+            st.rows = len(df)
 
-        raw = df.to_dict(orient="records")
+        raw = self._shard_rows(df.to_dict(orient="records"))
         filtered = [r for r in raw if not self._skip_if_processed(r)]
 
         print(f"[IO] Loaded {len(filtered)} fresh logs (skipped {len(raw)-len(filtered)} processed logs).")
         return filtered
 
+    def iter_from_csv(self, chunk_size):
+        path = self.config["input"]["file"]
+        print(f"[IO] Streaming from CSV: {path} ({chunk_size} rows per chunk)")
+
+        reader = pd.read_csv(path, chunksize=chunk_size)
+        while True:
+            t0 = time.perf_counter()
+            chunk = next(reader, None)
+            if chunk is None:
+                break
+            self.metrics.record("read", time.perf_counter() - t0, len(chunk))
+
+            raw = self._shard_rows(chunk.to_dict(orient="records"))
+            yield [r for r in raw if not self._skip_if_processed(r)]
+
+    # -----------------------------------------------------
+    # Read raw syslog files, parsed client-side (no ES round trip)
+    # -----------------------------------------------------
+    def _log_files(self):
+        path = self.config["input"]["log_path"]
+        rotated = self.config["input"].get("include_rotated", False)
+        if os.path.isdir(path):
+            return [os.path.join(path, f) for f in sorted(os.listdir(path))
+                    if is_log_file(f, rotated)]
+        return [path]
+
+    def iter_from_log(self, chunk_size):
+        skipped = 0
+
+        for path in self._log_files():
+            # Year inference relative to the file's mtime, so old and
+            # rotated files (December logs read in January) are not dated
+            # into the future
+            parser = SyslogParser.for_file(path)
+            print(f"[IO] Parsing log file: {path} ({chunk_size} lines per chunk)")
+            batches = iter_batches(path, chunk_size)
+            while True:
+                t0 = time.perf_counter()
+                lines = next(batches, None)
+                if lines is None:
+                    break
+
+                chunk = []
+                for _, doc in parser.parse_lines(lines):
+                    if doc is None:
+                        skipped += 1
+                    else:
+                        chunk.append(parser.to_record(doc))
+                self.metrics.record("read", time.perf_counter() - t0, len(chunk))
+                yield self._shard_rows(chunk)
+
+        if skipped:
+            print(f"[IO] Skipped {skipped} lines the syslog pattern does not match.")
+
+    def read_from_log(self):
+        results = []
+        for chunk in self.iter_from_log(chunk_size=10000):
+            results.extend(chunk)
+
+        print(f"[IO] Parsed {len(results)} logs from {self.config['input']['log_path']}.")
+        return results
+
     # -----------------------------------------------------
     # Write enriched logs to new Elasticsearch index
     # -----------------------------------------------------
-    def write_to_es(self, records):
+    def es_actions(self, records):
+        """
+        Bulk actions for `records` into the output index. Creates the index
+        with its explicit mapping before the first write.
+        """
         index = self.config["elasticsearch"]["output_index"]
 
         if self.es is None:
             self.connect_es()
 
-        print(f"[IO] Writing {len(records)} enriched logs to ES index: {index}")
+        mapping_cfg = self.config["elasticsearch"].get("output_mapping") or {}
+        keep_vectors = False
+        if mapping_cfg.get("manage", True):
+            if self.output_index is None or self.output_index.index != index:
+                self.output_index = OutputIndex.from_config(self.es, index, mapping_cfg)
+            keep_vectors = self.output_index.ensure(records)
 
+        reuse_ids = self.config["elasticsearch"].get("output_reuse_ids", False)
         actions = []
 
         for rec in records:
@@ -129,8 +245,10 @@ class IOManager:
             # Ensure _id is removed (ES rejects it inside _source)
             doc.pop("_id", None)
 
-            # Embedding MUST NOT be sent to ES (skip)
-            doc.pop("embedding", None)
+            # Embeddings only go to an index that maps them as dense_vector
+            vec = doc.pop("embedding", None)
+            if keep_vectors and vec is not None:
+                doc["embedding"] = vec.tolist() if hasattr(vec, "tolist") else list(vec)
 
             # Fix timestamp issues
             ts = doc.get("@timestamp", None)
@@ -138,14 +256,38 @@ class IOManager:
                 doc["@timestamp"] = "1970-01-01T00:00:00Z"   # Fallback valid date
 
 
-            actions.append({
+            action = {
                 "_op_type": "index",
                 "_index": index,
                 "_source": doc
-            })
+            }
+
+            # Reuse the input document id, so a re-run (or a shard re-scoring
+            # a host) overwrites its earlier output instead of duplicating it
+            if reuse_ids and isinstance(rec.get("_id"), str):
+                action["_id"] = rec["_id"]
+
+            actions.append(action)
+
+        return actions
+
+    def write_to_es(self, records):
+        index = self.config["elasticsearch"]["output_index"]
+
+        print(f"[IO] Writing {len(records)} enriched logs to ES index: {index}")
+
+        actions = self.es_actions(records)
+        mapping_cfg = self.config["elasticsearch"].get("output_mapping") or {}
+
+        backfill = (
+            self.output_index is not None
+            and len(actions) >= mapping_cfg.get("backfill_min_docs", 10000)
+        )
 
         try:
-            helpers.bulk(self.es, actions)
+            with self.output_index.bulk_mode() if backfill else nullcontext(), \
+                    self.metrics.stage("write_es", rows=len(actions)):
+                helpers.bulk(self.es, actions)
         except Exception as e:
             from pprint import pprint
             print("\n\n========== ELASTICSEARCH BULK ERROR DETAILS ==========")
@@ -164,7 +306,8 @@ class IOManager:
     def write_to_csv(self, records):
         path = self.config["output"]["file"]
         print(f"[IO] Writing enriched logs to CSV: {path}")
-        pd.DataFrame(records).to_csv(path, index=False)
+        with self.metrics.stage("write_csv", rows=len(records)):
+            pd.DataFrame(records).to_csv(path, index=False)
 
     # -----------------------------------------------------
     # Public read() entrypoint
@@ -176,8 +319,25 @@ class IOManager:
             return self.read_from_es()
         elif t == "file":
             return self.read_from_csv()
+        elif t == "log":
+            return self.read_from_log()
+        else:
+            raise ValueError("Invalid input type. use 'es', 'file' or 'log'")
+
+    # -----------------------------------------------------
+    # Public chunked read entrypoint (bounded memory)
+    # -----------------------------------------------------
+    def iter_read(self, chunk_size=5000):
+        t = self.config["input"]["type"]
+
+        if t == "es":
+            yield from self.iter_from_es()
+        elif t == "file":
+            yield from self.iter_from_csv(chunk_size)
+        elif t == "log":
+            yield from self.iter_from_log(chunk_size)
         else:
-            raise ValueError("Invalid input type. use 'es' or 'file'")
+            raise ValueError("Invalid input type. use 'es', 'file' or 'log'")
 
     # -----------------------------------------------------
     # Public write() entrypoint
@@ -0,0 +1,172 @@
+# utils/log_reader.py
+
+"""
+Streaming line reader for large and compressed log files.
+
+    for line in iter_text_lines("logs/auth.log.2.gz"):
+        ...
+
+- plain files are memory-mapped and scanned for newlines, so a multi-GB
+  file is never copied into Python strings as a whole
+- .gz (and .zst, when the `zstandard` package is installed) are streamed
+  in large binary chunks
+- lines stay bytes until the caller asks for text (iter_text_lines
+  decodes one line at a time, blank lines are skipped before decoding)
+- split_ranges() cuts a plain file into byte ranges that start and end on
+  line boundaries, so several workers can read one file in parallel
+"""
+
+import gzip
+import mmap
+import os
+import re
+
+try:
+    import zstandard
+except ImportError:   # optional; only needed for .zst files
+    zstandard = None
+
+CHUNK_BYTES = 4 << 20
+
+COMPRESSED_EXTS = (".gz", ".zst")
+
+# auth.log, app.txt
+_LOG_NAME_RE = re.compile(r"\.(?:log|txt)$")
+# ... plus auth.log.1, auth.log.2.gz, app.txt.zst
+_ROTATED_NAME_RE = re.compile(r"\.(?:log|txt)(?:\.\d+)?$")
+
+
+def is_compressed(path):
+    return path.endswith(COMPRESSED_EXTS)
+
+
+def is_log_file(name, rotated=False):
+    """
+    True for *.log / *.txt. With `rotated`, also for their numbered
+    rotations and compressed forms of both: only for a one-off backfill,
+    since a rotation holds lines already read from the live file.
+    """
+    if not rotated:
+        return bool(_LOG_NAME_RE.search(name))
+
+    for ext in COMPRESSED_EXTS:
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+            break
+    return bool(_ROTATED_NAME_RE.search(name))
+
+
+def open_binary(path):
+    """Open a plain, gzip or zstd file for binary streaming reads."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError(f"reading {path} requires the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+# -----------------------------------------------------
+# Line iteration
+# -----------------------------------------------------
+def _iter_mmap_lines(path, start, end):
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        end = size if end is None else min(end, size)
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+
+            pos = start
+            while pos < end:
+                nl = mm.find(b"\n", pos, end)
+                stop = end if nl < 0 else nl
+                yield mm[pos:stop]
+                pos = stop + 1
+
+
+def _iter_stream_lines(path, chunk_bytes):
+    with open_binary(path) as f:
+        tail = b""
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            yield from lines
+
+        if tail:
+            yield tail
+
+
+def iter_lines(path, start=0, end=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Yield raw lines (bytes, without the newline). For plain files
+    `start` / `end` restrict reading to a byte range from split_ranges();
+    compressed files are always read whole.
+    """
+    if is_compressed(path):
+        if start or end is not None:
+            raise ValueError(f"byte ranges are not supported for compressed file {path}")
+        yield from _iter_stream_lines(path, chunk_bytes)
+    else:
+        yield from _iter_mmap_lines(path, start, end)
+
+
+def iter_text_lines(path, start=0, end=None, chunk_bytes=CHUNK_BYTES):
+    """Like iter_lines(), decoded one line at a time; blank lines are skipped."""
+    for raw in iter_lines(path, start, end, chunk_bytes):
+        raw = raw.strip()
+        if raw:
+            yield raw.decode("utf-8", errors="ignore")
+
+
+def iter_batches(path, batch_lines, start=0, end=None):
+    """Group iter_text_lines() into lists of at most `batch_lines` lines."""
+    batch = []
+    for line in iter_text_lines(path, start, end):
+        batch.append(line)
+        if len(batch) >= batch_lines:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# -----------------------------------------------------
+# Parallel reads
+# -----------------------------------------------------
+def split_ranges(path, parts, min_bytes=CHUNK_BYTES):
+    """
+    Split a plain file into at most `parts` (start, end) byte ranges, each
+    beginning at a line start and ending after a newline (or at EOF).
+    Compressed files, and files too small to be worth splitting, come back
+    as the single range (0, None).
+    """
+    if is_compressed(path) or parts <= 1:
+        return [(0, None)]
+
+    size = os.path.getsize(path)
+    parts = max(1, min(parts, size // max(1, min_bytes)))
+    if parts <= 1:
+        return [(0, None)]
+
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            f.seek(max(bounds[-1], size * i // parts))
+            f.readline()   # move to the start of the next line
+            pos = f.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+    bounds.append(size)
+
+    return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,298 @@
+# utils/metrics.py
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:   # not available on Windows
+    resource = None
+
+
+def current_rss_mb():
+    """Current process RSS in MB (Linux /proc; None elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+
+
+def peak_rss_mb():
+    """
+    Process high-water RSS in MB (ru_maxrss is KB on Linux, bytes on macOS).
+    This is process-wide: it cannot be attributed to a single stage.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+    return round(rss / 1024, 1)
+
+
+class _Stage:
+    """
+    Aggregated timings for one named stage across all its calls.
+
+    `rss_delta_mb` sums the RSS growth measured across the calls made
+    through RunMetrics.stage(); durations added with record() carry no
+    memory measurement.
+    """
+
+    __slots__ = ("calls", "seconds", "rows", "batch_min", "batch_max", "rss_delta_mb")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.batch_min = None
+        self.batch_max = None
+        self.rss_delta_mb = None
+
+    def add(self, seconds, rows, rss_delta_mb=None):
+        self.calls += 1
+        self.seconds += seconds
+        if rows is not None:
+            self.rows += rows
+            self.batch_min = rows if self.batch_min is None else min(self.batch_min, rows)
+            self.batch_max = rows if self.batch_max is None else max(self.batch_max, rows)
+
+        if rss_delta_mb is not None:
+            self.rss_delta_mb = (self.rss_delta_mb or 0.0) + rss_delta_mb
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.rows += other.rows
+        for attr, fn in (("batch_min", min), ("batch_max", max)):
+            a, b = getattr(self, attr), getattr(other, attr)
+            setattr(self, attr, b if a is None else a if b is None else fn(a, b))
+        if other.rss_delta_mb is not None:
+            self.rss_delta_mb = (self.rss_delta_mb or 0.0) + other.rss_delta_mb
+
+    @classmethod
+    def from_dict(cls, d):
+        st = cls()
+        st.calls = d["calls"]
+        st.seconds = d["seconds"]
+        st.rows = d["rows"]
+        st.batch_min = d.get("batch_size_min")
+        st.batch_max = d.get("batch_size_max")
+        st.rss_delta_mb = d.get("rss_delta_mb")
+        return st
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": round(self.seconds, 6),
+            "rows": self.rows,
+            "rows_per_sec": round(self.rows / self.seconds, 1) if self.seconds > 0 else None,
+            "batch_size_mean": round(self.rows / self.calls, 1) if self.calls else None,
+            "batch_size_min": self.batch_min,
+            "batch_size_max": self.batch_max,
+            "rss_delta_mb": None if self.rss_delta_mb is None else round(self.rss_delta_mb, 1),
+        }
+
+
+class _StageHandle:
+    """Yielded by RunMetrics.stage(); set `.rows` if unknown up front."""
+
+    __slots__ = ("rows",)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+
+class RunMetrics:
+    """
+    Per-stage wall time, throughput, batch sizes and RSS growth for one
+    run, plus the process-wide peak RSS.
+
+    Stages are aggregated by name, so a stage called once per chunk
+    (e.g. "read" per scroll page) reports total time, total rows and the
+    batch-size range. Export with `write_json()` / `write_prometheus()`.
+    """
+
+    PREFIX = "es_nlp"
+
+    def __init__(self, run_name="main"):
+        self.run_name = run_name
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.info = {}
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        handle = _StageHandle(rows)
+        rss0 = current_rss_mb()
+        t0 = time.perf_counter()
+        try:
+            yield handle
+        finally:
+            dt = time.perf_counter() - t0
+            rss1 = current_rss_mb()
+            delta = rss1 - rss0 if rss0 is not None and rss1 is not None else None
+            self.record(name, dt, handle.rows, rss_delta_mb=delta)
+
+    def record(self, name, seconds, rows=None, rss_delta_mb=None):
+        """Add an externally measured duration to stage `name`."""
+        st = self.stages.get(name)
+        if st is None:
+            st = self.stages[name] = _Stage()
+        st.add(seconds, rows, rss_delta_mb)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """Fold another run's stages and counters (e.g. from a worker process) into this one."""
+        for name, st in other.stages.items():
+            self.stages.setdefault(name, _Stage()).merge(st)
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    @classmethod
+    def from_dict(cls, report):
+        """Rebuild a run from a `to_dict()` / `write_json()` report."""
+        m = cls(report.get("run", "main"))
+        m.started = report.get("started_at", m.started)
+        m.info = dict(report.get("info") or {})
+        m.counters = dict(report.get("counters") or {})
+        m.stages = {name: _Stage.from_dict(d) for name, d in (report.get("stages") or {}).items()}
+        return m
+
+    # -----------------------------------------------------
+    # Export
+    # -----------------------------------------------------
+    def to_dict(self):
+        return {
+            "run": self.run_name,
+            "started_at": self.started,
+            "duration_seconds": round(time.perf_counter() - self._t0, 6),
+            "peak_rss_mb": peak_rss_mb(),
+            "info": self.info,
+            "counters": self.counters,
+            "stages": {name: st.to_dict() for name, st in self.stages.items()},
+        }
+
+    def write_json(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print(f"[METRICS] Run report written to {path}")
+
+    def to_prometheus(self):
+        p = self.PREFIX
+        run = self.run_name
+        report = self.to_dict()
+        lines = []
+
+        def escape(value):
+            # Prometheus text format: label values escape \\, " and newlines
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {p}_{name} {help_text}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                lbl = ",".join(f'{k}="{escape(v)}"' for k, v in {"run": run, **labels}.items())
+                lines.append(f"{p}_{name}{{{lbl}}} {value}")
+
+        stages = report["stages"]
+        metric("stage_seconds_total", "counter", "Wall time spent in stage.",
+               [({"stage": s}, d["seconds"]) for s, d in stages.items()])
+        metric("stage_rows_total", "counter", "Rows processed by stage.",
+               [({"stage": s}, d["rows"]) for s, d in stages.items()])
+        metric("stage_calls_total", "counter", "Number of stage invocations (batches).",
+               [({"stage": s}, d["calls"]) for s, d in stages.items()])
+        metric("stage_rows_per_second", "gauge", "Stage throughput.",
+               [({"stage": s}, d["rows_per_sec"]) for s, d in stages.items()])
+        metric("stage_batch_size_max", "gauge", "Largest batch seen by stage.",
+               [({"stage": s}, d["batch_size_max"]) for s, d in stages.items()])
+        metric("stage_rss_growth_bytes", "gauge", "RSS growth across the stage's calls.",
+               [({"stage": s}, int(d["rss_delta_mb"] * 1024 * 1024))
+                for s, d in stages.items() if d["rss_delta_mb"] is not None])
+        metric("events_total", "counter", "Run counters.",
+               [({"counter": c}, v) for c, v in report["counters"].items()])
+        metric("run_duration_seconds", "gauge", "Total run wall time.",
+               [({}, report["duration_seconds"])])
+        if report["peak_rss_mb"] is not None:
+            metric("peak_rss_bytes", "gauge", "Process peak RSS.",
+                   [({}, int(report["peak_rss_mb"] * 1024 * 1024))])
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.to_prometheus())
+        print(f"[METRICS] Prometheus metrics written to {path}")
+
+    def export(self, cfg):
+        """
+        Write `<report_dir>/<run>_report.json` and `<report_dir>/<run>.prom`
+        as configured in the `metrics` config section.
+        """
+        cfg = cfg or {}
+        report_dir = cfg.get("report_dir", "reports")
+        if cfg.get("json", True):
+            self.write_json(os.path.join(report_dir, f"{self.run_name}_report.json"))
+        if cfg.get("prometheus", True):
+            self.write_prometheus(os.path.join(report_dir, f"{self.run_name}.prom"))
+
+    def summary(self):
+        for name, st in self.stages.items():
+            d = st.to_dict()
+            print(f"[METRICS] {name:<12} {d['seconds']:9.3f}s  {d['rows']:>9} rows  "
+                  f"{d['rows_per_sec'] or 0:>11} rows/s  rss {d['rss_delta_mb'] or 0:+.1f} MB")
+
+
+@contextmanager
+def profiled(out_prefix, top=30):
+    """
+    Run the enclosed block under cProfile and tracemalloc, then dump the
+    top CPU hotspots and allocation sites to `<out_prefix>.txt` (and the
+    raw profile to `<out_prefix>.prof` for snakeviz / pstats).
+    """
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+
+    tracemalloc.start(25)
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        prof.dump_stats(out_prefix + ".prof")
+
+        buf = io.StringIO()
+        buf.write("==== CPU hotspots (cumulative) ====\n")
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+        buf.write("\n==== CPU hotspots (self time) ====\n")
+        pstats.Stats(prof, stream=buf).sort_stats("tottime").print_stats(top)
+
+        buf.write(f"\n==== Allocations (traced peak {traced_peak / 1024 / 1024:.1f} MB) ====\n")
+        for stat in snapshot.statistics("lineno")[:top]:
+            buf.write(f"{stat}\n")
+
+        with open(out_prefix + ".txt", "w") as f:
+            f.write(buf.getvalue())
+
+        print(f"[PROFILE] Hotspots written to {out_prefix}.txt")
@@ -0,0 +1,188 @@
+# utils/output_index.py
+
+"""
+Explicit mapping and bulk settings for the enriched output index.
+
+With dynamic mapping, `embedding` (a list of 384 floats) would be mapped
+as a plain float array, so the writer used to drop it. Here the index is
+created up front with:
+
+  - `embedding` as dense_vector, int8 HNSW quantised, cosine similarity,
+    and excluded from `_source` (the quantised HNSW copy is all kNN
+    search needs; the float32 source copy would dominate disk usage)
+  - keyword / date / numeric types for the log and feature columns, and
+    dynamic templates so new feature columns map as keyword / long / float
+    instead of text + keyword pairs
+
+Backfills (large bulk writes) run with refresh disabled and no replicas,
+which are restored afterwards.
+"""
+
+from contextlib import contextmanager
+
+from elasticsearch import BadRequestError
+
+# Known output columns. Feature columns not listed here are picked up by
+# the dynamic templates below.
+BASE_PROPERTIES = {
+    "@timestamp": {"type": "date"},
+    "hostname": {"type": "keyword"},
+    "process": {"type": "keyword"},
+    "raw_message": {"type": "text", "fields": {"keyword": {"type": "keyword", "ignore_above": 2048}}},
+    "clean_message": {"type": "text"},
+    "template": {"type": "keyword"},
+    "username": {"type": "keyword"},
+    "src_ip": {"type": "ip", "ignore_malformed": True},
+    "iso_score": {"type": "float"},
+    "lgbm_score": {"type": "float"},
+    "knn_distance": {"type": "float"},
+    "knn_score": {"type": "float"},
+    "fusion_score": {"type": "float"},
+    "adwin_flag": {"type": "byte"},
+    "is_anomaly": {"type": "byte"},
+    "label": {"type": "byte"},
+}
+
+DYNAMIC_TEMPLATES = [
+    {"strings_as_keywords": {
+        "match_mapping_type": "string",
+        "mapping": {"type": "keyword", "ignore_above": 1024},
+    }},
+    {"integers": {"match_mapping_type": "long", "mapping": {"type": "long"}}},
+    {"floats": {"match_mapping_type": "double", "mapping": {"type": "float"}}},
+]
+
+
+class OutputIndex:
+
+    def __init__(self, es, index, embedding_dims="auto", similarity="cosine",
+                 index_options="int8_hnsw", exclude_embedding_from_source=True,
+                 shards=1, replicas=1, refresh_interval="1s", backfill=True):
+        self.es = es
+        self.index = index
+        self.embedding_dims = embedding_dims
+        self.similarity = similarity
+        self.index_options = index_options
+        self.exclude_embedding_from_source = exclude_embedding_from_source
+        self.shards = shards
+        self.replicas = replicas
+        self.refresh_interval = refresh_interval
+        self.backfill = backfill
+
+        # None until ensure(): whether `embedding` may be written to this index
+        self.vectors_enabled = None
+
+    @classmethod
+    def from_config(cls, es, index, cfg):
+        """Build from the `elasticsearch.output_mapping` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            es, index,
+            embedding_dims=cfg.get("embedding_dims", "auto"),
+            similarity=cfg.get("similarity", "cosine"),
+            index_options=cfg.get("index_options", "int8_hnsw"),
+            exclude_embedding_from_source=cfg.get("exclude_embedding_from_source", True),
+            shards=cfg.get("shards", 1),
+            replicas=cfg.get("replicas", 1),
+            refresh_interval=cfg.get("refresh_interval", "1s"),
+            backfill=cfg.get("backfill", True),
+        )
+
+    # -----------------------------------------------------
+    # Mapping
+    # -----------------------------------------------------
+    def build_mapping(self, dims):
+        properties = dict(BASE_PROPERTIES)
+        properties["embedding"] = {
+            "type": "dense_vector",
+            "dims": int(dims),
+            "index": True,
+            "similarity": self.similarity,
+            "index_options": {"type": self.index_options},
+        }
+
+        mapping = {
+            "dynamic_templates": DYNAMIC_TEMPLATES,
+            "properties": properties,
+        }
+        if self.exclude_embedding_from_source:
+            mapping["_source"] = {"excludes": ["embedding"]}
+        return mapping
+
+    def build_settings(self):
+        return {
+            "number_of_shards": self.shards,
+            "number_of_replicas": self.replicas,
+            "refresh_interval": self.refresh_interval,
+        }
+
+    def _dims(self, records):
+        if self.embedding_dims != "auto":
+            return int(self.embedding_dims)
+        for rec in records:
+            vec = rec.get("embedding")
+            if vec is not None and len(vec):
+                return len(vec)
+        return None
+
+    def ensure(self, records):
+        """
+        Create the index with the explicit mapping if it does not exist yet.
+        Returns True if embeddings can be written, i.e. `embedding` is a
+        dense_vector in the (new or existing) index.
+        """
+        if self.vectors_enabled is not None:
+            return self.vectors_enabled
+
+        if self.es.indices.exists(index=self.index):
+            mapping = self.es.indices.get_mapping(index=self.index)
+            props = mapping[self.index]["mappings"].get("properties", {})
+            self.vectors_enabled = props.get("embedding", {}).get("type") == "dense_vector"
+            if not self.vectors_enabled:
+                print(f"[IO] Index {self.index} has no dense_vector mapping for 'embedding' "
+                      f"(created before explicit mappings?) → embeddings are not written.")
+            return self.vectors_enabled
+
+        dims = self._dims(records)
+        if dims is None:
+            # No vectors to size the field from: map the rest, write no embeddings
+            mapping = self.build_mapping(1)
+            del mapping["properties"]["embedding"]
+            mapping.pop("_source", None)
+        else:
+            mapping = self.build_mapping(dims)
+
+        print(f"[IO] Creating index {self.index} with explicit mapping "
+              f"(embedding: {f'{dims}-d {self.index_options}' if dims else 'none'})")
+        try:
+            self.es.indices.create(index=self.index, mappings=mapping, settings=self.build_settings())
+        except BadRequestError as e:
+            if e.error != "resource_already_exists_exception":
+                raise
+            # Another writer created it first: use whatever mapping it has
+            return self.ensure(records)
+
+        self.vectors_enabled = dims is not None
+        return self.vectors_enabled
+
+    # -----------------------------------------------------
+    # Bulk-friendly settings for backfills
+    # -----------------------------------------------------
+    @contextmanager
+    def bulk_mode(self):
+        """Disable refresh and replicas for the duration of a large write."""
+        if not self.backfill:
+            yield
+            return
+
+        self.es.indices.put_settings(index=self.index, settings={
+            "index": {"refresh_interval": "-1", "number_of_replicas": 0}
+        })
+        try:
+            yield
+        finally:
+            self.es.indices.put_settings(index=self.index, settings={
+                "index": {"refresh_interval": self.refresh_interval,
+                          "number_of_replicas": self.replicas}
+            })
+            self.es.indices.refresh(index=self.index)
@@ -0,0 +1,234 @@
+# utils/process_pool.py
+
+"""
+Process-pool runner for the CPU-bound, per-record stages of main.py:
+clean_message, the stateless features (time, statistical, per-line UEBA
+regexes) and, with processing.entity_features, LogEntityExtractor.extract
+(regex path).
+
+These are pure Python and hold the GIL, so threads do not help. The
+runner splits raw records into chunks and ships only the four fields the
+stages read to worker processes. Each worker builds its
+LogEntityExtractor once, in the pool initializer. Results come back as
+one typed array per column (ColumnBatch) rather than a list of pickled
+dicts.
+
+Cross-record state (windowed UEBA, sketches) and the embedder stay in the
+parent, which applies them in input order.
+
+With workers <= 1 the same chunk function runs in-process, so both paths
+produce identical features.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from feature.feature_builder import build_stateless_features
+from feature.registry import FeaturePlan
+from nlp.normalize import clean_message
+
+# Fields the per-record stages read from a raw log
+_INPUT_FIELDS = ("@timestamp", "hostname", "process")
+
+_worker_extractor = None
+
+
+# -----------------------------------------------------
+# Columnar encoding
+# -----------------------------------------------------
+class ColumnBatch:
+    """
+    Column name -> array for one chunk. bool / int / float columns are
+    numpy arrays (None kept via a sentinel or NaN); everything else is a
+    plain list. `to_rows()` restores the original Python values (a float
+    column holding both None and NaN stays a list, so neither turns into
+    the other).
+    """
+
+    # kind: "bool" int8 (-1 = None) | "int" int64 | "int?" float64 (NaN = None)
+    #       "float" float64 | "float?" float64 (NaN = None) | "obj" list
+    def __init__(self, columns=None, kinds=None, length=0):
+        self.columns = columns or {}
+        self.kinds = kinds or {}
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    @classmethod
+    def from_rows(cls, rows):
+        names = list(dict.fromkeys(k for row in rows for k in row))
+
+        batch = cls(length=len(rows))
+        for name in names:
+            values = [row.get(name) for row in rows]
+            batch.columns[name], batch.kinds[name] = _encode(values)
+        return batch
+
+    @classmethod
+    def concat(cls, batches):
+        out = cls(length=sum(len(b) for b in batches))
+        names = []
+        for b in batches:
+            names += [n for n in b.columns if n not in names]
+
+        for name in names:
+            kinds = {b.kinds.get(name) for b in batches}
+            if len(kinds) == 1 and None not in kinds:
+                parts = [b.columns[name] for b in batches]
+                kind = kinds.pop()
+                out.columns[name] = np.concatenate(parts) if kind != "obj" else sum(parts, [])
+                out.kinds[name] = kind
+            else:
+                # Kinds differ across chunks (e.g. all-None in one): re-encode from values
+                values = []
+                for b in batches:
+                    values += b.values(name) if name in b.columns else [None] * len(b)
+                out.columns[name], out.kinds[name] = _encode(values)
+        return out
+
+    def values(self, name):
+        col = self.columns[name]
+        kind = self.kinds[name]
+        if kind == "obj":
+            return list(col)
+        if kind == "bool":
+            return [None if v < 0 else bool(v) for v in col.tolist()]
+        if kind == "int":
+            return col.tolist()
+        if kind == "int?":
+            return [None if v != v else int(v) for v in col.tolist()]
+        if kind == "float":
+            return col.tolist()
+        return [None if v != v else v for v in col.tolist()]
+
+    def to_rows(self):
+        names = list(self.columns)
+        cols = [self.values(n) for n in names]
+        return [dict(zip(names, vals)) for vals in zip(*cols)] if names else [{} for _ in range(self.length)]
+
+
+def _encode(values):
+    present = [v for v in values if v is not None]
+    has_none = len(present) != len(values)
+
+    if present and all(isinstance(v, (bool, np.bool_)) for v in present):
+        return np.array([-1 if v is None else int(v) for v in values], dtype=np.int8), "bool"
+
+    if present and all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in present):
+        if not has_none:
+            return np.array(values, dtype=np.int64), "int"
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64), "int?"
+
+    if present and all(isinstance(v, (float, np.floating)) for v in present):
+        if not has_none:
+            return np.array(values, dtype=np.float64), "float"
+        if not any(v != v for v in present):
+            return np.array([np.nan if v is None else v for v in values], dtype=np.float64), "float?"
+
+    return list(values), "obj"
+
+
+# -----------------------------------------------------
+# Per-chunk work (runs in the workers, or inline)
+# -----------------------------------------------------
+def _init_worker(entity_features):
+    global _worker_extractor
+    _worker_extractor = None
+    if entity_features:
+        from nlp.entities import LogEntityExtractor
+        _worker_extractor = LogEntityExtractor(ml_model=None)
+
+
+def _prepare_chunk(messages, fields, groups=None):
+    """
+    clean_message + stateless features for one chunk -> ColumnBatch.
+    `groups` are FeaturePlan names (None = all feature groups).
+    """
+    plan = FeaturePlan(groups) if groups is not None else None
+
+    rows = []
+    for msg, (ts, host, proc) in zip(messages, fields):
+        clean = clean_message(msg)
+        record = {
+            "@timestamp": ts,
+            "hostname": host,
+            "process": proc,
+            "raw_message": msg,
+            "clean_message": clean,
+        }
+        feats = build_stateless_features(record, extractor=_worker_extractor, plan=plan)
+        rows.append({"clean_message": clean, **feats})
+
+    return ColumnBatch.from_rows(rows)
+
+
+def _prepare_task(task):
+    return _prepare_chunk(*task)
+
+
+class StageRunner:
+
+    def __init__(self, workers=0, chunk_size=2000, entity_features=False, start_method="spawn"):
+        self.workers = int(workers or 0)
+        self.chunk_size = int(chunk_size)
+        self.entity_features = entity_features
+        self.start_method = start_method
+        self.pool = None
+
+        if self.workers <= 1:
+            _init_worker(entity_features)
+
+    @classmethod
+    def from_config(cls, cfg):
+        """Build from the `processing` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            workers=cfg.get("workers", 0),
+            chunk_size=cfg.get("chunk_size", 2000),
+            entity_features=cfg.get("entity_features", False),
+            start_method=cfg.get("start_method", "spawn"),
+        )
+
+    def _pool(self):
+        if self.pool is None:
+            # "spawn" by default: forking a parent that already holds torch
+            # thread pools (the embedder) can deadlock the children
+            ctx = multiprocessing.get_context(self.start_method)
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(self.entity_features,),
+            )
+            print(f"[POOL] Started {self.workers} {self.start_method} workers")
+        return self.pool
+
+    def run(self, raw_logs, plan=None):
+        """
+        clean_message + stateless features for `raw_logs`, in input order.
+        Returns a ColumnBatch with a `clean_message` column plus one
+        column per feature. `plan` (a FeaturePlan) limits the feature
+        groups computed.
+        """
+        messages = [str(r.get("message", r.get("raw_message", ""))) for r in raw_logs]
+        fields = [tuple(r.get(f, "") for f in _INPUT_FIELDS) for r in raw_logs]
+        groups = tuple(sorted(plan.names)) if plan is not None else None
+
+        if self.workers <= 1 or len(raw_logs) <= self.chunk_size:
+            if self.workers > 1:
+                return self._pool().submit(_prepare_chunk, messages, fields, groups).result()
+            return _prepare_chunk(messages, fields, groups)
+
+        tasks = [
+            (messages[i:i + self.chunk_size], fields[i:i + self.chunk_size], groups)
+            for i in range(0, len(raw_logs), self.chunk_size)
+        ]
+        return ColumnBatch.concat(list(self._pool().map(_prepare_task, tasks)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
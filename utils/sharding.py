@@ -0,0 +1,148 @@
+# utils/sharding.py
+
+"""
+Hostname partitioning for sharded runs (main.py --shard i --num-shards N).
+
+Every record belongs to exactly one shard, chosen by a consistent-hash
+ring over its `hostname`. All logs of one host are therefore scored by
+the same worker, in order, and that worker's UEBA state, sketches and
+ADWIN see the host's full history. Shards can run as processes on one
+machine or on separate nodes: the ring only depends on the shard count
+and a stable hash (blake2b), not on the process.
+
+- ES input: the shard's hostnames are looked up with a composite terms
+  aggregation, and the scroll query is a `terms` filter on them
+- file / log input: every shard reads the input and keeps its own rows
+
+Per-shard state and output paths get a `.shard<i>of<N>` suffix.
+
+user / src_ip windows (ueba, sketches) only see a shard's own hosts, so
+main.py refuses sharded runs whose models read them unless
+sharding.allow_split_entity_state is set (see split_entity_features).
+"""
+
+import bisect
+import hashlib
+import os
+
+# Stay under the default index.max_terms_count (65536) per terms clause
+MAX_TERMS = 65536
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring with `vnodes` points per shard. Changing the
+    shard count moves only ~1/N of the keys.
+    """
+
+    def __init__(self, num_shards, vnodes=256):
+        if num_shards < 1:
+            raise ValueError("num_shards must be >= 1")
+
+        points = sorted(
+            (_hash(f"shard-{s}#{v}"), s)
+            for s in range(num_shards)
+            for v in range(vnodes)
+        )
+        self.num_shards = num_shards
+        self._points = [p for p, _ in points]
+        self._owners = [s for _, s in points]
+
+    def shard_of(self, key):
+        i = bisect.bisect_right(self._points, _hash(key)) % len(self._points)
+        return self._owners[i]
+
+
+def _host_key(value):
+    """Hostname as a ring key; missing values (None, NaN, "") share one key."""
+    return value if isinstance(value, str) else ""
+
+
+class ShardFilter:
+    """Which records shard `shard` of `num_shards` owns."""
+
+    def __init__(self, shard, num_shards, field="hostname", es_field="hostname.keyword",
+                 vnodes=256, discovery_page=10000):
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"shard must be in [0, {num_shards}), got {shard}")
+
+        self.shard = shard
+        self.num_shards = num_shards
+        self.field = field
+        self.es_field = es_field
+        self.discovery_page = discovery_page
+        self.ring = HashRing(num_shards, vnodes)
+
+    @classmethod
+    def from_config(cls, cfg, shard, num_shards):
+        """Build from the `sharding` section of config.yml."""
+        cfg = cfg or {}
+        return cls(
+            shard, num_shards,
+            field=cfg.get("field", "hostname"),
+            es_field=cfg.get("es_field", "hostname.keyword"),
+            vnodes=cfg.get("vnodes", 256),
+            discovery_page=cfg.get("discovery_page", 10000),
+        )
+
+    @property
+    def suffix(self):
+        return f"shard{self.shard}of{self.num_shards}"
+
+    def shard_path(self, path):
+        """state/ueba_state.json -> state/ueba_state.shard0of4.json"""
+        root, ext = os.path.splitext(path)
+        return f"{root}.{self.suffix}{ext}"
+
+    def owns_host(self, host):
+        return self.ring.shard_of(_host_key(host)) == self.shard
+
+    def owns(self, record):
+        return self.owns_host(record.get(self.field))
+
+    def filter(self, records):
+        return [r for r in records if self.owns(r)]
+
+    # -----------------------------------------------------
+    # Elasticsearch
+    # -----------------------------------------------------
+    def _hostnames(self, es, index):
+        """All distinct hostnames in `index`, via a paged composite aggregation."""
+        hosts = []
+        after = None
+        while True:
+            comp = {
+                "size": self.discovery_page,
+                "sources": [{"host": {"terms": {"field": self.es_field}}}],
+            }
+            if after:
+                comp["after"] = after
+
+            resp = es.search(index=index, size=0, aggs={"hosts": {"composite": comp}})
+            agg = resp["aggregations"]["hosts"]
+            hosts += [b["key"]["host"] for b in agg["buckets"]]
+
+            after = agg.get("after_key")
+            if not agg["buckets"] or not after:
+                return hosts
+
+    def es_query(self, es, index):
+        """Query matching only this shard's documents in `index`."""
+        owned = [h for h in self._hostnames(es, index) if self.owns_host(h)]
+
+        should = [
+            {"terms": {self.es_field: owned[i:i + MAX_TERMS]}}
+            for i in range(0, len(owned), MAX_TERMS)
+        ]
+        # Docs without a hostname belong to the shard owning the empty key
+        if self.owns_host(""):
+            should.append({"bool": {"must_not": {"exists": {"field": self.es_field}}}})
+
+        print(f"[SHARD] {self.suffix}: {len(owned)} hostnames in {index}")
+        if not should:
+            return {"bool": {"must_not": {"match_all": {}}}}
+        return {"bool": {"should": should, "minimum_should_match": 1}}
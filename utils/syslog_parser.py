@@ -0,0 +1,289 @@
+# utils/syslog_parser.py
+
+"""
+Client-side equivalent of es_patterns/syslog_pipeline.json.
+
+Produces the same fields as the ES ingest pipeline (grok -> kv -> painless
+flatten -> date -> set ingested_at), so ingest.py can bulk-index pre-parsed
+docs and main.py can read log files directly, without spending ES ingest
+node CPU on every line.
+
+Pipeline quirks reproduced on purpose (pipeline_compat=True):
+  - a line the grok pattern does not match fails the whole pipeline
+    (parse() returns None; ES rejects the document)
+  - kv stops at the first space-separated token without "=", keeping the
+    pairs before it (ignore_failure does not roll back), and the flattened
+    pairs overwrite root fields of the same name
+  - the date format "MMM dd HH:mm:ss" needs a two-digit day, so syslog's
+    space-padded days ("Nov  3") get no @timestamp, and the year is the
+    current UTC year
+
+With pipeline_compat=False (the default) the timestamp parser also accepts
+space-padded days and infers the year so that dates from late December
+read in January land in the previous year.
+
+Verify against a live cluster field-for-field:
+
+    python -m utils.syslog_parser --verify logs/auth.log --es-url http://localhost:9200
+"""
+
+import argparse
+import json
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+# -----------------------------------------------------
+# Grok pattern, expanded from the standard grok definitions
+# -----------------------------------------------------
+_MONTH = (r"\b(?:[Jj]an(?:uary|uar)?|[Ff]eb(?:ruary|ruar)?|[Mm](?:a|ä)?r(?:ch|z)?|[Aa]pr(?:il)?|"
+          r"[Mm]a(?:y|i)?|[Jj]un(?:e|i)?|[Jj]ul(?:y|i)?|[Aa]ug(?:ust)?|[Ss]ep(?:tember)?|"
+          r"[Oo](?:c|k)?t(?:ober)?|[Nn]ov(?:ember)?|[Dd]e(?:c|z)(?:ember)?)\b")
+_MONTHDAY = r"(?:(?:0[1-9])|(?:[12][0-9])|(?:3[01])|[1-9])"
+# "(?!<[0-9])" is how the upstream TIME pattern is written; kept verbatim
+_TIME = (r"(?!<[0-9])(?:2[0123]|[01]?[0-9]):(?:[0-5][0-9])"
+         r"(?::(?:(?:[0-5]?[0-9]|60)(?:[:.,][0-9]+)?))(?![0-9])")
+_SYSLOGTIMESTAMP = rf"{_MONTH} +{_MONTHDAY} {_TIME}"
+_HOSTNAME = (r"\b(?:[0-9A-Za-z][0-9A-Za-z-]{0,62})"
+             r"(?:\.(?:[0-9A-Za-z][0-9A-Za-z-]{0,62}))*(?:\.?|\b)")
+_NUMBER = r"(?<![0-9.+-])(?>[+-]?(?:(?:[0-9]+(?:\.[0-9]+)?)|(?:\.[0-9]+)))"
+
+GROK_RE = re.compile(
+    rf"(?P<timestamp>{_SYSLOGTIMESTAMP}) (?P<hostname>{_HOSTNAME}) "
+    rf"(?P<process>.*?)(?:\[(?P<pid>{_NUMBER})\])?: (?P<message>.*)"
+)
+
+# kv processor: strip_brackets removes one leading / trailing bracket or quote
+_STRIP_BRACKETS_RE = re.compile(r"(^[(\[<\"'])|([\])>\"']$)")
+_TRIM = " \t"
+
+# date processor: "MMM dd HH:mm:ss" (strict) and the syslog space-padded form
+_DATE_STRICT_RE = re.compile(r"^([A-Z][a-z]{2}) (\d{2}) (\d{2}):(\d{2}):(\d{2})$")
+_DATE_LOOSE_RE = re.compile(r"^([A-Z][a-z]{2}) +(\d{1,2}) (\d{2}):(\d{2}):(\d{2})$")
+_MONTHS = {m: i for i, m in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1)}
+
+
+def _iso_millis(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}Z"
+
+
+def _kv(message):
+    """
+    Mirror the kv processor (field_split " ", value_split "="): returns the
+    pairs parsed before the first invalid token. Keys with dots nest.
+    """
+    out = {}
+    if not message or "=" not in message:
+        return out
+
+    # Java String.split(" ") drops trailing empty strings
+    parts = message.split(" ")
+    while parts and parts[-1] == "":
+        parts.pop()
+
+    for part in parts:
+        if "=" not in part:
+            break
+        key, value = part.split("=", 1)
+        key = key.strip(_TRIM)
+        if not key or key.startswith(".") or key.endswith("."):
+            break
+        value = _STRIP_BRACKETS_RE.sub("", value).strip(_TRIM)
+
+        cur = out
+        *parents, leaf = key.split(".")
+        ok = True
+        for p in parents:
+            nxt = cur.setdefault(p, {})
+            if not isinstance(nxt, dict):
+                ok = False
+                break
+            cur = nxt
+        if not ok or isinstance(cur.get(leaf), dict):
+            break
+
+        if leaf in cur:
+            prev = cur[leaf]
+            cur[leaf] = (prev if isinstance(prev, list) else [prev]) + [value]
+        else:
+            cur[leaf] = value
+
+    return out
+
+
+class SyslogParser:
+
+    def __init__(self, pipeline_compat=False, reference_time=None):
+        """
+        `reference_time` (aware datetime) anchors year inference; defaults
+        to now. Set it to a file's mtime when parsing old rotated logs.
+        """
+        self.pipeline_compat = pipeline_compat
+        self.reference_time = reference_time
+
+    @classmethod
+    def for_file(cls, path, pipeline_compat=False):
+        """Parser whose year inference is anchored to `path`'s mtime."""
+        mtime = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+        return cls(pipeline_compat=pipeline_compat, reference_time=mtime)
+
+    # -----------------------------------------------------
+    # Timestamp
+    # -----------------------------------------------------
+    def _now(self):
+        return self.reference_time or datetime.now(timezone.utc)
+
+    def parse_timestamp(self, ts):
+        """Syslog timestamp -> ES-style ISO string, or None if it would fail."""
+        now = self._now()
+        return _parse_ts_cached(ts, self.pipeline_compat, now.year, now.month, now.day)
+
+    # -----------------------------------------------------
+    # Full line
+    # -----------------------------------------------------
+    def parse(self, raw_log, ingested_at=None):
+        """
+        Parse one raw line into the document the ES pipeline would index,
+        or None if the pipeline would reject it.
+        """
+        m = GROK_RE.search(raw_log)
+        if m is None:
+            return None
+
+        doc = {"raw_log": raw_log}
+        for name, value in m.groupdict().items():
+            if value is not None:
+                doc[name] = value
+
+        # kv -> flatten into root (overwrites same-named fields)
+        doc.update(_kv(doc.get("message")))
+
+        ts = doc.get("timestamp")
+        if isinstance(ts, str):
+            parsed = self.parse_timestamp(ts)
+            if parsed is not None:
+                doc["@timestamp"] = parsed
+
+        if ingested_at is None:
+            ingested_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        doc["ingested_at"] = ingested_at
+
+        return doc
+
+    def parse_lines(self, lines):
+        """Yield (line, doc_or_None) for an iterable of raw lines."""
+        ingested_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line, self.parse(line, ingested_at)
+
+    def to_record(self, doc):
+        """A parsed doc in the shape IOManager returns for ES input."""
+        rec = dict(doc)
+        rec.setdefault("_id", None)
+        return rec
+
+    def pipeline_processor(self, source):
+        """Callable for ESStandIn.register_processor (?pipeline=syslog_pipeline)."""
+        raw = source.get("raw_log")
+        if not isinstance(raw, str):
+            return source
+        doc = self.parse(raw)
+        if doc is None:
+            return None
+        return {**source, **doc}
+
+
+@lru_cache(maxsize=65536)
+def _parse_ts_cached(ts, compat, ref_year, ref_month, ref_day):
+    # Log lines arrive many per second, so the same string repeats a lot
+    m = (_DATE_STRICT_RE if compat else _DATE_LOOSE_RE).match(ts)
+    if m is None:
+        return None
+
+    mon = _MONTHS.get(m.group(1))
+    if mon is None:
+        return None
+
+    day, hh, mm, ss = (int(g) for g in m.groups()[1:])
+    year = ref_year
+
+    if not compat:
+        # A date more than a day ahead of the reference is from last year
+        limit = date(ref_year, ref_month, ref_day) + timedelta(days=1)
+        if limit.year == ref_year and (mon, day) > (limit.month, limit.day):
+            year -= 1
+
+    try:
+        dt = datetime(year, mon, day, hh, mm, ss, tzinfo=timezone.utc)
+    except ValueError:
+        return None   # e.g. Feb 29 outside a leap year: the date processor fails too
+
+    return _iso_millis(dt)
+
+
+# -----------------------------------------------------
+# Field-for-field verification against the ES pipeline
+# -----------------------------------------------------
+def verify(lines, es_url, pipeline_file="es_patterns/syslog_pipeline.json", batch=200):
+    """
+    Run `lines` through POST _ingest/pipeline/_simulate and through
+    SyslogParser(pipeline_compat=True); return (checked, mismatches).
+    `ingested_at` is excluded since it is a wall-clock timestamp.
+    """
+    import requests
+
+    with open(pipeline_file) as f:
+        pipeline = json.load(f)
+
+    parser = SyslogParser(pipeline_compat=True)
+    mismatches = []
+    checked = 0
+
+    for i in range(0, len(lines), batch):
+        chunk = lines[i:i + batch]
+        resp = requests.post(
+            f"{es_url}/_ingest/pipeline/_simulate",
+            json={"pipeline": pipeline, "docs": [{"_source": {"raw_log": l}} for l in chunk]},
+        )
+        resp.raise_for_status()
+
+        for line, result in zip(chunk, resp.json()["docs"]):
+            checked += 1
+            expected = None if "error" in result else result["doc"]["_source"]
+            got = parser.parse(line)
+
+            if expected is not None:
+                expected.pop("ingested_at", None)
+            if got is not None:
+                got.pop("ingested_at", None)
+
+            if expected != got:
+                mismatches.append({"line": line, "pipeline": expected, "parser": got})
+
+    return checked, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Client-side syslog parser")
+    parser.add_argument("--verify", metavar="LOGFILE", required=True,
+                        help="compare against the ES pipeline via _simulate")
+    parser.add_argument("--es-url", default="http://localhost:9200")
+    parser.add_argument("--pipeline-file", default="es_patterns/syslog_pipeline.json")
+    args = parser.parse_args()
+
+    with open(args.verify, "r", errors="ignore") as f:
+        lines = [l.strip() for l in f if l.strip()]
+
+    checked, mismatches = verify(lines, args.es_url, args.pipeline_file)
+
+    for mm in mismatches[:20]:
+        print(json.dumps(mm, indent=2))
+    print(f"[VERIFY] {checked} lines checked, {len(mismatches)} mismatches")
+
+
+if __name__ == "__main__":
+    main()